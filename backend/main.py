@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union, Tuple
+from typing import List, Optional, Dict, Any, Union, Tuple, Callable
 import numpy as np
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
@@ -13,14 +13,34 @@ from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from sklearn.linear_model import LinearRegression, Ridge, Lasso, LogisticRegression
 from sklearn.preprocessing import PolynomialFeatures, LabelEncoder
 from sklearn.pipeline import make_pipeline
+from sklearn.model_selection import KFold
+from sklearn.calibration import CalibratedClassifierCV
 from sklearn.metrics import mean_squared_error, confusion_matrix, classification_report, roc_auc_score, roc_curve
 import scipy.stats as stats
+from scipy import sparse
 from statsmodels.stats.outliers_influence import variance_inflation_factor
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+import openai as openai_sdk
+import httpx
+import random
 import os
+import sys
 from dotenv import load_dotenv
 import json
 import re
+import asyncio
+import time
+import uuid
+import hashlib
+import marshal
+import base64
+import copy
+import threading
+import contextvars
+import tempfile
+import stat
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Load environment variables from .env.local
 load_dotenv(".env.local")
@@ -44,6 +64,259 @@ except Exception as e:
     print(f"✗ OpenAI API key validation failed: {str(e)}")
     has_valid_openai_key = False
 
+# Async LLM client shared by every AI endpoint
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")            # "openai" or "stub"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))            # seconds per attempt
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.5"))  # seconds the stub provider waits per call
+
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "300"))  # request starts per minute, 0 disables
+
+class LLMError(Exception):
+    """Raised when an LLM call fails after all retries"""
+
+class AsyncRateLimiter:
+    """Token bucket that spaces out request starts to `rate_per_minute`, allowing short bursts"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 6)))  # Up to ten seconds' worth at once
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class StubLLMProvider:
+    """Offline provider that answers after a fixed delay, for load testing without OpenAI"""
+
+    def __init__(self, latency: float = LLM_STUB_LATENCY):
+        self.latency = latency
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        prompt = " ".join(m.get("content", "") for m in messages)
+        content = f"[stub:{model}] Received a {len(prompt)} character prompt."
+        return {
+            "content": content,
+            "model": model,
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        }
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, **kwargs):
+        result = await self.complete(messages, model)
+        for word in result["content"].split(" "):
+            await asyncio.sleep(0.01)
+            yield {"type": "token", "content": word + " "}
+        yield {"type": "usage", "usage": result["usage"]}
+
+class OpenAILLMProvider:
+    """OpenAI chat completions over one pooled async HTTP client"""
+
+    def __init__(self, api_key: str, max_connections: int):
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,  # Retries are handled by LLMClient with jittered backoff
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        )
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        response = await self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        usage = response.usage
+        return {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0
+            }
+        }
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, **kwargs):
+        stream = await self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {"type": "token", "content": chunk.choices[0].delta.content}
+                if chunk.usage:
+                    yield {"type": "usage", "usage": {"prompt_tokens": chunk.usage.prompt_tokens,
+                                                      "completion_tokens": chunk.usage.completion_tokens}}
+        finally:
+            # Closing the response tells OpenAI to stop generating
+            await stream.close()
+
+class LLMClient:
+    """Async LLM access with a concurrency cap, per-call timeouts, retries and metrics.
+
+    Every attempt takes a token from a global rate limiter and waits on a shared semaphore,
+    so no more than `max_concurrency` requests are in flight across all endpoints. Timeouts, rate limits, connection errors and 5xx
+    responses are retried with exponential backoff and full jitter.
+    """
+
+    RETRYABLE_ERRORS = (
+        asyncio.TimeoutError,
+        openai_sdk.APITimeoutError,
+        openai_sdk.APIConnectionError,
+        openai_sdk.RateLimitError,
+        openai_sdk.InternalServerError
+    )
+
+    def __init__(self, provider, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = 0.5, backoff_cap: float = 8.0,
+                 rate_per_minute: float = LLM_RATE_LIMIT_RPM):
+        self.provider = provider
+        self.rate_limiter = AsyncRateLimiter(rate_per_minute) if rate_per_minute > 0 else None
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._latencies = deque(maxlen=1000)
+        self._first_token_latencies = deque(maxlen=1000)
+        self._counters = {
+            "calls": 0, "streams": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0,
+            "in_flight": 0, "prompt_tokens": 0, "completion_tokens": 0
+        }
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None,
+                       **kwargs) -> Dict[str, Any]:
+        """Run one chat completion and return {"content", "model", "usage", "latency"}"""
+        self._counters["calls"] += 1
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            async with self._semaphore:
+                self._counters["in_flight"] += 1
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(
+                        self.provider.complete(messages, model, **kwargs),
+                        timeout=timeout or self.timeout
+                    )
+                    latency = time.perf_counter() - started
+                    self._latencies.append(latency)
+                    self._counters["succeeded"] += 1
+                    self._counters["prompt_tokens"] += result["usage"]["prompt_tokens"]
+                    self._counters["completion_tokens"] += result["usage"]["completion_tokens"]
+                    return {**result, "latency": latency}
+                except self.RETRYABLE_ERRORS as e:
+                    if isinstance(e, (asyncio.TimeoutError, openai_sdk.APITimeoutError)):
+                        self._counters["timeouts"] += 1
+                    error = e
+                except Exception as e:
+                    self._counters["failed"] += 1
+                    raise LLMError(str(e)) from e
+                finally:
+                    self._counters["in_flight"] -= 1
+
+            # Back off outside the semaphore so waiting retries don't hold a slot
+            if attempt >= self.max_retries:
+                self._counters["failed"] += 1
+                raise LLMError(f"LLM call failed after {attempt + 1} attempts: {str(error) or type(error).__name__}") from error
+            attempt += 1
+            self._counters["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+
+    async def stream(self, messages: List[Dict[str, str]], model: str, timeout: Optional[float] = None, **kwargs):
+        """Yield {"type": "token"} events as the answer arrives, then a {"type": "usage"} event.
+
+        Failures before the first event are retried like complete(); once tokens have been
+        yielded an error ends the stream. Closing this generator closes the upstream request.
+        """
+        self._counters["calls"] += 1
+        self._counters["streams"] += 1
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            async with self._semaphore:
+                self._counters["in_flight"] += 1
+                started = time.perf_counter()
+                events = self.provider.stream(messages, model, **kwargs)
+                received = False
+                try:
+                    while True:
+                        try:
+                            # The timeout applies to the gap between events, not the whole answer
+                            event = await asyncio.wait_for(events.__anext__(), timeout=timeout or self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if not received:
+                            self._first_token_latencies.append(time.perf_counter() - started)
+                            received = True
+                        if event["type"] == "usage":
+                            self._counters["prompt_tokens"] += event["usage"]["prompt_tokens"]
+                            self._counters["completion_tokens"] += event["usage"]["completion_tokens"]
+                        yield event
+                    self._latencies.append(time.perf_counter() - started)
+                    self._counters["succeeded"] += 1
+                    return
+                except self.RETRYABLE_ERRORS as e:
+                    if isinstance(e, (asyncio.TimeoutError, openai_sdk.APITimeoutError)):
+                        self._counters["timeouts"] += 1
+                    if received:
+                        self._counters["failed"] += 1
+                        raise LLMError(f"LLM stream interrupted: {str(e) or type(e).__name__}") from e
+                    error = e
+                except Exception as e:
+                    self._counters["failed"] += 1
+                    raise LLMError(str(e)) from e
+                finally:
+                    self._counters["in_flight"] -= 1
+                    await events.aclose()
+
+            if attempt >= self.max_retries:
+                self._counters["failed"] += 1
+                raise LLMError(f"LLM stream failed after {attempt + 1} attempts: {str(error) or type(error).__name__}") from error
+            attempt += 1
+            self._counters["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters plus latency percentiles over the most recent calls"""
+        latencies = np.array(self._latencies) if self._latencies else None
+        first_token = np.array(self._first_token_latencies) if self._first_token_latencies else None
+        return {
+            "provider": type(self.provider).__name__,
+            "max_concurrency": self.max_concurrency,
+            "rate_limit_per_minute": self.rate_limiter.rate * 60 if self.rate_limiter else None,
+            **self._counters,
+            "total_tokens": self._counters["prompt_tokens"] + self._counters["completion_tokens"],
+            "latency_seconds": {
+                "count": len(self._latencies),
+                "mean": float(latencies.mean()),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max())
+            } if latencies is not None else {"count": 0},
+            "stream_first_token_seconds": {
+                "count": len(self._first_token_latencies),
+                "p50": float(np.percentile(first_token, 50)),
+                "p95": float(np.percentile(first_token, 95))
+            } if first_token is not None else {"count": 0}
+        }
+
+if LLM_PROVIDER == "stub":
+    llm_client = LLMClient(StubLLMProvider())
+else:
+    llm_client = LLMClient(OpenAILLMProvider(openai_api_key, max_connections=LLM_MAX_CONCURRENCY))
+
 app = FastAPI()
 
 # Add a route to check API key status
@@ -59,6 +332,16 @@ async def check_openai_status():
             "solution": "Check your .env.local file and ensure OPENAI_API_KEY is set correctly."
         }
 
+@app.get("/api/llm/metrics")
+async def get_llm_metrics():
+    """Latency, token and retry counters for the shared LLM client"""
+    return llm_client.metrics()
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes for the dataset profile and LLM answer caches"""
+    return {"profiles": profile_cache.stats(), "answers": answer_cache.stats()}
+
 # Configure CORS to allow requests from your frontend
 app.add_middleware(
     CORSMiddleware,
@@ -72,6 +355,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared process pool for CPU-heavy work (bootstrap resampling and similar batch jobs).
+# Created lazily so importing the app doesn't fork workers.
+COMPUTE_POOL_WORKERS = max(1, int(os.getenv("COMPUTE_POOL_WORKERS", os.cpu_count() or 1)))
+_compute_pool = None
+
+def get_compute_pool() -> ProcessPoolExecutor:
+    """Return the shared compute pool, creating it on first use"""
+    global _compute_pool
+    if _compute_pool is None:
+        _compute_pool = ProcessPoolExecutor(max_workers=COMPUTE_POOL_WORKERS)
+    return _compute_pool
+
+@app.on_event("shutdown")
+def shutdown_compute_pool():
+    """Stop the compute pool workers when the server shuts down"""
+    global _compute_pool
+    if _compute_pool is not None:
+        _compute_pool.shutdown(wait=False, cancel_futures=True)
+        _compute_pool = None
+
 class MatrixData(BaseModel):
     matrix_a: List[List[float]]
     matrix_b: Optional[List[List[float]]] = None
@@ -107,7 +410,7 @@ class SheetSelection(BaseModel):
     data_range: Optional[Dict[str, int]] = None
 
 class ReportConfig(BaseModel):
-    data_quality: Optional[Dict[str, bool]] = Field(
+    data_quality: Optional[Dict[str, Any]] = Field(
         default_factory=lambda: {
             "missing_values": True,
             "type_detection": True,
@@ -132,7 +435,7 @@ class ReportConfig(BaseModel):
     visualizations: Optional[List[Dict[str, Any]]] = Field(
         default_factory=list
     )
-    ai_analysis: Optional[Dict[str, bool]] = Field(
+    ai_analysis: Optional[Dict[str, Any]] = Field(
         default_factory=lambda: {
             "trends": True,
             "insights": True,
@@ -146,6 +449,7 @@ class ReportRequest(BaseModel):
     selected_sheets: List[SheetSelection]
     config: ReportConfig
     user_id: str
+    reuse_sections: bool = True  # serve unchanged sections from the section cache
 
 class ReportSection(BaseModel):
     title: str
@@ -153,6 +457,7 @@ class ReportSection(BaseModel):
     visualizations: Optional[List[Dict[str, Any]]] = None
     insights: Optional[List[str]] = None
     progress_updates: Optional[List[Dict[str, Any]]] = None
+    metrics: Optional[Dict[str, Any]] = None  # timings and other diagnostics, not rendered as content
 
 class ReportResponse(BaseModel):
     report_id: str
@@ -354,73 +659,78 @@ async def perform_correlation(data: dict):
 async def perform_correlation_analysis(data: CorrelationData):
     try:
         # Convert to pandas DataFrame for easier handling
-        df = pd.DataFrame(data.data, columns=data.columns)
-        
-        # Filter only numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        
-        if len(numeric_cols) < 2:
-            raise ValueError("Need at least 2 numeric columns for correlation analysis")
-        
-        # Calculate correlation matrix
-        corr_matrix = df[numeric_cols].corr(method='pearson').round(3)
-        
-        # Calculate p-values for each correlation pair
-        p_values = {}
-        for i, col1 in enumerate(numeric_cols):
-            p_values[col1] = {}
-            for col2 in numeric_cols:
-                if col1 != col2:
-                    # Calculate Pearson correlation and p-value
-                    valid_data = df[[col1, col2]].dropna()
-                    if len(valid_data) > 1:  # Need at least 2 data points
-                        corr, p_val = pearsonr(valid_data[col1], valid_data[col2])
-                        p_values[col1][col2] = round(p_val, 4)
-                    else:
-                        p_values[col1][col2] = None
-                else:
-                    p_values[col1][col2] = 0.0  # p-value for self correlation is 0
-        
-        # Interpret correlations
-        interpretations = {}
-        for col1 in numeric_cols:
-            interpretations[col1] = {}
-            for col2 in numeric_cols:
-                if col1 != col2:
-                    corr_value = corr_matrix.loc[col1, col2]
-                    p_value = p_values[col1][col2]
-                    
-                    # Skip if p-value is None (not enough data)
-                    if p_value is None:
-                        interpretations[col1][col2] = "Insufficient data"
-                        continue
-                    
-                    # Interpret correlation strength
-                    if abs(corr_value) < 0.3:
-                        strength = "weak"
-                    elif abs(corr_value) < 0.7:
-                        strength = "moderate"
-                    else:
-                        strength = "strong"
-                    
-                    # Interpret statistical significance
-                    significance = "statistically significant" if p_value < 0.05 else "not statistically significant"
-                    
-                    # Direction
-                    direction = "positive" if corr_value > 0 else "negative"
-                    
-                    interpretations[col1][col2] = f"{strength} {direction} correlation ({significance}, p={p_value})"
-        
-        return {
-            "correlation_matrix": corr_matrix.to_dict(),
-            "p_values": p_values,
-            "interpretations": interpretations,
-            "numeric_columns": numeric_cols
-        }
-        
+        return correlation_analysis(pd.DataFrame(data.data, columns=data.columns))
     except Exception as e:
         return {"error": str(e)}
 
+def correlation_analysis(df: pd.DataFrame) -> Dict[str, Any]:
+    """Pearson matrix, p-values and interpretations for the numeric columns of a frame.
+
+    Shared by /correlation-analysis and the report's statistical section; raises
+    ValueError when fewer than two numeric columns are present.
+    """
+    # Filter only numeric columns
+    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+
+    if len(numeric_cols) < 2:
+        raise ValueError("Need at least 2 numeric columns for correlation analysis")
+
+    # Calculate correlation matrix
+    corr_matrix = df[numeric_cols].corr(method='pearson').round(3)
+
+    # Calculate p-values for each correlation pair
+    p_values = {}
+    for i, col1 in enumerate(numeric_cols):
+        p_values[col1] = {}
+        for col2 in numeric_cols:
+            if col1 != col2:
+                # Calculate Pearson correlation and p-value
+                valid_data = df[[col1, col2]].dropna()
+                if len(valid_data) > 1:  # Need at least 2 data points
+                    corr, p_val = pearsonr(valid_data[col1], valid_data[col2])
+                    p_values[col1][col2] = round(p_val, 4)
+                else:
+                    p_values[col1][col2] = None
+            else:
+                p_values[col1][col2] = 0.0  # p-value for self correlation is 0
+
+    # Interpret correlations
+    interpretations = {}
+    for col1 in numeric_cols:
+        interpretations[col1] = {}
+        for col2 in numeric_cols:
+            if col1 != col2:
+                corr_value = corr_matrix.loc[col1, col2]
+                p_value = p_values[col1][col2]
+
+                # Skip if p-value is None (not enough data)
+                if p_value is None:
+                    interpretations[col1][col2] = "Insufficient data"
+                    continue
+
+                # Interpret correlation strength
+                if abs(corr_value) < 0.3:
+                    strength = "weak"
+                elif abs(corr_value) < 0.7:
+                    strength = "moderate"
+                else:
+                    strength = "strong"
+
+                # Interpret statistical significance
+                significance = "statistically significant" if p_value < 0.05 else "not statistically significant"
+
+                # Direction
+                direction = "positive" if corr_value > 0 else "negative"
+
+                interpretations[col1][col2] = f"{strength} {direction} correlation ({significance}, p={p_value})"
+
+    return {
+        "correlation_matrix": corr_matrix.to_dict(),
+        "p_values": p_values,
+        "interpretations": interpretations,
+        "numeric_columns": numeric_cols
+    }
+
 @app.post("/forecast")
 async def forecast_time_series(data: dict):
     try:
@@ -429,6 +739,7 @@ async def forecast_time_series(data: dict):
         periods = data.get("periods", 7)
         method = data.get("method", "auto")
         seasonality = data.get("seasonality", "auto")
+        bootstrap_options = parse_bootstrap_options(data.get("bootstrap"))
         
         if not time_series:
             return {"error": "No time series data provided"}
@@ -482,6 +793,8 @@ async def forecast_time_series(data: dict):
         forecast_values = []
         forecast_lower = []
         forecast_upper = []
+        interval_method = "model"
+        bootstrap_note = None
         
         # Perform forecasting
         if method == "arima":
@@ -504,6 +817,10 @@ async def forecast_time_series(data: dict):
             # Calculate error metrics
             mae = np.mean(np.abs(fitted_model.resid))
             mape = np.mean(np.abs(fitted_model.resid / df['value'])) * 100
+
+            if bootstrap_options:
+                bootstrap_note = {"error": "Bootstrap intervals are only available for the ets method; "
+                                           "ARIMA intervals come from the fitted model"}
             
         elif method == "ets":
             # Exponential Smoothing
@@ -529,11 +846,30 @@ async def forecast_time_series(data: dict):
             forecast = fitted_model.forecast(periods)
             forecast_values = forecast.tolist()
             
-            # Simple confidence intervals (approximation)
             residuals = fitted_model.resid
-            resid_std = residuals.std()
-            forecast_lower = [v - 1.96 * resid_std for v in forecast_values]
-            forecast_upper = [v + 1.96 * resid_std for v in forecast_values]
+            if bootstrap_options:
+                # Simulate future paths by resampling the in-sample residuals
+                seed = bootstrap_options["seed"]
+                try:
+                    paths = fitted_model.simulate(periods, repetitions=bootstrap_options["replicates"],
+                                                  error="add", random_errors="bootstrap",
+                                                  rng=np.random.default_rng(seed))
+                except TypeError:
+                    # Older statsmodels releases take random_state instead of rng
+                    paths = fitted_model.simulate(periods, repetitions=bootstrap_options["replicates"],
+                                                  error="add", random_errors="bootstrap",
+                                                  random_state=seed)
+                paths = np.asarray(paths).reshape(periods, -1)
+                tail = (1 - bootstrap_options["confidence_level"]) / 2
+                forecast_lower = np.quantile(paths, tail, axis=1).tolist()
+                forecast_upper = np.quantile(paths, 1 - tail, axis=1).tolist()
+                interval_method = "bootstrap"
+            else:
+                # Simple confidence intervals (approximation)
+                resid_std = residuals.std()
+                forecast_lower = [v - 1.96 * resid_std for v in forecast_values]
+                forecast_upper = [v + 1.96 * resid_std for v in forecast_values]
+                interval_method = "normal_approximation"
             
             # Calculate error metrics
             mae = np.mean(np.abs(residuals))
@@ -553,18 +889,982 @@ async def forecast_time_series(data: dict):
                 "upper_bound": round(forecast_upper[i], 4)
             })
         
-        return {
+        result = {
             "forecast": forecast_result,
             "method": method,
             "mae": mae,
             "mape": mape,
-            "seasonality": seasonality
+            "seasonality": seasonality,
+            "interval_method": interval_method
         }
+        if bootstrap_note:
+            result["bootstrap"] = bootstrap_note
+        return result
         
     except Exception as e:
         print(f"Forecast error: {str(e)}")
         return {"error": str(e)}
 
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and a cap on entries and estimated bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, Tuple[float, int, Any]]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, size: int):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return  # Larger than the whole cache; don't evict everything for it
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def resize(self, key, size: int):
+        """Update an entry's estimated size (evicting others if it grew past the cap)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._entries[key] = (entry[0], size, entry[2])
+            self._bytes += size - entry[1]
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                if oldest == key:
+                    self._entries.move_to_end(key)
+                    oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None
+            }
+
+def content_hash(value: Any) -> str:
+    """Stable hash of JSON-like content, used as a cache key"""
+    encoded = json.dumps(value, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def sheet_hash(spreadsheet_data: List[List[Any]]) -> str:
+    """Content hash of a sheet's rows, used to key profiles and stored datasets.
+
+    marshal serializes lists of JSON values in C several times faster than json.dumps
+    (format 2 writes no back-references, so equal content gives equal bytes); values it
+    cannot encode fall back to content_hash.
+    """
+    try:
+        encoded = marshal.dumps(spreadsheet_data, 2)
+    except ValueError:
+        return content_hash(spreadsheet_data)
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+# Bootstrap confidence intervals for regression coefficients
+BOOTSTRAP_DEFAULTS = {
+    "method": "case",            # "case" (resample rows) or "residual" (resample residuals)
+    "replicates": 1000,
+    "seed": None,
+    "confidence_level": 0.95,
+    "interval": "percentile",    # "percentile" or "bca"
+    "time_budget": 10.0,         # seconds
+    "tolerance": 0.02,           # stop once interval endpoints move less than this many standard errors
+    "min_replicates": 200
+}
+
+BOOTSTRAP_DEADLINE_GRACE = 2.0  # seconds to wait past the budget for batches finishing their current fit
+
+def parse_bootstrap_options(raw: Any) -> Optional[Dict[str, Any]]:
+    """Normalize the optional `bootstrap` request field into a full options dict"""
+    if not raw:
+        return None
+    if raw is True:
+        raw = {}
+    if not isinstance(raw, dict):
+        raise HTTPException(status_code=400, detail="bootstrap must be true or an options object")
+
+    options = {**BOOTSTRAP_DEFAULTS, **{k: v for k, v in raw.items() if v is not None}}
+    if options["method"] not in ("case", "residual"):
+        raise HTTPException(status_code=400, detail=f"Unsupported bootstrap method: {options['method']}")
+    if options["interval"] not in ("percentile", "bca"):
+        raise HTTPException(status_code=400, detail=f"Unsupported bootstrap interval: {options['interval']}")
+    if not 0 < float(options["confidence_level"]) < 1:
+        raise HTTPException(status_code=400, detail="confidence_level must be between 0 and 1")
+
+    options["replicates"] = max(10, int(options["replicates"]))
+    options["min_replicates"] = min(options["replicates"], max(10, int(options["min_replicates"])))
+    options["time_budget"] = max(0.1, float(options["time_budget"]))
+    options["confidence_level"] = float(options["confidence_level"])
+    options["tolerance"] = float(options["tolerance"])
+    return options
+
+def _fit_coefficient_batch(spec: Dict[str, Any], X: np.ndarray, y: np.ndarray,
+                           weights: Optional[np.ndarray] = None,
+                           y_batch: Optional[np.ndarray] = None,
+                           deadline: Optional[float] = None) -> np.ndarray:
+    """Fit a batch of resampled models and return one [intercept, coef...] row per replicate.
+
+    Case resampling is expressed as multinomial row weights and residual resampling as a
+    batch of synthetic responses, so the data itself is never copied per replicate.
+    Dense linear, polynomial and ridge fits are solved in closed form for the whole batch
+    at once; lasso, logistic and sparse designs fall back to one solver call per replicate.
+    Past `deadline` (a time.time() value) the batch stops and returns the rows fitted so far.
+    """
+    n, p = X.shape
+    n_batch = len(weights) if weights is not None else len(y_batch)
+    regression_type = spec["regression_type"]
+
+    if regression_type in ("linear", "polynomial", "ridge") and not sparse.issparse(X):
+        X1 = np.hstack((np.ones((n, 1)), X))
+        penalty = np.eye(p + 1) * spec.get("alpha", 0.0)
+        penalty[0, 0] = 0.0  # The intercept is never penalized
+
+        if y_batch is not None:
+            # X is fixed under residual resampling, so one solve serves every replicate
+            solver = np.linalg.pinv(X1.T @ X1 + penalty) @ X1.T
+            return y_batch @ solver.T
+
+        # Chunk the weighted design so the (chunk, n, p) intermediate stays around 32MB
+        chunk = max(1, int(4_000_000 // (n * (p + 1))))
+        rows = [np.empty((0, p + 1))]
+        for start in range(0, n_batch, chunk):
+            if deadline is not None and time.time() >= deadline:
+                break
+            WX = weights[start:start + chunk, :, None] * X1[None, :, :]
+            WXt = np.swapaxes(WX, 1, 2)
+            XtWX = WXt @ X1 + penalty
+            XtWy = WXt @ y
+            rows.append(np.einsum("bij,bj->bi", np.linalg.pinv(XtWX), XtWy))
+        return np.vstack(rows)
+
+    rows = np.full((n_batch, p + 1), np.nan)
+    for b in range(n_batch):
+        if deadline is not None and time.time() >= deadline:
+            return rows[:b]
+        sample_weight = weights[b] if weights is not None else None
+        y_b = y_batch[b] if y_batch is not None else y
+        try:
+            model = _make_estimator(spec)
+            model.fit(X, y_b, sample_weight=sample_weight)
+            rows[b] = np.concatenate((np.ravel(model.intercept_), np.ravel(model.coef_)))
+        except ValueError:
+            # e.g. a resample that contains only one class; leave the row as NaN
+            continue
+    return rows
+
+def _run_bootstrap_batch(spec: Dict[str, Any], X: np.ndarray, y: np.ndarray,
+                         fitted: np.ndarray, method: str, n_replicates: int,
+                         seed: np.random.SeedSequence, deadline: Optional[float] = None) -> np.ndarray:
+    """Worker entry point: draw one batch of resamples and fit them (possibly fewer, past `deadline`)"""
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    if method == "residual":
+        residuals = y - fitted
+        y_batch = fitted[None, :] + residuals[rng.integers(0, n, size=(n_replicates, n))]
+        return _fit_coefficient_batch(spec, X, y, y_batch=y_batch, deadline=deadline)
+    weights = rng.multinomial(n, np.full(n, 1.0 / n), size=n_replicates).astype(np.float64)
+    return _fit_coefficient_batch(spec, X, y, weights=weights, deadline=deadline)
+
+def _run_jackknife(spec: Dict[str, Any], X: np.ndarray, y: np.ndarray, max_groups: int = 50) -> np.ndarray:
+    """Grouped delete-one jackknife estimates, used for the BCa acceleration constant"""
+    n = len(y)
+    groups = np.array_split(np.arange(n), min(n, max_groups))
+    weights = np.ones((len(groups), n))
+    for g, idx in enumerate(groups):
+        weights[g, idx] = 0.0
+    return _fit_coefficient_batch(spec, X, y, weights=weights)
+
+def _bootstrap_intervals(replicates: np.ndarray, estimate: np.ndarray, confidence_level: float,
+                         interval: str, jackknife: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile or BCa interval endpoints for each coefficient column"""
+    alpha = (1 - confidence_level) / 2
+    lower_q = np.full(estimate.shape, alpha)
+    upper_q = np.full(estimate.shape, 1 - alpha)
+
+    if interval == "bca" and jackknife is not None:
+        # Bias correction from the share of replicates below the point estimate
+        below = np.mean(replicates < estimate, axis=0) + 0.5 * np.mean(replicates == estimate, axis=0)
+        z0 = stats.norm.ppf(np.clip(below, 1e-6, 1 - 1e-6))
+
+        # Acceleration from the jackknife skewness
+        jack = jackknife[~np.isnan(jackknife).any(axis=1)]
+        d = jack.mean(axis=0) - jack
+        denom = 6 * np.sum(d ** 2, axis=0) ** 1.5
+        accel = np.divide(np.sum(d ** 3, axis=0), denom, out=np.zeros_like(denom), where=denom > 0)
+
+        z_lo, z_hi = stats.norm.ppf(alpha), stats.norm.ppf(1 - alpha)
+        lower_q = stats.norm.cdf(z0 + (z0 + z_lo) / (1 - accel * (z0 + z_lo)))
+        upper_q = stats.norm.cdf(z0 + (z0 + z_hi) / (1 - accel * (z0 + z_hi)))
+
+    lower = np.array([np.quantile(replicates[:, j], lower_q[j]) for j in range(replicates.shape[1])])
+    upper = np.array([np.quantile(replicates[:, j], upper_q[j]) for j in range(replicates.shape[1])])
+    return lower, upper
+
+async def run_bootstrap(spec: Dict[str, Any], X: np.ndarray, y: np.ndarray, fitted: np.ndarray,
+                        estimate: np.ndarray, column_names: List[str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run bootstrap resampling on the compute pool in rounds until the intervals settle.
+
+    Each round hands one batch per worker to the pool. After every round the intervals are
+    recomputed and the loop stops early once no endpoint moves by more than `tolerance`
+    bootstrap standard errors, or when the time budget runs out; workers check the budget
+    between fits themselves, so no batch keeps a pool process busy past it. A batch that
+    raises ends the run with that error.
+    """
+    started = time.perf_counter()
+    deadline = started + options["time_budget"]
+    wall_deadline = time.time() + options["time_budget"]  # for the pool processes
+    loop = asyncio.get_running_loop()
+    pool = get_compute_pool()
+
+    method = options["method"]
+    if spec["regression_type"] == "logistic" and method == "residual":
+        method = "case"  # Residuals aren't meaningful for a binary response
+
+    seed = options["seed"]
+    if seed is None:
+        # Draw a seed so the response can report one that reproduces this run
+        seed = int(np.random.default_rng().integers(2 ** 32))
+    seed_sequence = np.random.SeedSequence(seed)
+    n = len(y)
+    # Keep each batch's weight matrix around 2M cells
+    batch_size = int(np.clip(2_000_000 // max(n, 1), 1, 250))
+
+    jackknife_future = None
+    if options["interval"] == "bca":
+        jackknife_future = loop.run_in_executor(pool, _run_jackknife, spec, X, y)
+
+    batches = []
+    completed = 0
+    previous = None
+    stop_reason = "completed"
+
+    while completed < options["replicates"]:
+        round_sizes = []
+        remaining = options["replicates"] - completed
+        for _ in range(COMPUTE_POOL_WORKERS):
+            if remaining <= 0:
+                break
+            size = min(batch_size, remaining)
+            round_sizes.append(size)
+            remaining -= size
+
+        futures = [
+            loop.run_in_executor(pool, _run_bootstrap_batch, spec, X, y, fitted, method, size, child, wall_deadline)
+            for size, child in zip(round_sizes, seed_sequence.spawn(len(round_sizes)))
+        ]
+        # Batches stop at the deadline on their own; the grace covers the fit in progress
+        done, pending = await asyncio.wait(
+            futures, timeout=max(0.0, deadline - time.perf_counter()) + BOOTSTRAP_DEADLINE_GRACE
+        )
+        for future in pending:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                error = future.exception()
+                print(f"Bootstrap batch failed: {str(error)}")
+                return {
+                    "error": f"Bootstrap resampling failed: {str(error)}",
+                    "replicates_completed": int(completed),
+                    "elapsed_seconds": round(time.perf_counter() - started, 3)
+                }
+        truncated = bool(pending)
+        for size, future in zip(round_sizes, futures):
+            if future in done:
+                batches.append(future.result())
+                completed += len(future.result())
+                truncated = truncated or len(future.result()) < size
+
+        if truncated or time.perf_counter() >= deadline:
+            stop_reason = "time_budget"
+            break
+
+        replicates = np.vstack(batches)
+        replicates = replicates[~np.isnan(replicates).any(axis=1)]
+        if completed >= options["min_replicates"] and len(replicates) > 1:
+            lower, upper = _bootstrap_intervals(replicates, estimate, options["confidence_level"], "percentile")
+            spread = np.maximum(replicates.std(axis=0, ddof=1), 1e-12)
+            if previous is not None:
+                shift = np.maximum(np.abs(lower - previous[0]), np.abs(upper - previous[1])) / spread
+                if np.all(shift < options["tolerance"]):
+                    stop_reason = "converged"
+                    break
+            previous = (lower, upper)
+
+    replicates = np.vstack(batches) if batches else np.empty((0, len(estimate)))
+    replicates = replicates[~np.isnan(replicates).any(axis=1)]
+    if len(replicates) < 2:
+        return {
+            "error": "Not enough bootstrap replicates completed within the time budget",
+            "replicates_completed": int(len(replicates)),
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }
+
+    jackknife = None
+    if jackknife_future is not None:
+        try:
+            jackknife = await asyncio.wait_for(jackknife_future, timeout=max(0.1, deadline - time.perf_counter()))
+        except (asyncio.TimeoutError, Exception) as e:
+            print(f"Jackknife for BCa intervals failed, using percentile intervals: {e}")
+
+    interval = options["interval"] if jackknife is not None else "percentile"
+    lower, upper = _bootstrap_intervals(replicates, estimate, options["confidence_level"], interval, jackknife)
+    std_errors = replicates.std(axis=0, ddof=1)
+    # Two-sided p-value for H0: coefficient == 0, from the share of replicates on each side of zero
+    p_values = np.minimum(1.0, 2 * np.minimum(np.mean(replicates <= 0, axis=0), np.mean(replicates >= 0, axis=0)))
+    p_values = np.maximum(p_values, 1.0 / len(replicates))
+
+    def entry(j, name):
+        return {
+            "name": name,
+            "estimate": float(estimate[j]),
+            "lower": float(lower[j]),
+            "upper": float(upper[j]),
+            "std_error": float(std_errors[j]),
+            "p_value": float(p_values[j])
+        }
+
+    return {
+        "method": method,
+        "interval": interval,
+        "confidence_level": options["confidence_level"],
+        "seed": seed,
+        "replicates_requested": options["replicates"],
+        "replicates_completed": int(len(replicates)),
+        "stop_reason": stop_reason,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "intercept": entry(0, "intercept"),
+        "coefficients": [entry(j + 1, name) for j, name in enumerate(column_names)]
+    }
+
+# Response shaping for per-row regression outputs
+ROW_OUTPUT_MODES = ("full", "none", "sample", "binary")
+ROW_OUTPUT_TTL = 600          # seconds a binary side-channel payload stays downloadable
+ROW_OUTPUT_MAX_ENTRIES = 32
+DEFAULT_MAX_ROC_POINTS = 200
+
+# array_id -> (expires_at, payload bytes)
+_row_output_store: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+def finite_list(values: np.ndarray) -> list:
+    """Vectorized equivalent of safe_float over an array: NaN and +/-Inf become 0.0"""
+    if np.issubdtype(np.asarray(values).dtype, np.integer):
+        return np.asarray(values).tolist()
+    return np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0).tolist()
+
+def parse_row_output_options(data: dict) -> Dict[str, Any]:
+    """Read the response shaping options from a /regression request"""
+    mode = data.get("row_output", "full")
+    if mode not in ROW_OUTPUT_MODES:
+        raise HTTPException(status_code=400, detail=f"row_output must be one of {', '.join(ROW_OUTPUT_MODES)}")
+    max_roc_points = data.get("max_roc_points", DEFAULT_MAX_ROC_POINTS)
+    return {
+        "mode": mode,
+        "max_rows": max(2, int(data.get("max_rows", 1000))),
+        "max_roc_points": int(max_roc_points) if max_roc_points else None,
+        "histogram_bins": max(1, int(data.get("histogram_bins", 20)))
+    }
+
+def shape_row_outputs(arrays: Dict[str, np.ndarray], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the per-row arrays in the requested form.
+
+    full   - every row as JSON lists (the original behaviour)
+    none   - no per-row arrays, only the row count
+    sample - evenly spaced rows, capped at max_rows, plus their row indices
+    binary - raw little-endian bytes parked for download from /regression/arrays/{id}
+    """
+    mode = options["mode"]
+    n_rows = len(next(iter(arrays.values())))
+    info = {"mode": mode, "rows": n_rows}
+
+    if mode == "full":
+        return {"row_output": info, **{name: finite_list(values) for name, values in arrays.items()}}
+
+    if mode == "none":
+        return {"row_output": info}
+
+    if mode == "sample":
+        indices = np.unique(np.linspace(0, n_rows - 1, min(n_rows, options["max_rows"])).round().astype(np.int64))
+        info["row_indices"] = indices.tolist()
+        return {"row_output": info, **{name: finite_list(values[indices]) for name, values in arrays.items()}}
+
+    # binary: concatenate the arrays into one buffer and describe the layout
+    now = time.time()
+    while _row_output_store and (len(_row_output_store) >= ROW_OUTPUT_MAX_ENTRIES
+                                 or next(iter(_row_output_store.values()))[0] < now):
+        _row_output_store.popitem(last=False)
+
+    fields = {}
+    chunks = []
+    offset = 0
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        dtype = "<i8" if np.issubdtype(values.dtype, np.integer) else "<f8"
+        raw = np.ascontiguousarray(values, dtype=dtype).tobytes()
+        fields[name] = {"dtype": "int64" if dtype == "<i8" else "float64", "offset": offset, "length": len(values)}
+        chunks.append(raw)
+        offset += len(raw)
+
+    array_id = uuid.uuid4().hex
+    _row_output_store[array_id] = (now + ROW_OUTPUT_TTL, b"".join(chunks))
+    info.update({
+        "array_id": array_id,
+        "url": f"/regression/arrays/{array_id}",
+        "byte_order": "little",
+        "fields": fields,
+        "expires_in": ROW_OUTPUT_TTL
+    })
+    return {"row_output": info}
+
+def thin_roc_curve(fpr: np.ndarray, tpr: np.ndarray, max_points: Optional[int]) -> List[Dict[str, float]]:
+    """Keep at most max_points ROC points, always including both end points"""
+    if max_points and len(fpr) > max_points:
+        keep = np.unique(np.linspace(0, len(fpr) - 1, max_points).round().astype(np.int64))
+        fpr, tpr = fpr[keep], tpr[keep]
+    return [{"fpr": f, "tpr": t} for f, t in zip(fpr.tolist(), tpr.tolist())]
+
+def summarize_distribution(values: np.ndarray, bins: int = 20) -> Dict[str, Any]:
+    """Histogram, quantiles and moments that stand in for a raw per-row array"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {"count": 0}
+
+    quantile_levels = [0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]
+    quantile_names = ["min", "p01", "p05", "p25", "median", "p75", "p95", "p99", "max"]
+    counts, edges = np.histogram(values, bins=bins)
+    std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "std": std,
+        "skewness": float(stats.skew(values)) if std > 0 else 0.0,
+        "kurtosis": float(stats.kurtosis(values)) if std > 0 else 0.0,
+        "quantiles": dict(zip(quantile_names, np.quantile(values, quantile_levels).tolist())),
+        "histogram": {"counts": counts.tolist(), "bin_edges": edges.tolist()}
+    }
+
+@app.get("/regression/arrays/{array_id}")
+async def get_regression_arrays(array_id: str):
+    """Download the binary per-row arrays parked by a row_output="binary" regression"""
+    entry = _row_output_store.get(array_id)
+    if entry is None or entry[0] < time.time():
+        _row_output_store.pop(array_id, None)
+        raise HTTPException(status_code=404, detail="Array payload not found or expired")
+    return Response(content=entry[1], media_type="application/octet-stream")
+
+# Categorical predictors: sparse one-hot designs and per-factor statistics
+ABSORB_FACTOR_MIN_LEVELS = 100   # factors wider than this are handled block-diagonally in (X'X)^-1
+GVIF_MAX_COLUMNS = 500           # skip the dense correlation matrix for wider designs
+
+def encode_categorical_design(X_numeric: np.ndarray, numeric_names: List[str],
+                              categorical_variables: Dict[str, List[Any]],
+                              reference_levels: Dict[str, Any]) -> Tuple[sparse.csr_matrix, List[str], List[Dict[str, Any]]]:
+    """One-hot encode categorical predictors next to the numeric ones.
+
+    Each factor drops its reference level (the first level in sorted order unless
+    `reference_levels` names one). Returns the CSR design, its column names and a list of
+    terms mapping every numeric predictor or factor to its design columns.
+    """
+    n = X_numeric.shape[0]
+    blocks = [sparse.csr_matrix(X_numeric)] if X_numeric.shape[1] else []
+    names = list(numeric_names)
+    terms = [{"name": name, "type": "numeric", "columns": [i]} for i, name in enumerate(numeric_names)]
+    offset = X_numeric.shape[1]
+
+    for factor, values in categorical_variables.items():
+        if len(values) != n:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Categorical variable '{factor}' has {len(values)} values but the dependent variable has {n}"
+            )
+        labels = pd.Series(values, dtype=object).fillna("").astype(str)
+        codes, levels = pd.factorize(labels, sort=True)
+        if len(levels) < 2:
+            raise HTTPException(status_code=400, detail=f"Categorical variable '{factor}' has only one level")
+
+        reference = str(reference_levels.get(factor, levels[0]))
+        if reference not in levels:
+            raise HTTPException(status_code=400, detail=f"Reference level '{reference}' not found in '{factor}'")
+        ref_code = int(levels.get_loc(reference))
+
+        rows = np.flatnonzero(codes != ref_code)
+        cols = codes[rows] - (codes[rows] > ref_code)
+        width = len(levels) - 1
+        blocks.append(sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, width)))
+
+        kept_levels = [level for level in levels if level != reference]
+        names.extend(f"{factor}[{level}]" for level in kept_levels)
+        terms.append({
+            "name": factor,
+            "type": "categorical",
+            "columns": list(range(offset, offset + width)),
+            "reference": reference,
+            "levels": len(levels)
+        })
+        offset += width
+
+    return sparse.hstack(blocks, format="csr"), names, terms
+
+def describe_factors(terms: List[Dict[str, Any]], column_names: List[str]) -> List[Dict[str, Any]]:
+    """Summarize the categorical terms and which coefficients belong to each"""
+    return [
+        {
+            "name": term["name"],
+            "reference": term["reference"],
+            "levels": term["levels"],
+            "columns": [column_names[c] for c in term["columns"]],
+            "coefficient_indices": term["columns"]
+        }
+        for term in terms if term["type"] == "categorical"
+    ]
+
+def coefficient_standard_errors(X_model, mse: float, terms: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+    """Standard errors for [intercept, coef...] from mse * (X1'X1)^-1, X1 = [1, X_model].
+
+    One-hot columns of a single factor never overlap, so that factor's block of X1'X1 is
+    diagonal. For a wide factor the inverse diagonal is obtained through the Schur
+    complement of that block instead of inverting the full (p+1)x(p+1) matrix.
+    """
+    if not sparse.issparse(X_model):
+        X_with_intercept = np.hstack((np.ones((X_model.shape[0], 1)), X_model))
+        cov_matrix = mse * np.linalg.pinv(np.dot(X_with_intercept.T, X_with_intercept))
+        return np.sqrt(np.diag(cov_matrix))
+
+    X1 = sparse.hstack([np.ones((X_model.shape[0], 1)), X_model], format="csc")
+    gram = (X1.T @ X1).tocsr()
+    size = gram.shape[0]
+
+    widest = max((t for t in (terms or []) if t["type"] == "categorical"),
+                 key=lambda t: len(t["columns"]), default=None)
+    if widest is None or len(widest["columns"]) < ABSORB_FACTOR_MIN_LEVELS:
+        return np.sqrt(np.maximum(np.diag(mse * np.linalg.pinv(gram.toarray())), 0))
+
+    block = np.array(widest["columns"]) + 1  # Shift past the intercept column
+    rest = np.setdiff1d(np.arange(size), block)
+    d = gram.diagonal()[block]
+    A = gram[rest][:, rest].toarray()
+    B = gram[rest][:, block].toarray()
+
+    C = B / d                                  # B D^-1
+    S_inv = np.linalg.pinv(A - C @ B.T)        # (A - B D^-1 B')^-1
+    diag = np.empty(size)
+    diag[rest] = np.diag(S_inv)
+    diag[block] = 1.0 / d + np.sum(C * (S_inv @ C), axis=0)
+    return np.sqrt(np.maximum(mse * diag, 0))
+
+def generalized_vif(X_model, terms: List[Dict[str, Any]]) -> Tuple[Dict[str, float], Dict[str, Dict[str, Any]], bool]:
+    """Generalized VIF (Fox & Monette) per term, so a factor is scored as one group.
+
+    Returns (vif_values, factor_vif, collinearity_warning). vif_values holds
+    GVIF^(1/df), which reduces to the ordinary VIF for numeric terms and can be compared
+    against the same threshold.
+    """
+    if X_model.shape[1] < 2 or X_model.shape[1] > GVIF_MAX_COLUMNS:
+        return {}, {}, False
+
+    dense = X_model.toarray() if sparse.issparse(X_model) else np.asarray(X_model)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        R = np.corrcoef(dense, rowvar=False)
+    if not np.all(np.isfinite(R)):
+        return {}, {}, False
+    _, logdet_all = np.linalg.slogdet(R)
+
+    vif_values, factor_vif = {}, {}
+    collinearity_warning = False
+    all_columns = np.arange(X_model.shape[1])
+    for term in terms:
+        cols = np.array(term["columns"])
+        others = np.setdiff1d(all_columns, cols)
+        logdet_term = np.linalg.slogdet(R[np.ix_(cols, cols)])[1]
+        logdet_others = np.linalg.slogdet(R[np.ix_(others, others)])[1] if len(others) else 0.0
+        gvif = float(np.exp(logdet_term + logdet_others - logdet_all))
+        df = len(cols)
+        adjusted = gvif ** (1 / (2 * df))
+        vif_values[term["name"]] = adjusted ** 2
+        factor_vif[term["name"]] = {"gvif": gvif, "df": df, "gvif_adjusted": adjusted}
+        if adjusted ** 2 > 5:
+            collinearity_warning = True
+    return vif_values, factor_vif, collinearity_warning
+
+def factor_group_tests(spec: Dict[str, Any], X_model, y: np.ndarray, terms: List[Dict[str, Any]],
+                       fitted: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """Joint test that all coefficients of a factor are zero, by refitting without it.
+
+    Uses a partial F-test for linear models and a likelihood-ratio test for logistic.
+    """
+    n = X_model.shape[0]
+    p = X_model.shape[1]
+    is_logistic = spec["regression_type"] == "logistic"
+    results = {}
+
+    if is_logistic:
+        # fitted holds predicted class probabilities; y holds encoded class indices
+        y_index = np.asarray(y, dtype=np.int64)
+        n_classes = fitted.shape[1]
+        llf_full = float(np.sum(np.log(np.clip(fitted[np.arange(n), y_index], 1e-12, 1))))
+    else:
+        rss_full = float(np.sum((y - fitted) ** 2))
+
+    for term in terms:
+        if term["type"] != "categorical":
+            continue
+        df = len(term["columns"]) * (n_classes - 1 if is_logistic else 1)
+        keep = np.setdiff1d(np.arange(p), term["columns"])
+        try:
+            reduced = _make_estimator(spec)
+            if len(keep):
+                X_reduced = X_model[:, keep]
+                reduced.fit(X_reduced, y)
+            if is_logistic:
+                if len(keep):
+                    prob = reduced.predict_proba(X_reduced)[np.arange(n), y_index]
+                else:
+                    prob = (np.bincount(y_index, minlength=n_classes) / n)[y_index]
+                llf_reduced = float(np.sum(np.log(np.clip(prob, 1e-12, 1))))
+                statistic = max(0.0, 2 * (llf_full - llf_reduced))
+                results[term["name"]] = {"test": "likelihood_ratio", "df": df, "statistic": statistic,
+                                         "p_value": float(stats.chi2.sf(statistic, df))}
+            else:
+                predicted = reduced.predict(X_reduced) if len(keep) else np.full(n, np.mean(y))
+                rss_reduced = float(np.sum((y - predicted) ** 2))
+                df_resid = max(1, n - p - 1)
+                statistic = ((rss_reduced - rss_full) / df) / max(rss_full / df_resid, 1e-300)
+                results[term["name"]] = {"test": "F", "df": df, "df_residual": df_resid,
+                                         "statistic": float(max(statistic, 0.0)),
+                                         "p_value": float(stats.f.sf(max(statistic, 0.0), df, df_resid))}
+        except Exception as e:
+            print(f"Error testing factor {term['name']}: {e}")
+    return results
+
+# Large-data logistic regression
+LOGISTIC_SOLVERS = ("lbfgs", "saga", "sag", "newton-cholesky", "newton-cg", "liblinear")
+CALIBRATION_METHODS = ("sigmoid", "isotonic")
+DIAGNOSTICS_SAMPLE_SIZE = 50_000   # rows used for VIF and factor tests on large inputs
+EXACT_ROC_MAX_ROWS = 100_000       # above this the ROC curve comes from score histograms
+DEFAULT_ROC_BINS = 1000
+LOGISTIC_CACHE_SIZE = 16
+
+# model_key -> fitted LogisticRegression, reused as a warm start for the next fit
+_logistic_model_cache: "OrderedDict[str, LogisticRegression]" = OrderedDict()
+
+def stratified_sample_indices(y: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Row indices of a class-proportional sample of about `size` rows"""
+    if len(y) <= size:
+        return np.arange(len(y))
+    rng = np.random.default_rng(seed)
+    picked = []
+    for label in np.unique(y):
+        members = np.flatnonzero(y == label)
+        take = max(1, int(round(size * len(members) / len(y))))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+def binned_roc(y_true: np.ndarray, scores: np.ndarray, bins: int = DEFAULT_ROC_BINS) -> Tuple[np.ndarray, np.ndarray, float]:
+    """ROC curve and AUC from positive/negative score histograms in O(n).
+
+    Scores are probabilities in [0, 1]. Ties inside a bin become a straight segment, so
+    the AUC error is bounded by the share of pairs that land in the same bin.
+    """
+    idx = np.minimum((np.asarray(scores) * bins).astype(np.int64), bins - 1)
+    positives = np.bincount(idx, weights=y_true, minlength=bins)
+    totals = np.bincount(idx, minlength=bins)
+    negatives = totals - positives
+
+    # Sweep the threshold from the highest bin down
+    tp = np.concatenate(([0.0], np.cumsum(positives[::-1])))
+    fp = np.concatenate(([0.0], np.cumsum(negatives[::-1])))
+    if tp[-1] == 0 or fp[-1] == 0:
+        raise ValueError("ROC needs both positive and negative samples")
+    tpr = tp / tp[-1]
+    fpr = fp / fp[-1]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, auc
+
+def calibration_summary(y_true: np.ndarray, prob: np.ndarray, bins: int = 10) -> Dict[str, Any]:
+    """Reliability curve, Brier score and expected calibration error for binary probabilities"""
+    idx = np.minimum((prob * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(idx, minlength=bins)
+    predicted_sum = np.bincount(idx, weights=prob, minlength=bins)
+    observed_sum = np.bincount(idx, weights=y_true, minlength=bins)
+    occupied = counts > 0
+    mean_predicted = predicted_sum[occupied] / counts[occupied]
+    observed_rate = observed_sum[occupied] / counts[occupied]
+    return {
+        "brier_score": float(np.mean((prob - y_true) ** 2)),
+        "expected_calibration_error": float(np.sum(counts[occupied] * np.abs(mean_predicted - observed_rate)) / len(prob)),
+        "reliability": [
+            {"bin_start": float(b / bins), "mean_predicted": float(mp), "observed_rate": float(orate), "count": int(c)}
+            for b, mp, orate, c in zip(np.flatnonzero(occupied), mean_predicted, observed_rate, counts[occupied])
+        ]
+    }
+
+def parse_logistic_options(data: dict, classes: List[Any]) -> Dict[str, Any]:
+    """Read solver, class weight, calibration and large-data options for a logistic fit"""
+    solver = data.get("solver", "lbfgs")
+    if solver not in LOGISTIC_SOLVERS:
+        raise HTTPException(status_code=400, detail=f"solver must be one of {', '.join(LOGISTIC_SOLVERS)}")
+
+    calibration = data.get("calibration")
+    if calibration and calibration not in CALIBRATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"calibration must be one of {', '.join(CALIBRATION_METHODS)}")
+
+    class_weight = data.get("class_weight")
+    if isinstance(class_weight, dict):
+        # JSON keys are strings; map them onto the encoded class indices
+        lookup = {str(label): i for i, label in enumerate(classes)}
+        unknown = [key for key in class_weight if str(key) not in lookup]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"class_weight refers to unknown classes: {unknown}")
+        class_weight = {lookup[str(key)]: float(value) for key, value in class_weight.items()}
+    elif class_weight not in (None, "balanced"):
+        raise HTTPException(status_code=400, detail="class_weight must be 'balanced' or a mapping of class to weight")
+
+    roc_method = data.get("roc_method", "auto")
+    if roc_method not in ("auto", "exact", "binned"):
+        raise HTTPException(status_code=400, detail="roc_method must be 'auto', 'exact' or 'binned'")
+
+    return {
+        "solver": solver,
+        "C": float(data.get("C", 1.0)),
+        "max_iter": int(data.get("max_iter", 1000)),
+        "class_weight": class_weight,
+        "calibration": calibration,
+        "warm_start": bool(data.get("warm_start", False)),
+        "model_key": data.get("model_key"),
+        "roc_method": roc_method,
+        "roc_bins": max(10, int(data.get("roc_bins", DEFAULT_ROC_BINS))),
+        "diagnostics_sample_size": max(100, int(data.get("diagnostics_sample_size", DIAGNOSTICS_SAMPLE_SIZE)))
+    }
+
+async def fit_logistic_regression(X, y: np.ndarray, column_names: List[str], terms: Optional[List[Dict[str, Any]]],
+                                  data: dict, output_options: Dict[str, Any],
+                                  bootstrap_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Logistic branch of /regression, built to stay linear in the number of rows.
+
+    Binary and multinomial targets are supported. Classification metrics use every row,
+    while VIF and factor tests run on a stratified sample. ROC/AUC come from score
+    histograms once the data is large, and a model fitted under the same `model_key`
+    is reused as a warm start.
+    """
+    unique_values = np.unique(y)
+    if len(unique_values) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Logistic regression requires at least two classes. Found {len(unique_values)} unique values."
+        )
+
+    # Encode the dependent variable as 0..K-1
+    label_encoder = LabelEncoder()
+    y_encoded = label_encoder.fit_transform(y)
+    classes = label_encoder.classes_.tolist()
+    n_classes = len(classes)
+    is_binary = n_classes == 2
+    options = parse_logistic_options(data, classes)
+    spec = {"regression_type": "logistic", "solver": options["solver"], "C": options["C"],
+            "class_weight": options["class_weight"], "max_iter": options["max_iter"]}
+    feature_names = column_names if len(column_names) == X.shape[1] else [f"X{i+1}" for i in range(X.shape[1])]
+
+    # Warm start from a cached model fitted on the same feature layout
+    model_key = options["model_key"] or f"{'|'.join(map(str, feature_names))}::{'|'.join(map(str, classes))}"
+    model = _make_estimator(spec)
+    warm_started = False
+    cached = _logistic_model_cache.get(model_key)
+    if (options["warm_start"] and cached is not None and options["solver"] != "liblinear"
+            and cached.coef_.shape[1] == X.shape[1] and len(cached.classes_) == n_classes):
+        model.set_params(warm_start=True)
+        model.coef_ = cached.coef_.copy()
+        model.intercept_ = cached.intercept_.copy()
+        warm_started = True
+
+    started = time.perf_counter()
+    model.fit(X, y_encoded)
+    fit_seconds = time.perf_counter() - started
+    model.set_params(warm_start=False)
+    _logistic_model_cache[model_key] = model
+    _logistic_model_cache.move_to_end(model_key)
+    while len(_logistic_model_cache) > LOGISTIC_CACHE_SIZE:
+        _logistic_model_cache.popitem(last=False)
+
+    # Probabilities, optionally recalibrated with cross-fitted Platt or isotonic scaling
+    if options["calibration"]:
+        calibrator = CalibratedClassifierCV(_make_estimator(spec), method=options["calibration"], cv=3)
+        calibrator.fit(X, y_encoded)
+        prob_matrix = calibrator.predict_proba(X)
+    else:
+        prob_matrix = model.predict_proba(X)
+    y_pred = np.argmax(prob_matrix, axis=1)
+
+    cm = confusion_matrix(y_encoded, y_pred).tolist()
+    report = classification_report(y_encoded, y_pred, output_dict=True, zero_division=0)
+
+    n = len(y_encoded)
+    use_binned = options["roc_method"] == "binned" or (options["roc_method"] == "auto" and n > EXACT_ROC_MAX_ROWS)
+
+    def roc_for(positive: np.ndarray, scores: np.ndarray):
+        if use_binned:
+            return binned_roc(positive, scores, options["roc_bins"])
+        fpr, tpr, _ = roc_curve(positive, scores)
+        return fpr, tpr, float(roc_auc_score(positive, scores))
+
+    auc_score = None
+    roc_points = None
+    roc_curves = None
+    try:
+        if is_binary:
+            fpr, tpr, auc_score = roc_for(y_encoded, prob_matrix[:, 1])
+            roc_points = thin_roc_curve(fpr, tpr, output_options["max_roc_points"])
+        else:
+            # One-vs-rest curve per class and the macro-averaged AUC
+            roc_curves, aucs = {}, []
+            for k, label in enumerate(classes):
+                fpr, tpr, auc_k = roc_for((y_encoded == k).astype(np.float64), prob_matrix[:, k])
+                roc_curves[str(label)] = {"auc": auc_k, "points": thin_roc_curve(fpr, tpr, output_options["max_roc_points"])}
+                aucs.append(auc_k)
+            auc_score = float(np.mean(aucs))
+    except ValueError as e:
+        print(f"Error calculating ROC: {e}")
+
+    # Diagnostics on a stratified sample so they stay bounded on large inputs
+    sample_idx = stratified_sample_indices(y_encoded, options["diagnostics_sample_size"])
+    X_sample = X[sample_idx]
+    y_sample = y_encoded[sample_idx]
+
+    vif_values = {}
+    factor_vif = {}
+    collinearity_warning = False
+    if terms is not None:
+        vif_values, factor_vif, collinearity_warning = generalized_vif(X_sample, terms)
+    elif X.shape[1] > 1:
+        try:
+            X_df = pd.DataFrame(X_sample, columns=feature_names)
+            for i, col in enumerate(X_df.columns):
+                try:
+                    vif = variance_inflation_factor(X_df.values, i)
+                    # Handle infinite VIF values
+                    vif_values[col] = float(vif) if np.isfinite(vif) else 10.0
+                    if vif > 5:  # Common threshold for multicollinearity concern
+                        collinearity_warning = True
+                except:
+                    vif_values[col] = 1.0  # Default safe value if calculation fails
+        except Exception as e:
+            print(f"Error calculating VIF: {e}")
+
+    def safe_float(value):
+        if value is None or np.isnan(value) or np.isinf(value):
+            return 0.0
+        return float(value)
+
+    result = {
+        "regression_type": "logistic",
+        "classes": classes,
+        "multinomial": not is_binary,
+        "solver": options["solver"],
+        "class_weight": options["class_weight"],
+        "model_key": model_key,
+        "warm_started": warm_started,
+        "n_iter": int(np.max(model.n_iter_)),
+        "fit_seconds": round(fit_seconds, 4),
+        "accuracy": safe_float(report["accuracy"]),
+        "confusion_matrix": cm,
+        "classification_report": {
+            k: {kk: safe_float(vv) for kk, vv in v.items()}
+            for k, v in report.items() if isinstance(v, dict)
+        },
+        "auc_score": safe_float(auc_score) if auc_score is not None else None,
+        "roc_method": "binned" if use_binned else "exact",
+        "diagnostics_sample_size": int(len(sample_idx)),
+        "vif_values": {k: safe_float(v) for k, v in vif_values.items()},
+        "collinearity_warning": collinearity_warning
+    }
+
+    if is_binary:
+        prob = prob_matrix[:, 1]
+        result.update({
+            "intercept": safe_float(model.intercept_[0]),
+            "coefficients": finite_list(model.coef_[0]),
+            "roc_points": roc_points,
+            "calibration": {"method": options["calibration"], **calibration_summary(y_encoded, prob)},
+            "probability_summary": summarize_distribution(prob, output_options["histogram_bins"]),
+            **shape_row_outputs({
+                "predicted_probabilities": prob,
+                "predicted_classes": y_pred.astype(np.int64)
+            }, output_options)
+        })
+    else:
+        confidence = prob_matrix[np.arange(n), y_pred]
+        result.update({
+            "intercepts": finite_list(model.intercept_),
+            "coefficients": [finite_list(row) for row in model.coef_],
+            "roc_curves": roc_curves,
+            "calibration": {"method": options["calibration"]},
+            "probability_summary": summarize_distribution(confidence, output_options["histogram_bins"]),
+            **shape_row_outputs({
+                "predicted_confidence": confidence,
+                "predicted_classes": y_pred.astype(np.int64)
+            }, output_options)
+        })
+
+    if terms is not None:
+        result["column_names"] = column_names
+        result["factors"] = describe_factors(terms, column_names)
+        result["factor_vif"] = factor_vif
+        # Compare full and reduced fits on the same sample rows
+        sample_model = model if len(sample_idx) == n else _make_estimator(spec).fit(X_sample, y_sample)
+        result["factor_tests"] = factor_group_tests(spec, X_sample, y_sample, terms, sample_model.predict_proba(X_sample))
+
+    if bootstrap_options:
+        if is_binary:
+            result["bootstrap"] = await run_bootstrap(
+                spec, X.astype(np.float64), y_encoded.astype(np.float64), prob_matrix[:, 1],
+                np.concatenate((model.intercept_, model.coef_[0])),
+                feature_names, bootstrap_options
+            )
+        else:
+            result["bootstrap"] = {"error": "Bootstrap intervals are only available for binary logistic regression"}
+
+    return result
+
 @app.post("/regression")
 async def perform_regression(data: dict):
     try:
@@ -574,110 +1874,40 @@ async def perform_regression(data: dict):
         column_names = data.get("column_names", [])
         regression_type = data.get("regression_type", "linear")
         polynomial_degree = data.get("polynomial_degree", 2)
+        alpha = data.get("alpha")  # Regularization strength for ridge/lasso
+        output_options = parse_row_output_options(data)
+        bootstrap_options = parse_bootstrap_options(data.get("bootstrap"))
+        
+        categorical_variables = data.get("categorical_variables") or {}
+        reference_levels = data.get("reference_levels") or {}
         
-        if len(y) == 0 or len(X_raw) == 0:
+        if len(y) == 0 or (len(X_raw) == 0 and not categorical_variables):
             raise HTTPException(status_code=400, detail="Missing dependent or independent variables")
         
         # Reshape X if it's a single feature
-        if len(X_raw.shape) == 1:
+        if len(X_raw) == 0:
+            X = np.empty((len(y), 0))
+        elif len(X_raw.shape) == 1:
             X = X_raw.reshape(-1, 1)
         else:
             X = X_raw
         
-        # For logistic regression, check if dependent variable is binary
-        if regression_type == "logistic":
-            # Convert to numeric if not already
-            unique_values = np.unique(y)
-            if len(unique_values) != 2:
+        # Encode categorical predictors into a sparse one-hot design
+        terms = None
+        if categorical_variables:
+            if regression_type == "polynomial":
                 raise HTTPException(
-                    status_code=400, 
-                    detail=f"Logistic regression requires a binary dependent variable. Found {len(unique_values)} unique values."
+                    status_code=400,
+                    detail="Polynomial regression does not support categorical variables"
                 )
-            
-            # Encode the dependent variable as 0/1 if needed
-            label_encoder = LabelEncoder()
-            y_encoded = label_encoder.fit_transform(y)
-            classes = label_encoder.classes_.tolist()
-            
-            # Create and fit logistic regression model
-            model = LogisticRegression(max_iter=1000)
-            model.fit(X, y_encoded)
-            
-            # Get predictions and probabilities
-            y_pred = model.predict(X)
-            y_prob = model.predict_proba(X)[:, 1]  # Probability of the positive class
-            
-            # Calculate confusion matrix
-            cm = confusion_matrix(y_encoded, y_pred).tolist()
-            
-            # Generate classification report
-            report = classification_report(y_encoded, y_pred, output_dict=True)
-            
-            # Calculate AUC score if possible
-            try:
-                auc_score = float(roc_auc_score(y_encoded, y_prob))
-                
-                # Get ROC curve points for plotting
-                fpr, tpr, _ = roc_curve(y_encoded, y_prob)
-                roc_points = [{"fpr": float(f), "tpr": float(t)} for f, t in zip(fpr, tpr)]
-            except:
-                auc_score = None
-                roc_points = None
-            
-            # Calculate VIF for multicollinearity warning
-            vif_values = {}
-            collinearity_warning = False
-            
-            if X.shape[1] > 1:
-                try:
-                    # Create a DataFrame for VIF calculation
-                    X_df = pd.DataFrame(X, columns=column_names if len(column_names) == X.shape[1] 
-                                      else [f"X{i+1}" for i in range(X.shape[1])])
-                    
-                    # Calculate VIF for each feature
-                    for i, col in enumerate(X_df.columns):
-                        try:
-                            vif = variance_inflation_factor(X_df.values, i)
-                            # Handle infinite VIF values
-                            if np.isfinite(vif):
-                                vif_values[col] = float(vif)
-                            else:
-                                vif_values[col] = 10.0  # Assign a high value for extreme collinearity
-                                
-                            if vif > 5:  # Common threshold for multicollinearity concern
-                                collinearity_warning = True
-                        except:
-                            vif_values[col] = 1.0  # Default safe value if calculation fails
-                except Exception as e:
-                    print(f"Error calculating VIF: {e}")
-            
-            # Handle NaN and Inf values
-            def safe_float(value):
-                if value is None or np.isnan(value) or np.isinf(value):
-                    return 0.0
-                return float(value)
-            
-            # Create result object with logistic regression metrics
-            result = {
-                "regression_type": "logistic",
-                "intercept": safe_float(model.intercept_[0]),
-                "coefficients": [safe_float(c) for c in model.coef_[0]],
-                "classes": classes,
-                "accuracy": safe_float(report["accuracy"]),
-                "confusion_matrix": cm,
-                "classification_report": {
-                    k: {kk: safe_float(vv) for kk, vv in v.items()} 
-                    for k, v in report.items() if isinstance(v, dict)
-                },
-                "auc_score": safe_float(auc_score) if auc_score is not None else None,
-                "roc_points": roc_points,
-                "predicted_probabilities": [safe_float(p) for p in y_prob.tolist()],
-                "predicted_classes": y_pred.tolist(),
-                "vif_values": {k: safe_float(v) for k, v in vif_values.items()},
-                "collinearity_warning": collinearity_warning
-            }
-            
-            return result
+            numeric_names = column_names if len(column_names) == X.shape[1] else [f"X{i+1}" for i in range(X.shape[1])]
+            X, column_names, terms = encode_categorical_design(
+                X.astype(np.float64), numeric_names, categorical_variables, reference_levels
+            )
+        
+        # Logistic regression has its own pipeline (solver choice, calibration, binned ROC)
+        if regression_type == "logistic":
+            return await fit_logistic_regression(X, y, column_names, terms, data, output_options, bootstrap_options)
                 
         # For other regression types, keep existing implementation
         elif regression_type == "linear":
@@ -696,11 +1926,11 @@ async def perform_regression(data: dict):
             model = LinearRegression()
             
         elif regression_type == "ridge":
-            model = Ridge(alpha=1.0)
+            model = Ridge(alpha=alpha if alpha is not None else 1.0)
             X_model = X
             
         elif regression_type == "lasso":
-            model = Lasso(alpha=0.1)
+            model = Lasso(alpha=alpha if alpha is not None else 0.1)
             X_model = X
             
         else:
@@ -757,24 +1987,12 @@ async def perform_regression(data: dict):
             p_value = 1.0
         
         # Calculate coefficient p-values
-        # First, get the design matrix with an intercept
-        if regression_type == "polynomial":
-            # For polynomial, use the full polynomial features
-            X_with_intercept = np.hstack((np.ones((X.shape[0], 1)), X_model))
-        else:
-            # For other models, just add an intercept column
-            X_with_intercept = np.hstack((np.ones((X.shape[0], 1)), X))
-            
-        # Calculate variance-covariance matrix
         try:
             # Handle singular matrices and other numerical issues
             mse = np.sum(residuals**2) / max(1, (n - p - 1))
             
-            # Use pseudo-inverse for more robust calculation
-            cov_matrix = mse * np.linalg.pinv(np.dot(X_with_intercept.T, X_with_intercept))
-            
-            # Get standard errors for coefficients
-            se = np.sqrt(np.diag(cov_matrix))
+            # Standard errors from mse * (X'X)^-1 on the design with an intercept column
+            se = coefficient_standard_errors(X_model, mse, terms)
             
             # t-values for coefficients
             t_values = np.concatenate(([model.intercept_], model.coef_)) / np.maximum(se, 1e-10)
@@ -785,17 +2003,21 @@ async def perform_regression(data: dict):
             # Separate intercept p-value and coefficient p-values
             intercept_p_value = float(p_values[0])
             coefficient_p_values = p_values[1:].tolist()
+            p_value_method = "normal_theory"
         except Exception as e:
             print(f"Error calculating p-values: {e}")
             # In case of numerical issues, use safe defaults
             intercept_p_value = 0.05
             coefficient_p_values = [0.05] * len(model.coef_)
+            p_value_method = "default"
         
         # Calculate VIF for multicollinearity (only for multiple regression)
         vif_values = {}
         collinearity_warning = False
         
-        if X.shape[1] > 1 and regression_type != "polynomial":
+        if terms is not None:
+            vif_values, factor_vif, collinearity_warning = generalized_vif(X, terms)
+        elif X.shape[1] > 1 and regression_type != "polynomial":
             try:
                 # Create a DataFrame for VIF calculation
                 X_df = pd.DataFrame(X, columns=column_names if len(column_names) == X.shape[1] 
@@ -851,18 +2073,276 @@ async def perform_regression(data: dict):
             "p_value": safe_float(p_value),
             "intercept_p_value": safe_float(intercept_p_value),
             "coefficient_p_values": [safe_float(p) for p in coefficient_p_values],
-            "predicted_values": [safe_float(p) for p in y_pred.tolist()],
-            "residuals": [safe_float(r) for r in residuals.tolist()],
+            "residual_summary": summarize_distribution(residuals, output_options["histogram_bins"]),
+            **shape_row_outputs({"predicted_values": y_pred, "residuals": residuals}, output_options),
             "vif_values": {k: safe_float(v) for k, v in vif_values.items()},
-            "collinearity_warning": collinearity_warning
+            "collinearity_warning": collinearity_warning,
+            "p_value_method": p_value_method
         }
         
+        if terms is not None:
+            result["column_names"] = column_names
+            result["factors"] = describe_factors(terms, column_names)
+            result["factor_vif"] = factor_vif
+            result["factor_tests"] = factor_group_tests(
+                {"regression_type": regression_type, "alpha": getattr(model, "alpha", 0.0)},
+                X_model, y, terms, y_pred
+            )
+        
+        if bootstrap_options:
+            feature_names = column_names if len(column_names) == X_model.shape[1] else [f"X{i+1}" for i in range(X_model.shape[1])]
+            spec = {"regression_type": regression_type, "alpha": getattr(model, "alpha", 0.0)}
+            bootstrap = await run_bootstrap(
+                spec, X_model.astype(np.float64), y.astype(np.float64), y_pred,
+                np.concatenate(([model.intercept_], model.coef_)),
+                feature_names, bootstrap_options
+            )
+            result["bootstrap"] = bootstrap
+            
+            # Replace the hard-coded fallback with bootstrap p-values when normal theory failed
+            if p_value_method == "default" and "coefficients" in bootstrap:
+                result["intercept_p_value"] = bootstrap["intercept"]["p_value"]
+                result["coefficient_p_values"] = [c["p_value"] for c in bootstrap["coefficients"]]
+                result["p_value_method"] = "bootstrap"
+        
         return result
         
     except Exception as e:
         print(f"Regression error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Model comparison: fit several regression specs against the same data in one call
+def _make_estimator(spec: Dict[str, Any]):
+    """Build the scikit-learn estimator for a model spec"""
+    regression_type = spec["regression_type"]
+    if regression_type in ("linear", "polynomial"):
+        return LinearRegression()
+    if regression_type == "ridge":
+        return Ridge(alpha=spec.get("alpha", 1.0))
+    if regression_type == "lasso":
+        return Lasso(alpha=spec.get("alpha", 0.1))
+    if regression_type == "logistic":
+        return LogisticRegression(
+            solver=spec.get("solver", "lbfgs"),
+            C=spec.get("C", 1.0),
+            class_weight=spec.get("class_weight"),
+            max_iter=spec.get("max_iter", 1000)
+        )
+    raise ValueError(f"Unsupported regression type: {regression_type}")
+
+def _model_spec_name(spec: Dict[str, Any]) -> str:
+    """Human readable label for a model spec"""
+    if spec["regression_type"] == "polynomial":
+        return f"polynomial (degree {spec.get('polynomial_degree', 2)})"
+    if spec["regression_type"] in ("ridge", "lasso") and "alpha" in spec:
+        return f"{spec['regression_type']} (alpha={spec['alpha']})"
+    return spec["regression_type"]
+
+LIKELIHOOD_FAMILIES = {"linear": "gaussian", "polynomial": "gaussian", "ridge": "gaussian",
+                       "lasso": "gaussian", "logistic": "bernoulli"}
+
+def _effective_parameters(spec: Dict[str, Any], model, X_model: np.ndarray) -> float:
+    """Effective number of slope parameters of a fitted Gaussian-family model.
+
+    Ridge shrinks every direction, so its degrees of freedom are trace(H) = sum d^2 / (d^2 + alpha)
+    over the singular values of the centered design; for the lasso the count of non-zero
+    coefficients is an unbiased estimate. Unpenalized fits use every column.
+    """
+    if spec["regression_type"] == "ridge":
+        singular = np.linalg.svd(X_model - X_model.mean(axis=0), compute_uv=False)
+        return float(np.sum(singular ** 2 / (singular ** 2 + model.alpha)))
+    if spec["regression_type"] == "lasso":
+        return float(np.count_nonzero(model.coef_))
+    return float(X_model.shape[1])
+
+def _evaluate_model_spec(spec: Dict[str, Any], X_model: np.ndarray, y: np.ndarray,
+                         folds: List[Tuple[np.ndarray, np.ndarray]]) -> Dict[str, Any]:
+    """Fit one spec on the full data and across the CV folds, returning ranking metrics only.
+
+    Runs on a worker thread; X_model and the fold indices are shared with the other
+    specs rather than copied.
+    """
+    started = time.perf_counter()
+    n = len(y)
+    is_logistic = spec["regression_type"] == "logistic"
+
+    model = _make_estimator(spec)
+    model.fit(X_model, y)
+    k = (X_model.shape[1] if is_logistic else _effective_parameters(spec, model, X_model)) + 1  # plus intercept
+
+    if is_logistic:
+        prob = np.clip(model.predict_proba(X_model)[:, 1], 1e-12, 1 - 1e-12)
+        log_likelihood = float(np.sum(y * np.log(prob) + (1 - y) * np.log(1 - prob)))
+        y_mean = np.clip(np.mean(y), 1e-12, 1 - 1e-12)
+        null_log_likelihood = float(np.sum(y * np.log(y_mean) + (1 - y) * np.log(1 - y_mean)))
+        r_squared = 1 - log_likelihood / null_log_likelihood if null_log_likelihood != 0 else 0.0  # McFadden
+        adjusted_r_squared = None
+    else:
+        residuals = y - model.predict(X_model)
+        rss = max(float(np.sum(residuals ** 2)), 1e-300)
+        tss = float(np.sum((y - np.mean(y)) ** 2))
+        log_likelihood = -n / 2 * (np.log(2 * np.pi) + np.log(rss / n) + 1)
+        r_squared = 1 - rss / tss if tss > 0 else 1.0
+        adjusted_r_squared = (1 - (1 - r_squared) * (n - 1) / (n - k)) if n - k > 0 else r_squared
+        k += 1  # The error variance is an estimated parameter too
+
+    # Out-of-fold squared error; for logistic models this is the Brier score, which is
+    # on the same scale as the MSE of a linear model fit to the 0/1 response
+    fold_errors = []
+    for train_idx, test_idx in folds:
+        try:
+            fold_model = _make_estimator(spec)
+            fold_model.fit(X_model[train_idx], y[train_idx])
+            if is_logistic:
+                predicted = fold_model.predict_proba(X_model[test_idx])[:, 1]
+            else:
+                predicted = fold_model.predict(X_model[test_idx])
+            fold_errors.append(float(np.mean((y[test_idx] - predicted) ** 2)))
+        except ValueError:
+            continue  # e.g. a training fold with a single class
+
+    return {
+        "aic": float(-2 * log_likelihood + 2 * k),
+        "bic": float(-2 * log_likelihood + k * np.log(n)),
+        "r_squared": float(r_squared),
+        "adjusted_r_squared": float(adjusted_r_squared) if adjusted_r_squared is not None else None,
+        "cv_error": float(np.mean(fold_errors)) if fold_errors else None,
+        "cv_folds_completed": len(fold_errors),
+        "fit_seconds": round(time.perf_counter() - started, 4),
+        "family": LIKELIHOOD_FAMILIES[spec["regression_type"]],
+        "effective_parameters": round(float(k), 4)
+    }
+
+@app.post("/regression/compare")
+async def compare_regression_models(data: dict):
+    """Fit several regression specs on one dataset concurrently and rank them.
+
+    The data is parsed once and each distinct design matrix (raw features, or polynomial
+    features per degree) is built once and shared by every spec that needs it. Only the
+    winning spec gets the full /regression output.
+
+    AIC and BIC count ridge/lasso parameters by their effective degrees of freedom and are
+    only comparable within one likelihood family, so ranking by them rejects a spec set that
+    mixes Gaussian models with logistic (Bernoulli) ones; the default set then leaves
+    logistic out.
+    """
+    try:
+        y = np.asarray(data.get("dependent_variable", []), dtype=np.float64)
+        X = np.asarray(data.get("independent_variables", []), dtype=np.float64)
+        column_names = data.get("column_names", [])
+        rank_by = data.get("rank_by", "cv_error")
+        cv_folds = int(data.get("cv_folds", 5))
+        seed = data.get("seed", 0)
+
+        if len(y) == 0 or len(X) == 0:
+            raise HTTPException(status_code=400, detail="Missing dependent or independent variables")
+        if rank_by not in ("aic", "bic", "adjusted_r_squared", "cv_error"):
+            raise HTTPException(status_code=400, detail=f"Unsupported rank_by metric: {rank_by}")
+
+        if X.ndim == 1:
+            X = X.reshape(-1, 1)
+
+        is_binary = len(np.unique(y)) == 2
+        specs = data.get("models")
+        if not specs:
+            specs = [{"regression_type": "linear"}, {"regression_type": "ridge"}, {"regression_type": "lasso"}]
+            if X.shape[1] == 1:
+                specs += [{"regression_type": "polynomial", "polynomial_degree": d} for d in (2, 3)]
+            if is_binary and rank_by not in ("aic", "bic"):
+                specs.append({"regression_type": "logistic"})
+        elif rank_by in ("aic", "bic"):
+            families = {LIKELIHOOD_FAMILIES.get(spec.get("regression_type")) for spec in specs} - {None}
+            if len(families) > 1:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{rank_by.upper()} is not comparable between Gaussian and logistic (Bernoulli) models; "
+                           "compare them separately or rank by cv_error"
+                )
+
+        # Build each design matrix once
+        designs = {"raw": X}
+        for spec in specs:
+            if spec.get("regression_type") == "polynomial" and X.shape[1] == 1:
+                degree = int(spec.get("polynomial_degree", 2))
+                if degree not in designs:
+                    designs[degree] = PolynomialFeatures(degree=degree).fit_transform(X)[:, 1:]
+
+        y_binary = LabelEncoder().fit_transform(y).astype(np.float64) if is_binary else None
+        folds = list(KFold(n_splits=min(cv_folds, len(y)), shuffle=True, random_state=seed).split(X)) if cv_folds >= 2 else []
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+        failed = []
+        for spec in specs:
+            regression_type = spec.get("regression_type")
+            if regression_type == "polynomial" and X.shape[1] != 1:
+                failed.append({"name": _model_spec_name(spec), "spec": spec,
+                               "error": "Polynomial regression currently supports only one independent variable"})
+                continue
+            if regression_type == "logistic" and not is_binary:
+                failed.append({"name": _model_spec_name(spec), "spec": spec,
+                               "error": "Logistic regression requires a binary dependent variable"})
+                continue
+            if regression_type not in ("linear", "polynomial", "ridge", "lasso", "logistic"):
+                failed.append({"name": _model_spec_name(spec) if regression_type else "unknown", "spec": spec,
+                               "error": f"Unsupported regression type: {regression_type}"})
+                continue
+
+            X_model = designs[int(spec.get("polynomial_degree", 2))] if regression_type == "polynomial" else designs["raw"]
+            y_model = y_binary if regression_type == "logistic" else y
+            # Threads share the design matrices; numpy and the sklearn solvers release the GIL
+            tasks.append((spec, loop.run_in_executor(None, _evaluate_model_spec, spec, X_model, y_model, folds)))
+
+        ranked = []
+        for spec, task in tasks:
+            try:
+                metrics = await task
+                ranked.append({"name": _model_spec_name(spec), "spec": spec, **metrics})
+            except Exception as e:
+                failed.append({"name": _model_spec_name(spec), "spec": spec, "error": str(e)})
+
+        higher_is_better = rank_by == "adjusted_r_squared"
+        def sort_key(entry):
+            value = entry.get(rank_by)
+            if value is None or not np.isfinite(value):
+                return float("inf")
+            return -value if higher_is_better else value
+
+        ranked.sort(key=sort_key)
+        for position, entry in enumerate(ranked, 1):
+            entry["rank"] = position
+
+        best_model = None
+        if ranked:
+            winner = ranked[0]["spec"]
+            best_model = {
+                "name": ranked[0]["name"],
+                "spec": winner,
+                # Refit with every option of the ranked spec (solver, C, class_weight, calibration, ...)
+                "result": await perform_regression({
+                    **{key: value for key, value in winner.items() if key != "name"},
+                    "dependent_variable": y,
+                    "independent_variables": X,
+                    "column_names": column_names,
+                    "polynomial_degree": int(winner.get("polynomial_degree", 2)),
+                    **{key: data[key] for key in ("row_output", "max_rows", "max_roc_points", "histogram_bins") if key in data}
+                })
+            }
+
+        return {
+            "rank_by": rank_by,
+            "cv_folds": len(folds),
+            "models": ranked,
+            "failed": failed,
+            "best_model": best_model
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Model comparison error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/predict")
 async def predict_outcome(data: dict):
     try:
@@ -1019,94 +2499,950 @@ async def predict_outcome(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 # AI query endpoint
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import traceback
 import json
 from scipy.stats import pearsonr
 import numpy as np
 
-@app.post("/api/ask")
-async def ask_ai(request: Request):
+# Mergeable column sketches. Each one has bounded memory, can be built per chunk (or per
+# worker) and merged, and round-trips through to_dict/from_dict for caching.
+class HyperLogLog:
+    """Distinct-count estimate from 2**precision one-byte registers (~1.6% error at 12)"""
+
+    def __init__(self, precision: int = 12, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add 64-bit hashes (e.g. from pd.util.hash_array)"""
+        if not len(hashes):
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Bit length of the remaining bits, computed from two exactly representable 32-bit halves
+        high = (rest >> np.uint64(32)).astype(np.float64)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        bit_length = np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+        rank = ((64 - p) - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return cls(data["precision"], registers)
+
+class SpaceSaving:
+    """Top-k frequent values (Space-Saving). Counts may overestimate by at most `error`."""
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counters: Dict[Any, List[int]] = {}  # value -> [count, error]
+        # Upper bound on the count of any value not being tracked
+        self.floor = 0
+
+    def update(self, values: np.ndarray):
+        if not len(values):
+            return
+        counts = pd.Series(values, dtype=object).value_counts()
+        chunk = SpaceSaving(self.capacity)
+        chunk.counters = {value: [int(count), 0] for value, count in counts.iloc[:self.capacity].items()}
+        chunk.floor = int(counts.iloc[self.capacity]) if len(counts) > self.capacity else 0
+        self.merge(chunk)
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        merged = {}
+        for value in set(self.counters) | set(other.counters):
+            count1, error1 = self.counters.get(value, (self.floor, self.floor))
+            count2, error2 = other.counters.get(value, (other.floor, other.floor))
+            merged[value] = [count1 + count2, error1 + error2]
+        ranked = sorted(merged.items(), key=lambda item: -item[1][0])
+        dropped = ranked[self.capacity][1][0] if len(ranked) > self.capacity else 0
+        self.counters = dict(ranked[:self.capacity])
+        self.floor = max(self.floor + other.floor, dropped)
+        return self
+
+    def top(self, n: int = 5) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counters.items(), key=lambda item: -item[1][0])[:n]
+        return [{"value": value, "count": count, "error": error} for value, (count, error) in ranked]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "floor": self.floor,
+                "items": [[value, count, error] for value, (count, error) in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data["capacity"])
+        sketch.floor = data["floor"]
+        sketch.counters = {value: [count, error] for value, count, error in data["items"]}
+        return sketch
+
+class TDigest:
+    """Quantile sketch: at most ~compression/2 weighted centroids, dense at the tails"""
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray):
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(values, np.ones(len(values)))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.weights):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(other.means, other.weights)
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        # Group neighbours that fall in the same unit of the k1 scale function
+        q = (np.cumsum(weights) - weights / 2) / weights.sum()
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+        cluster = np.floor(k + self.compression / 4).astype(np.int64)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(cluster)) + 1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not len(self.weights):
+            return None
+        total = self.weights.sum()
+        midpoints = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * total, np.concatenate([[0], midpoints, [total]]),
+                               np.concatenate([[self.min], self.means, [self.max]])))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"compression": self.compression, "means": self.means.tolist(), "weights": self.weights.tolist(),
+                "min": self.min if len(self.weights) else None, "max": self.max if len(self.weights) else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        sketch = cls(data["compression"])
+        sketch.means = np.array(data["means"], dtype=float)
+        sketch.weights = np.array(data["weights"], dtype=float)
+        if len(sketch.weights):
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+class ColumnSketch:
+    """Bounded-memory, mergeable summary of one column: distinct count, frequent values, quantiles"""
+
+    def __init__(self):
+        self.rows = 0
+        self.missing = 0
+        self.distinct = HyperLogLog()
+        self.frequent = SpaceSaving()
+        self.quantiles = TDigest()
+
+    def update(self, cells: np.ndarray, present: np.ndarray, numeric: np.ndarray):
+        """Add one chunk of a column (raw cells, non-missing mask and coerced numbers)"""
+        values = cells[present]
+        self.rows += len(cells)
+        self.missing += len(cells) - len(values)
+        if len(values):
+            self.distinct.add_hashes(pd.util.hash_array(values.astype(object)))
+            self.frequent.update(values)
+        self.quantiles.update(numeric)
+        return self
+
+    def merge(self, other: "ColumnSketch") -> "ColumnSketch":
+        self.rows += other.rows
+        self.missing += other.missing
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+        self.quantiles.merge(other.quantiles)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        frequent = sum(sys.getsizeof(value) + sys.getsizeof(entry) for value, entry in self.frequent.counters.items())
+        return (self.distinct.registers.nbytes + self.quantiles.means.nbytes + self.quantiles.weights.nbytes
+                + sys.getsizeof(self.frequent.counters) + frequent)
+
+    def most_common(self) -> Optional[Any]:
+        top = self.frequent.top(1)
+        return top[0]["value"] if top else None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "missing": self.missing,
+            "distinct_estimate": self.distinct.count(),
+            "most_common": self.frequent.top(5),
+            "quantiles": {f"p{int(q * 100):02d}": self.quantiles.quantile(q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "missing": self.missing, "distinct": self.distinct.to_dict(),
+                "frequent": self.frequent.to_dict(), "quantiles": self.quantiles.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ColumnSketch":
+        sketch = cls()
+        sketch.rows, sketch.missing = data["rows"], data["missing"]
+        sketch.distinct = HyperLogLog.from_dict(data["distinct"])
+        sketch.frequent = SpaceSaving.from_dict(data["frequent"])
+        sketch.quantiles = TDigest.from_dict(data["quantiles"])
+        return sketch
+
+SKETCH_CHUNK_ROWS = 65536
+# Above this many rows, unique counts come from the HyperLogLog sketch instead of a hash set
+EXACT_DISTINCT_MAX_ROWS = int(os.getenv("EXACT_DISTINCT_MAX_ROWS", "1000000"))
+
+# Dataset profiling shared by /api/ask, /api/data-cleaning and the report pipeline
+# Wide sheets are profiled in column shards on the compute pool; small ones aren't worth
+# the inter-process hop.
+PROFILE_PARALLEL_MIN_CELLS = int(os.getenv("PROFILE_PARALLEL_MIN_CELLS", "500000"))
+PROFILE_PARALLEL_MIN_COLUMNS = 32
+PROFILE_SHARD_MIN_COLUMNS = 16
+
+def plan_profile_shards(row_count: int, column_count: int) -> int:
+    """How many column shards to profile a sheet in (1 = serially in this process)"""
+    if (COMPUTE_POOL_WORKERS < 2 or column_count < PROFILE_PARALLEL_MIN_COLUMNS
+            or row_count * column_count < PROFILE_PARALLEL_MIN_CELLS):
+        return 1
+    # A couple of shards per worker evens out columns that are slower to type
+    return max(1, min(2 * COMPUTE_POOL_WORKERS, column_count // PROFILE_SHARD_MIN_COLUMNS))
+
+def _profile_column_shard(headers: List[Any], cells: np.ndarray, block_name: str,
+                          shape: Tuple[int, int], col_start: int) -> Dict[str, Any]:
+    """Compute-pool worker: profile a slice of columns, writing its floats into the shared block"""
+    from multiprocessing import shared_memory
+
+    started = time.perf_counter()
+    shard = DatasetProfile.from_cells(headers, cells)
+    column_types = shard.column_types()
+    block = shared_memory.SharedMemory(name=block_name)
     try:
-        data = await request.json()
-        query = data.get("query")
-        spreadsheet_data = data.get("data")
+        numeric = np.ndarray(shape, dtype=float, buffer=block.buf, order="F")
+        numeric[:, col_start:col_start + len(headers)] = shard.numeric
+        del numeric
+    finally:
+        block.close()
+    result = {field: getattr(shard, field) for field in
+              ("count", "missing", "numeric_count", "sum", "mean", "min", "max", "std", "median", "unique")}
+    result.update(column_types=column_types, sketches=shard._sketches, seconds=time.perf_counter() - started)
+    return result
 
-        if not query or not spreadsheet_data:
-            return JSONResponse(
-                content={"error": "Missing query or spreadsheet data"},
-                status_code=400,
-                headers={"Access-Control-Allow-Origin": "*"}
-            )
+OBJECT_SIZE_SAMPLE = 1000
+
+def estimate_object_bytes(values: np.ndarray) -> int:
+    """Total sys.getsizeof of an object array's elements, extrapolated from an evenly spaced sample"""
+    if not len(values):
+        return 0
+    step = max(1, len(values) // OBJECT_SIZE_SAMPLE)
+    sample = values[::step]
+    return int(sum(sys.getsizeof(value) for value in sample) * len(values) / len(sample))
+
+_cell_type = np.frompyfunc(type, 1, 1)  # element-wise type() of an object array, looped in C
+
+def _text_cell_hashes(values: np.ndarray) -> np.ndarray:
+    """64-bit hashes of text cells after trimming, lower-casing and collapsing whitespace"""
+    normalized = (pd.Series(values).astype(str).str.strip().str.lower()
+                  .str.replace(r"\s+", " ", regex=True))
+    return pd.util.hash_array(normalized.to_numpy(dtype=object))
 
-        headers = spreadsheet_data[0] if spreadsheet_data and len(spreadsheet_data) > 0 else []
+# infer_dtype kinds that cannot hold a bool, so the float cast is safe to try directly
+NUMERIC_FAST_PATH_KINDS = ("integer", "floating", "mixed-integer-float", "decimal", "string", "empty")
 
-        column_stats = {}
-        for col_idx, header in enumerate(headers):
+class DatasetProfile:
+    """Typed columns and per-column statistics for one sheet.
+
+    The sheet is converted once into an object cell matrix, a missing-value mask and a
+    float matrix (NaN where a cell is missing or not a number, thousands separators
+    stripped). Column statistics are computed column-wise with numpy, so every endpoint
+    that needs counts, ranges or correlations reads them from here instead of re-parsing
+    the rows. Text columns are dictionary-encoded on demand (see `encoded`) and headers
+    are indexed once, so a report built on one profile parses each sheet a single time.
+    """
+
+    def __init__(self, spreadsheet_data: List[List[Any]], sheet_hash: Optional[str] = None, parallel: bool = True):
+        headers = list(spreadsheet_data[0]) if spreadsheet_data else []
+        rows = spreadsheet_data[1:] if spreadsheet_data else []
+        width = len(headers)
+
+        if rows and width:
+            # Ragged rows are padded with None and extra cells beyond the header dropped
+            frame = pd.DataFrame(rows, dtype=object).reindex(columns=range(width))
+            cells = frame.to_numpy(dtype=object)
+        else:
+            cells = np.empty((len(rows), width), dtype=object)
+        self._setup(headers, cells, sheet_hash, parallel)
+
+    @classmethod
+    def from_cells(cls, headers: List[Any], cells: np.ndarray, sheet_hash: Optional[str] = None,
+                   parallel: bool = False) -> "DatasetProfile":
+        """Profile an already-built object cell matrix (rows x columns)"""
+        profile = cls.__new__(cls)
+        profile._setup(list(headers), cells, sheet_hash, parallel)
+        return profile
+
+    def _setup(self, headers: List[Any], cells: np.ndarray, sheet_hash: Optional[str], parallel: bool):
+        self.hash = sheet_hash
+        self.headers = headers
+        self.header_index = {}
+        for j, header in enumerate(headers):
+            self.header_index.setdefault(header, j)
+        self.row_count = cells.shape[0]
+        self.cells = cells
+        self.present = ~pd.isna(self.cells) & (self.cells != '')
+        self._sketches = {}
+        self._encoded = {}
+        self._summary = None
+        self._column_types = None
+        self._cell_hashes = None
+        self._cells_bytes = None
+
+        shards = plan_profile_shards(self.row_count, len(headers)) if parallel else 1
+        if shards > 1:
             try:
-                values = [row[col_idx] for row in spreadsheet_data[1:] if col_idx < len(row) and row[col_idx] != '']
-                if not values:
-                    continue
-                numeric_values = []
-                for val in values:
-                    try:
-                        num_val = float(str(val).replace(',', ''))
-                        numeric_values.append(num_val)
-                    except (ValueError, TypeError):
-                        pass
+                self._profile_columns_parallel(shards)
+                return
+            except Exception as e:
+                print(f"Parallel profiling failed, profiling serially: {str(e)}")
+        started = time.perf_counter()
+        self._profile_columns()
+        self.build_info = {"shards": 1, "parallel": False, "shard_seconds": [round(time.perf_counter() - started, 4)]}
+
+    def _profile_columns(self):
+        width = self.column_count
+        self.numeric = np.full(self.cells.shape, np.nan)
+        for j in range(width):
+            self.numeric[:, j] = self._coerce_numeric(self.cells[:, j], self.present[:, j])
+        self.is_numeric = ~np.isnan(self.numeric)
+
+        self.count = self.present.sum(axis=0)
+        self.missing = self.row_count - self.count
+        self.numeric_count = self.is_numeric.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            has_numbers = self.numeric_count > 0
+            self.sum = np.where(self.is_numeric, self.numeric, 0.0).sum(axis=0)
+            self.mean = np.where(has_numbers, self.sum / np.maximum(self.numeric_count, 1), np.nan)
+            self.min = np.where(has_numbers, np.where(self.is_numeric, self.numeric, np.inf).min(axis=0, initial=np.inf), np.nan)
+            self.max = np.where(has_numbers, np.where(self.is_numeric, self.numeric, -np.inf).max(axis=0, initial=-np.inf), np.nan)
+            centered = np.where(self.is_numeric, self.numeric - self.mean, 0.0)
+            self.std = np.where(has_numbers, np.sqrt((centered ** 2).sum(axis=0) / np.maximum(self.numeric_count, 1)), np.nan)
+        self.median = np.full(width, np.nan)
+        self.unique = np.zeros(width, dtype=int)
+        for j in range(width):
+            numbers = self.numeric[self.is_numeric[:, j], j]
+            if len(numbers):
+                mid = len(numbers) // 2
+                if len(numbers) % 2:
+                    self.median[j] = np.partition(numbers, mid)[mid]
+                else:
+                    lower, upper = np.partition(numbers, [mid - 1, mid])[[mid - 1, mid]]
+                    self.median[j] = (lower + upper) / 2
+            # Fully numeric columns hash floats; anything else hashes the raw cells
+            if self.row_count > EXACT_DISTINCT_MAX_ROWS:
+                self.unique[j] = self.sketch(j).distinct.count()
+            elif self.count[j] and self.numeric_count[j] == self.count[j]:
+                self.unique[j] = len(pd.unique(numbers))
+            else:
+                self.unique[j] = len(pd.unique(self.cells[self.present[:, j], j]))
+
+    def _profile_columns_parallel(self, shards: int):
+        """Profile column shards on the compute pool and stitch the results in shard order.
+
+        Object cells can't live in shared memory, so each worker receives only its own
+        columns; the float matrix comes back through one shared block instead of being
+        pickled, and the per-column stats, inferred types and sketches are small.
+        """
+        from multiprocessing import shared_memory
+
+        started = time.perf_counter()
+        bounds = np.linspace(0, self.column_count, shards + 1).astype(int)
+        block = shared_memory.SharedMemory(create=True, size=max(self.cells.size * 8, 1))
+        try:
+            # Column-major, so each shard writes one contiguous slab
+            numeric = np.ndarray(self.cells.shape, dtype=float, buffer=block.buf, order="F")
+            pool = get_compute_pool()
+            futures = [
+                pool.submit(_profile_column_shard, self.headers[lo:hi], self.cells[:, lo:hi],
+                            block.name, self.cells.shape, int(lo))
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+            ]
+            results = [future.result() for future in futures]
+            self.numeric = np.array(numeric, order="C")
+        finally:
+            block.close()
+            block.unlink()
+
+        self.is_numeric = ~np.isnan(self.numeric)
+        for field in ("count", "missing", "numeric_count", "sum", "mean", "min", "max", "std", "median", "unique"):
+            setattr(self, field, np.concatenate([result[field] for result in results]))
+        self._column_types = [inferred for result in results for inferred in result["column_types"]]
+        for lo, result in zip(bounds[:-1], results):
+            self._sketches.update({int(lo) + j: sketch for j, sketch in result["sketches"].items()})
+        self.build_info = {
+            "shards": shards,
+            "parallel": True,
+            "shard_columns": np.diff(bounds).tolist(),
+            "shard_seconds": [round(result["seconds"], 4) for result in results],
+            "seconds": round(time.perf_counter() - started, 4)
+        }
+
+    @staticmethod
+    def _coerce_numeric(column: np.ndarray, present: np.ndarray) -> np.ndarray:
+        # Booleans are not numbers here, although float() and pd.to_numeric would make them 1/0
+        kind = pd.api.types.infer_dtype(column[present], skipna=True)
+        if kind == "boolean":
+            return np.full(len(column), np.nan)
+        if kind in NUMERIC_FAST_PATH_KINDS:
+            try:
+                # Fast path: every present cell is already a number or a plain numeric string
+                return np.where(present, column, np.nan).astype(float)
+            except (ValueError, TypeError):
+                pass
+        else:
+            present = present & ~pd.Series(_cell_type(column)).isin([bool, np.bool_]).to_numpy()
+        series = pd.Series(np.where(present, column, None))
+        values = pd.to_numeric(series, errors="coerce")
+        retry = values.isna().to_numpy() & present
+        if retry.any():
+            cleaned = series[retry].astype(str).str.replace(",", "", regex=False).str.strip()
+            values[retry] = pd.to_numeric(cleaned, errors="coerce")
+        return values.to_numpy(dtype=float)
+
+    @property
+    def column_count(self) -> int:
+        return len(self.headers)
+
+    @property
+    def nbytes(self) -> int:
+        """Estimated memory footprint: arrays, the cell objects themselves and the lazy caches"""
+        if self._cells_bytes is None:
+            self._cells_bytes = self.cells.nbytes + estimate_object_bytes(self.cells[self.present])
+        total = self._cells_bytes + self.present.nbytes + self.numeric.nbytes + self.is_numeric.nbytes
+        for codes, categories in self._encoded.values():
+            total += codes.nbytes + categories.nbytes + estimate_object_bytes(categories)
+        total += sum(sketch.nbytes for sketch in self._sketches.values())
+        if self._cell_hashes is not None:
+            total += self._cell_hashes.nbytes
+        return total
+
+    def values(self, col_idx: int) -> np.ndarray:
+        """Non-missing cells of a column, in row order"""
+        return self.cells[self.present[:, col_idx], col_idx]
+
+    def numeric_values(self, col_idx: int) -> np.ndarray:
+        """Numeric cells of a column, in row order"""
+        return self.numeric[self.is_numeric[:, col_idx], col_idx]
+
+    def all_numeric(self, col_idx: int) -> bool:
+        """True when the column has values and every one of them is a number"""
+        return bool(self.count[col_idx]) and self.numeric_count[col_idx] == self.count[col_idx]
+
+    def column_index(self, header: Any) -> int:
+        """Position of the first column with this header; ValueError when there is none"""
+        try:
+            return self.header_index[header]
+        except KeyError:
+            raise ValueError(f"{header!r} is not a column") from None
 
+    def encoded(self, col_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Dictionary encoding of a column as text: (int codes, -1 where missing; distinct strings)"""
+        if col_idx not in self._encoded:
+            codes = np.full(self.row_count, -1, dtype=np.int64)
+            present = self.present[:, col_idx]
+            labels = pd.Series(self.cells[present, col_idx], dtype=object).astype(str)
+            present_codes, categories = pd.factorize(labels)
+            codes[present] = present_codes
+            self._encoded[col_idx] = (codes, np.asarray(categories, dtype=object))
+        return self._encoded[col_idx]
+
+    def labels(self, col_idx: int) -> List[str]:
+        """Column as display strings ('' where missing), decoded from the dictionary encoding"""
+        codes, categories = self.encoded(col_idx)
+        return np.append(categories, "")[codes].tolist()
+
+    def numeric_or_zero(self, col_idx: int) -> np.ndarray:
+        """Full-length float column with missing or non-numeric cells as 0, for charts"""
+        return np.where(self.is_numeric[:, col_idx], self.numeric[:, col_idx], 0.0)
+
+    def numeric_stats(self, col_idx: int) -> Dict[str, float]:
+        return {
+            "min": float(self.min[col_idx]),
+            "max": float(self.max[col_idx]),
+            "mean": float(self.mean[col_idx]),
+            "median": float(self.median[col_idx]),
+            "std": float(self.std[col_idx])
+        }
+
+    def sketch(self, col_idx: int) -> ColumnSketch:
+        """Column sketch built chunk by chunk and merged, computed once per column"""
+        if col_idx not in self._sketches:
+            sketch = ColumnSketch()
+            for start in range(0, self.row_count, SKETCH_CHUNK_ROWS):
+                rows = slice(start, start + SKETCH_CHUNK_ROWS)
+                sketch.merge(ColumnSketch().update(self.cells[rows, col_idx], self.present[rows, col_idx],
+                                                   self.numeric[rows, col_idx]))
+            self._sketches[col_idx] = sketch
+        return self._sketches[col_idx]
+
+    def cell_hashes(self) -> np.ndarray:
+        """64-bit hash of every normalized cell (0 for missing), computed once per profile.
+
+        Numbers hash by value, so "1,000" and 1000 match; text is trimmed, lower-cased and
+        has its whitespace collapsed.
+        """
+        if self._cell_hashes is None:
+            hashes = np.zeros(self.cells.shape, dtype=np.uint64)
+            for j in range(self.column_count):
+                numeric = self.is_numeric[:, j]
+                if numeric.any():
+                    hashes[numeric, j] = pd.util.hash_array(self.numeric[numeric, j])
+                text = self.present[:, j] & ~numeric
+                if text.any():
+                    hashes[text, j] = _text_cell_hashes(self.cells[text, j])
+            # Keep 0 free as the missing marker
+            hashes[self.present & (hashes == 0)] = 1
+            self._cell_hashes = hashes
+        return self._cell_hashes
+
+    def column_types(self) -> List[Dict[str, Any]]:
+        """Inferred type of every column (see infer_column_type), computed once per profile"""
+        if self._column_types is None:
+            self._column_types = [infer_column_type(self, j) for j in range(self.column_count)]
+        return self._column_types
+
+    def correlations(self, col_indices: Optional[List[int]] = None) -> np.ndarray:
+        """Pearson correlations over pairwise-complete finite values (NaN where undefined)"""
+        if col_indices is None:
+            col_indices = [j for j in range(self.column_count) if self.numeric_count[j] > 0]
+        X = self.numeric[:, col_indices]
+        mask = np.isfinite(X)
+        M = mask.astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centers = np.where(mask, X, 0.0).sum(axis=0) / np.maximum(M.sum(axis=0), 1)
+            Xc = np.where(mask, X - centers, 0.0)
+            pair_counts = M.T @ M
+            # sums[i, j] = sum of column i over rows where columns i and j are both present
+            sums = Xc.T @ M
+            squares = (Xc ** 2).T @ M
+            cross = Xc.T @ Xc
+            cov = cross - sums * sums.T / pair_counts
+            var = squares - sums ** 2 / pair_counts
+            r = cov / np.sqrt(var * var.T)
+        r[pair_counts < 2] = np.nan
+        return np.clip(r, -1.0, 1.0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Column statistics and pairwise correlations used to ground AI answers"""
+        if self._summary is None:
+            column_stats = {}
+            for j, header in enumerate(self.headers):
+                if not self.count[j]:
+                    continue
                 stats = {
-                    "count": len(values),
-                    "unique": len(set(values)),
-                    "missing": len(spreadsheet_data[1:]) - len(values)
+                    "count": int(self.count[j]),
+                    "unique": int(self.unique[j]),
+                    "missing": int(self.missing[j])
                 }
+                if self.numeric_count[j]:
+                    stats.update(self.numeric_stats(j))
+                column_stats[header] = stats
 
-                if numeric_values:
-                    stats.update({
-                        "min": min(numeric_values),
-                        "max": max(numeric_values),
-                        "mean": sum(numeric_values) / len(numeric_values),
-                        "median": sorted(numeric_values)[len(numeric_values)//2],
-                        "std": np.std(numeric_values) if len(numeric_values) > 1 else 0
-                    })
+            correlations = {}
+            numeric_cols = [j for j in range(self.column_count) if self.count[j] and self.numeric_count[j]]
+            if len(numeric_cols) >= 2:
+                r = self.correlations(numeric_cols)
+                for a, j in enumerate(numeric_cols):
+                    correlations[self.headers[j]] = {
+                        self.headers[k]: (float(r[a, b]) if np.isfinite(r[a, b]) else None)
+                        for b, k in enumerate(numeric_cols) if k != j
+                    }
 
-                column_stats[header] = stats
+            self._summary = {
+                "row_count": self.row_count + (1 if self.headers else 0),  # header row included, as the prompts always have
+                "column_count": self.column_count,
+                "column_stats": column_stats,
+                "correlations": correlations
+            }
+        return self._summary
 
-            except Exception as e:
-                print(f"Error processing column {header}: {str(e)}")
+# Column type inference thresholds (shares of non-empty values)
+TYPE_MATCH_THRESHOLD = 0.7
+CATEGORICAL_UNIQUE_RATIO = 0.3
+BOOLEAN_TOKENS = {"true", "false", "yes", "no", "y", "n", "t", "f"}
+DATE_FORMATS = [
+    "%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d", "%d.%m.%Y", "%m-%d-%Y", "%d-%m-%Y", "%Y.%m.%d",
+    "%m/%d/%y", "%d/%m/%y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M",
+    "%m/%d/%Y %H:%M", "%b %d, %Y", "%d %b %Y", "%B %d, %Y", "%d %B %Y", "%Y%m%d"
+]
+DATE_FORMAT_SAMPLE = 200
+
+def infer_date_format(strings: pd.Series) -> Tuple[Optional[str], float]:
+    """Pick the DATE_FORMATS entry that parses most of a sample of distinct values"""
+    sample = pd.Series(strings.unique()[:DATE_FORMAT_SAMPLE])
+    # Cheap screen: dates contain a digit and at most a few separators
+    if not len(sample) or not sample.str.contains(r"\d", regex=True).mean() > 0.5:
+        return None, 0.0
+    best_format, best_rate = None, 0.0
+    for fmt in DATE_FORMATS:
+        rate = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+        if rate > best_rate:
+            best_format, best_rate = fmt, rate
+            if rate == 1.0:
+                break
+    return best_format, best_rate
+
+def infer_column_type(profile: "DatasetProfile", col_idx: int) -> Dict[str, Any]:
+    """Type, confidence and per-type match shares for one profiled column"""
+    non_empty = int(profile.count[col_idx])
+    if not non_empty:
+        return {"type": "unknown", "confidence": 0, "scores": {}}
+
+    numeric_share = profile.numeric_count[col_idx] / non_empty
+    unique_ratio = profile.unique[col_idx] / non_empty
+    scores = {"numeric": float(numeric_share), "unique_ratio": float(unique_ratio)}
+    if numeric_share > TYPE_MATCH_THRESHOLD:
+        return {"type": "numeric", "confidence": float(numeric_share), "scores": scores}
+
+    strings = pd.Series(profile.values(col_idx)).astype(str).str.strip()
+    boolean_share = strings.str.lower().isin(BOOLEAN_TOKENS).mean()
+    scores["boolean"] = float(boolean_share)
+
+    date_format, sample_rate = infer_date_format(strings)
+    date_share = 0.0
+    result = {}
+    if date_format and sample_rate > 0.5:
+        parsed = pd.to_datetime(strings, format=date_format, errors="coerce")
+        date_share = parsed.notna().mean()
+        if date_share > TYPE_MATCH_THRESHOLD:
+            result = {"date_format": date_format, "earliest": parsed.min().isoformat(), "latest": parsed.max().isoformat()}
+    scores["date"] = float(date_share)
+
+    if boolean_share > TYPE_MATCH_THRESHOLD and profile.unique[col_idx] <= 2 * len(BOOLEAN_TOKENS):
+        return {"type": "boolean", "confidence": float(boolean_share), "scores": scores}
+    if date_share > TYPE_MATCH_THRESHOLD:
+        return {"type": "date", "confidence": float(date_share), "scores": scores, **result}
+    if unique_ratio < CATEGORICAL_UNIQUE_RATIO:
+        return {"type": "categorical", "confidence": float(1 - unique_ratio), "scores": scores}
+    return {"type": "text", "confidence": float(1 - max(numeric_share, boolean_share, date_share)), "scores": scores}
+
+# Level 1: dataset profiles by sheet content hash. Level 2: answers by (profile, query, model).
+profile_cache = TTLCache(
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("PROFILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "3600"))
+)
+answer_cache = TTLCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+)
+
+def profile_sheet(spreadsheet_data: List[List[Any]]) -> DatasetProfile:
+    """Cached DatasetProfile keyed by the sheet's content hash"""
+    key = sheet_hash(spreadsheet_data)
+    profile = profile_cache.get(key)
+    if profile is None:
+        profile = DatasetProfile(spreadsheet_data, key)
+        profile_cache.set(key, profile, profile.nbytes)
+    else:
+        # Encodings, sketches and hashes are built lazily after insertion; recount them
+        profile_cache.resize(key, profile.nbytes)
+    return profile
+
+# Approximate profiling: type decisions only compare shares against thresholds, so on very
+# large sheets a random sample of rows settles them long before every cell is read.
+PROFILING_DEFAULTS = {
+    "mode": "auto",            # "exact", "sample", or "auto" (sample above PROFILE_SAMPLE_MIN_CELLS)
+    "confidence_level": 0.95,
+    "initial_rows": 2000,      # first sample size; doubled each round until decisions settle
+    "seed": None
+}
+PROFILE_SAMPLE_MIN_CELLS = int(os.getenv("PROFILE_SAMPLE_MIN_CELLS", "2000000"))
+
+def parse_profiling_options(raw: Any) -> Dict[str, Any]:
+    """Normalize the optional `profiling` request field into a full options dict"""
+    if raw is None:
+        raw = {}
+    if isinstance(raw, str):
+        raw = {"mode": raw}
+    if not isinstance(raw, dict):
+        raise ValueError("profiling must be a mode name or an options object")
+
+    options = {**PROFILING_DEFAULTS, **{k: v for k, v in raw.items() if v is not None}}
+    if options["mode"] not in ("exact", "sample", "auto"):
+        raise ValueError(f"Unsupported profiling mode: {options['mode']}")
+    if not 0 < float(options["confidence_level"]) < 1:
+        raise ValueError("confidence_level must be between 0 and 1")
+    options["confidence_level"] = float(options["confidence_level"])
+    options["initial_rows"] = max(100, int(options["initial_rows"]))
+    return options
+
+def wilson_interval(successes: float, n: int, confidence_level: float) -> Tuple[float, float]:
+    """Wilson score interval for a binomial proportion"""
+    if n <= 0:
+        return 0.0, 1.0
+    z = stats.norm.ppf(1 - (1 - confidence_level) / 2)
+    p = successes / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return float(max(0.0, center - half_width)), float(min(1.0, center + half_width))
+
+def _sampled_rate_estimates(profile: DatasetProfile, confidence_level: float) -> Tuple[List[Dict[str, Any]], bool]:
+    """Per-column rate estimates with intervals, and whether every type decision is settled"""
+    estimates = []
+    settled = True
+    for j, inferred in enumerate(profile.column_types()):
+        non_empty = int(profile.count[j])
+        lower, upper = wilson_interval(profile.missing[j], profile.row_count, confidence_level)
+        column = {"missing_rate": {"estimate": float(profile.missing[j] / max(profile.row_count, 1)),
+                                   "lower": lower, "upper": upper}}
+        for share in ("numeric", "boolean", "date"):
+            if share not in inferred["scores"]:
                 continue
+            estimate = inferred["scores"][share]
+            lower, upper = wilson_interval(estimate * non_empty, non_empty, confidence_level)
+            column[f"{share}_share"] = {"estimate": estimate, "lower": lower, "upper": upper}
+            # Settled once the interval is entirely on one side of the decision threshold
+            if lower <= TYPE_MATCH_THRESHOLD <= upper:
+                settled = False
+        estimates.append(column)
+    return estimates, settled
 
-        correlations = {}
-        numeric_columns = {h: [] for h, s in column_stats.items() if "mean" in s}
+def _full_column_cardinality(rows: List[List[Any]], col_idx: int, confidence_level: float) -> Dict[str, Any]:
+    """Distinct-value share of a whole column from a HyperLogLog sketch, with its error bounds.
 
-        if len(numeric_columns) >= 2:
-            for col_idx, header in enumerate(headers):
-                if header in numeric_columns:
-                    try:
-                        values = [float(row[col_idx]) for row in spreadsheet_data[1:] 
-                                 if col_idx < len(row) and row[col_idx] != '']
-                        numeric_columns[header] = values
-                    except:
-                        continue
+    A sample's distinct ratio is biased upward (most values of a large category column
+    are seen only once in a small sample), so categorical/text is decided on this instead.
+    """
+    sketch = HyperLogLog()
+    non_empty = 0
+    for start in range(0, len(rows), SKETCH_CHUNK_ROWS):
+        column = np.array([row[col_idx] if col_idx < len(row) else None
+                           for row in rows[start:start + SKETCH_CHUNK_ROWS]], dtype=object)
+        values = column[~pd.isna(column) & (column != '')]
+        non_empty += len(values)
+        if len(values):
+            sketch.add_hashes(pd.util.hash_array(values))
+    distinct = min(sketch.count(), non_empty)
+    # Relative standard error of HyperLogLog is 1.04 / sqrt(registers)
+    z = stats.norm.ppf(1 - (1 - confidence_level) / 2)
+    error = z * 1.04 / np.sqrt(len(sketch.registers))
+    ratio = distinct / max(non_empty, 1)
+    return {"estimate": float(ratio), "lower": float(max(0.0, ratio * (1 - error))),
+            "upper": float(min(1.0, ratio * (1 + error))), "distinct": int(distinct), "method": "hyperloglog"}
 
-            for col1 in numeric_columns:
-                correlations[col1] = {}
-                for col2 in numeric_columns:
-                    if col1 != col2:
-                        try:
-                            corr, _ = pearsonr(numeric_columns[col1], numeric_columns[col2])
-                            correlations[col1][col2] = corr
-                        except:
-                            correlations[col1][col2] = None
+def profile_sheet_sampled(spreadsheet_data: List[List[Any]],
+                          options: Dict[str, Any]) -> Tuple[DatasetProfile, Dict[str, Any]]:
+    """Profile a uniform random sample of rows, growing it until each column's type is settled.
+
+    Rows are visited in one random permutation, so every round's sample extends the
+    previous one. Sampling stops when every numeric/boolean/date share's confidence
+    interval excludes TYPE_MATCH_THRESHOLD, or when the whole sheet has been read (the
+    result is then exact). The categorical/text split of a sampled profile is then made on
+    each remaining column's full-column distinct ratio (see _full_column_cardinality).
+    """
+    headers, rows = spreadsheet_data[0], spreadsheet_data[1:]
+    total_rows = len(rows)
+    order = np.random.default_rng(options["seed"]).permutation(total_rows)
+    sample_size = min(options["initial_rows"], total_rows)
+    rounds = 0
+    while True:
+        rounds += 1
+        # Keep sampled rows in sheet order so first/last-value logic still makes sense
+        indices = np.sort(order[:sample_size])
+        profile = DatasetProfile([headers] + [rows[i] for i in indices])
+        estimates, settled = _sampled_rate_estimates(profile, options["confidence_level"])
+        if settled or sample_size >= total_rows:
+            break
+        sample_size = min(sample_size * 2, total_rows)
+
+    if sample_size < total_rows:
+        column_types = profile.column_types()
+        for j, inferred in enumerate(column_types):
+            if inferred["type"] not in ("categorical", "text"):
+                continue
+            cardinality = _full_column_cardinality(rows, j, options["confidence_level"])
+            # The interval straddling the threshold means the split is a close call either way
+            cardinality["uncertain"] = cardinality["lower"] < CATEGORICAL_UNIQUE_RATIO <= cardinality["upper"]
+            estimates[j]["unique_ratio"] = cardinality
+            ratio = cardinality["estimate"]
+            scores = {**inferred["scores"], "unique_ratio": ratio}
+            if ratio < CATEGORICAL_UNIQUE_RATIO:
+                column_types[j] = {"type": "categorical", "confidence": float(1 - ratio), "scores": scores}
+            else:
+                shares = [scores.get(share, 0.0) for share in ("numeric", "boolean", "date")]
+                column_types[j] = {"type": "text", "confidence": float(1 - max(shares)), "scores": scores}
+
+    return profile, {
+        "mode": "sample" if sample_size < total_rows else "exact",
+        "rows_sampled": int(sample_size),
+        "rows_total": total_rows,
+        "rounds": rounds,
+        "settled": settled,
+        "confidence_level": options["confidence_level"],
+        "columns": estimates,
+        "build": profile.build_info
+    }
+
+def profile_for_analysis(spreadsheet_data: List[List[Any]], options: Dict[str, Any],
+                         profile: Optional[DatasetProfile] = None) -> Tuple[DatasetProfile, Dict[str, Any]]:
+    """Exact (cached, or the given exact profile) or sampled profile, depending on the options and sheet size"""
+    total_rows = len(spreadsheet_data) - 1
+    cells = total_rows * len(spreadsheet_data[0])
+    use_sample = options["mode"] == "sample" or (options["mode"] == "auto" and cells >= PROFILE_SAMPLE_MIN_CELLS)
+    if use_sample and options["initial_rows"] < total_rows:
+        return profile_sheet_sampled(spreadsheet_data, options)
+    profile = profile or profile_sheet(spreadsheet_data)
+    return profile, {"mode": "exact", "rows_sampled": total_rows, "rows_total": total_rows, "build": profile.build_info}
+
+def profile_summary(profile: DatasetProfile) -> Dict[str, Any]:
+    """Profile summary for prompts, with the sheet hash used in answer cache keys"""
+    return {**profile.summary(), "hash": profile.hash}
+
+def get_dataset_profile(spreadsheet_data: List[List[Any]]) -> Dict[str, Any]:
+    return profile_summary(profile_sheet(spreadsheet_data))
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a question, for answer cache keys"""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+def answer_cache_key(profile: Dict[str, Any], query: str, model: str) -> Tuple[Optional[str], str, str]:
+    """Answer cache key; a profile without a hash yields a key that is never looked up"""
+    return (profile.get("hash"), normalize_query(query), model)
+
+# Prompt size for /api/ask. Tokens are estimated at ~4 characters each, which is close
+# enough for English text and numeric tables to keep prompts inside the model's context.
+ASK_PROMPT_TOKEN_BUDGET = int(os.getenv("ASK_PROMPT_TOKEN_BUDGET", "6000"))
+ASK_PROMPT_COLUMN_SHARE = 0.6
+PROFILE_TABLE_FIELDS = ["count", "unique", "missing", "min", "max", "mean", "median", "std"]
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def _query_terms(query: str) -> set:
+    return {term for term in re.split(r"[^a-z0-9]+", query.lower()) if len(term) > 1}
+
+def _name_relevance(name: str, query_lower: str, terms: set) -> float:
+    """How strongly a column name is referenced by the question"""
+    name_lower = str(name).lower()
+    if name_lower and name_lower in query_lower:
+        return 2.0
+    name_terms = _query_terms(name_lower)
+    return len(name_terms & terms) / len(name_terms) if name_terms else 0.0
+
+def _format_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.4g}" if np.isfinite(value) else ""
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def rank_profile_for_query(profile: Dict[str, Any], query: str) -> Tuple[List[str], List[Tuple[str, str, float]]]:
+    """Order columns and correlation pairs by relevance to the question.
+
+    Columns score on name matches first, then their strongest correlation and their
+    relative spread (coefficient of variation). Pairs score on |r|, boosted when either
+    column is named in the question.
+    """
+    query_lower = query.lower()
+    terms = _query_terms(query)
+    column_stats = profile["column_stats"]
+    correlations = profile["correlations"]
+
+    name_scores = {col: _name_relevance(col, query_lower, terms) for col in column_stats}
+
+    pairs = []
+    strongest = {}
+    for col1, row in correlations.items():
+        for col2, r in row.items():
+            if r is None or not np.isfinite(r) or str(col1) >= str(col2):
+                continue
+            pairs.append((col1, col2, float(r)))
+            strongest[col1] = max(strongest.get(col1, 0.0), abs(r))
+            strongest[col2] = max(strongest.get(col2, 0.0), abs(r))
+
+    spreads = {}
+    for col, col_stats in column_stats.items():
+        mean, std = col_stats.get("mean"), col_stats.get("std")
+        if mean is not None and std is not None and np.isfinite(std) and mean != 0:
+            spreads[col] = float(std) / abs(float(mean))
+    spread_ranks = {}
+    if spreads:
+        ordered = sorted(spreads, key=spreads.get)
+        spread_ranks = {col: (i + 1) / len(ordered) for i, col in enumerate(ordered)}
 
-        prompt = f"""
-Here is a comprehensive analysis of a dataset with {len(spreadsheet_data)} rows and {len(headers)} columns.
+    column_order = {col: i for i, col in enumerate(column_stats)}
+    ranked_columns = sorted(
+        column_stats,
+        key=lambda col: (-(10 * name_scores[col] + 2 * strongest.get(col, 0.0) + spread_ranks.get(col, 0.0)),
+                         column_order[col])
+    )
+    ranked_pairs = sorted(
+        pairs,
+        key=lambda pair: -(abs(pair[2]) + 10 * (name_scores.get(pair[0], 0.0) + name_scores.get(pair[1], 0.0)))
+    )
+    return ranked_columns, ranked_pairs
+
+def build_ask_prompt(profile: Dict[str, Any], query: str,
+                     token_budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """Prompt asking the model to answer `query` from a dataset profile.
+
+    Column statistics and correlations are written as pipe-separated tables, most relevant
+    first, and cut off once the token budget is spent. Returns the prompt and a summary
+    of what was included.
+    """
+    token_budget = token_budget or ASK_PROMPT_TOKEN_BUDGET
+    ranked_columns, ranked_pairs = rank_profile_for_query(profile, query)
+    column_stats = profile["column_stats"]
+
+    def render(column_lines: List[str], pair_lines: List[str]) -> str:
+        column_note = ""
+        if len(column_lines) < len(ranked_columns):
+            column_note = f" (the {len(column_lines)} of {len(ranked_columns)} columns most relevant to the question)"
+        pair_note = ""
+        if len(pair_lines) < len(ranked_pairs):
+            pair_note = f" (the {len(pair_lines)} of {len(ranked_pairs)} pairs most relevant to the question)"
+        return f"""
+Here is a comprehensive analysis of a dataset with {profile["row_count"]} rows and {profile["column_count"]} columns.
 
-Column Statistics:
-{json.dumps(column_stats, indent=2)}
+Column Statistics{column_note}:
+column|{"|".join(PROFILE_TABLE_FIELDS)}
+{chr(10).join(column_lines)}
 
-Correlations between numeric columns:
-{json.dumps(correlations, indent=2)}
+Correlations between numeric columns{pair_note}:
+column_1|column_2|r
+{chr(10).join(pair_lines)}
 
 User's question: {query}
 
@@ -1116,13 +3452,80 @@ If the answer involves identifying trends or patterns, use the correlation analy
 If you need more specific data to answer accurately, explain what additional information would be helpful.
 """
 
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}]
-        )
+    # Token cost of everything except the table rows (notes included, at their longest)
+    overhead = estimate_tokens(render([], [])) + 40
+    remaining = max(token_budget - overhead, 0)
+
+    column_budget = int(remaining * ASK_PROMPT_COLUMN_SHARE) if ranked_pairs else remaining
+    column_lines, used = [], 0
+    for col in ranked_columns:
+        col_stats = column_stats[col]
+        line = "|".join([_format_cell(col)] + [_format_cell(col_stats.get(field)) for field in PROFILE_TABLE_FIELDS])
+        cost = estimate_tokens(line) + 1
+        if used + cost > column_budget:
+            break
+        column_lines.append(line)
+        used += cost
+
+    pair_lines = []
+    for col1, col2, r in ranked_pairs:
+        line = f"{_format_cell(col1)}|{_format_cell(col2)}|{r:.3f}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > remaining:
+            break
+        pair_lines.append(line)
+        used += cost
+
+    prompt = render(column_lines, pair_lines)
+    prompt_info = {
+        "estimated_tokens": estimate_tokens(prompt),
+        "token_budget": token_budget,
+        "columns_included": len(column_lines),
+        "columns_total": len(ranked_columns),
+        "correlations_included": len(pair_lines),
+        "correlations_total": len(ranked_pairs),
+        "truncated": len(column_lines) < len(ranked_columns) or len(pair_lines) < len(ranked_pairs)
+    }
+    return prompt, prompt_info
+
+async def answer_question(profile: Dict[str, Any], query: str, timeout: Optional[float] = None,
+                          model: str = "gpt-4") -> Dict[str, Any]:
+    """Ask the LLM one question about a profiled dataset, reusing a cached answer when possible"""
+    cache_key = answer_cache_key(profile, query, model)
+    cached = answer_cache.get(cache_key) if cache_key[0] else None
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    prompt, prompt_info = build_ask_prompt(profile, query)
+    response = await llm_client.complete(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        timeout=timeout
+    )
+    response["prompt"] = prompt_info
+    if cache_key[0]:
+        answer_cache.set(cache_key, response, len(response["content"] or ""))
+    return {**response, "cached": False}
+
+@app.post("/api/ask")
+async def ask_ai(request: Request):
+    try:
+        data = await request.json()
+        query = data.get("query")
+        spreadsheet_data = data.get("data")
+
+        if not query or not spreadsheet_data:
+            return JSONResponse(
+                content={"error": "Missing query or spreadsheet data"},
+                status_code=400,
+                headers={"Access-Control-Allow-Origin": "*"}
+            )
+
+        profile = await asyncio.to_thread(get_dataset_profile, spreadsheet_data)
+        response = await answer_question(profile, query)
 
         return JSONResponse(
-            content={"answer": response.choices[0].message.content},
+            content={"answer": response["content"], "cached": response["cached"], "prompt": response["prompt"]},
             headers={"Access-Control-Allow-Origin": "*"}
         )
 
@@ -1135,169 +3538,700 @@ If you need more specific data to answer accurately, explain what additional inf
         )
 
 
-@app.post("/api/data-cleaning")
-async def analyze_data_for_cleaning(request: Request):
-    """
-    Analyzes spreadsheet data and suggests cleaning operations using AI.
+def json_safe(value: Any) -> Any:
+    """Replace NaN/Inf (which JSON can't carry) with None, recursively"""
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def sse_event(event: str, payload: Any) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(json_safe(payload))}\n\n"
+
+@app.post("/api/ask/stream")
+async def ask_ai_stream(request: Request):
+    """Streaming variant of /api/ask using server-sent events.
+
+    Sends a `stats` event with the dataset profile first, then one `token` event per
+    chunk of the answer and a final `done` event. If the client disconnects, the upstream
+    LLM request is closed.
     """
     try:
-        # Get raw request body
-        body_bytes = await request.body()
-        
-        # Convert bytes to string and parse JSON manually
-        body_str = body_bytes.decode('utf-8')
-        
-        if not body_str:
-            return {"error": "Empty request body"}
-        
-        print(f"Received request body: {body_str[:100]}...")
-        
+        data = await request.json()
+        query = data.get("query")
+        spreadsheet_data = data.get("data")
+        model = data.get("model", "gpt-4")
+
+        if not query or not spreadsheet_data:
+            return JSONResponse(
+                content={"error": "Missing query or spreadsheet data"},
+                status_code=400,
+                headers={"Access-Control-Allow-Origin": "*"}
+            )
+
+        profile = await asyncio.to_thread(get_dataset_profile, spreadsheet_data)
+    except Exception as e:
+        traceback.print_exc()
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=500,
+            headers={"Access-Control-Allow-Origin": "*"}
+        )
+
+    async def events():
+        yield sse_event("stats", {
+            "row_count": profile["row_count"],
+            "column_count": profile["column_count"],
+            "column_stats": profile["column_stats"],
+            "correlations": profile["correlations"]
+        })
+
+        cache_key = answer_cache_key(profile, query, model)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            yield sse_event("token", {"content": cached["content"]})
+            yield sse_event("done", {"cached": True, "prompt": cached.get("prompt")})
+            return
+
+        parts = []
+        usage = None
+        prompt, prompt_info = build_ask_prompt(profile, query)
+        stream = llm_client.stream(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
         try:
-            body = json.loads(body_str)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return {"error": f"Invalid JSON: {str(e)}"}
+            async for event in stream:
+                if await request.is_disconnected():
+                    print("Client disconnected from /api/ask/stream, cancelling upstream call")
+                    return
+                if event["type"] == "token":
+                    parts.append(event["content"])
+                    yield sse_event("token", {"content": event["content"]})
+                elif event["type"] == "usage":
+                    usage = event["usage"]
+        except LLMError as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            await stream.aclose()
+
+        content = "".join(parts)
+        answer_cache.set(cache_key, {"content": content, "model": model, "usage": usage or {},
+                                     "prompt": prompt_info}, len(content))
+        yield sse_event("done", {"cached": False, "usage": usage, "prompt": prompt_info})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Access-Control-Allow-Origin": "*"
+        }
+    )
+
+# /api/data-cleaning is split into a deterministic column analysis (cached by data hash)
+# and an optional LLM enrichment step that can run in the background.
+cleaning_analysis_cache = TTLCache(
+    max_entries=int(os.getenv("CLEANING_CACHE_MAX_ENTRIES", "128")),
+    max_bytes=int(os.getenv("CLEANING_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.getenv("CLEANING_CACHE_TTL", "3600"))
+)
+CLEANING_AI_MODES = ("background", "inline", "off")
+CLEANING_JOB_TTL = 3600          # seconds a finished enrichment job stays available
+CLEANING_JOB_MAX_ENTRIES = 256
+_cleaning_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+# Duplicate rows: exact matches by normalized row hash, near matches by MinHash + LSH over
+# the set of (column, normalized value) cells in each row.
+DUPLICATE_DEFAULTS = {
+    "near_threshold": 0.8,   # estimated Jaccard similarity for near duplicates
+    "num_perm": 64,          # MinHash signature length
+    "bands": 16,             # LSH bands (num_perm / bands rows per band)
+    "max_groups": 100,       # groups listed per kind
+    "max_rows": 1000,        # redundant exact-duplicate rows listed (None lists all)
+    "near": True             # also look for near duplicates
+}
+NEAR_DUPLICATE_MAX_ROWS = int(os.getenv("NEAR_DUPLICATE_MAX_ROWS", "500000"))
+MINHASH_CHUNK_CELLS = 2_000_000
+LSH_FULL_PAIRS_BUCKET = 20   # larger buckets are linked to their first member only
+_HASH_PRIME = np.uint64(0x100000001B3)
+
+def sheet_cell_hashes(spreadsheet_data: List[List[Any]]) -> np.ndarray:
+    """DatasetProfile.cell_hashes of a whole sheet, without profiling it.
+
+    Each column's distinct cells are coerced and normalized once, so this reads every row
+    of a sheet that is only profiled on a sample at a fraction of a full profile's cost.
+    """
+    rows = spreadsheet_data[1:]
+    width = len(spreadsheet_data[0]) if spreadsheet_data else 0
+    hashes = np.zeros((len(rows), width), dtype=np.uint64)
+    if not rows or not width:
+        return hashes
+    cells = pd.DataFrame(rows, dtype=object).reindex(columns=range(width)).to_numpy(dtype=object)
+    for j in range(width):
+        column = cells[:, j]
+        kind = pd.api.types.infer_dtype(column, skipna=True)
+        if kind in ("integer", "floating", "mixed-integer-float"):
+            try:
+                numeric = column.astype(float)  # None becomes NaN
+            except (ValueError, TypeError, OverflowError):
+                numeric = None
+            if numeric is not None:
+                present = ~np.isnan(numeric)
+                hashes[present, j] = pd.util.hash_array(numeric[present])
+                hashes[present & (hashes[:, j] == 0), j] = 1
+                continue
+        # Booleans are text to the profile, but factorize would merge True with 1
+        is_bool = np.zeros(len(column), dtype=bool)
+        if kind != "string":
+            is_bool = pd.Series(_cell_type(column)).isin([bool, np.bool_]).to_numpy()
+        values = np.where(is_bool, None, column) if is_bool.any() else column
+        try:
+            codes, uniques = pd.factorize(values)
+        except TypeError:
+            # Unhashable cells (lists, dicts): normalize every cell
+            codes, uniques = np.arange(len(values)), values
+        present = ~pd.isna(uniques) & (uniques != '')
+        unique_hashes = np.zeros(len(uniques), dtype=np.uint64)
+        numeric = DatasetProfile._coerce_numeric(uniques, present)
+        is_numeric = ~np.isnan(numeric)
+        if is_numeric.any():
+            unique_hashes[is_numeric] = pd.util.hash_array(numeric[is_numeric])
+        text = present & ~is_numeric
+        if text.any():
+            unique_hashes[text] = _text_cell_hashes(uniques[text])
+        unique_hashes[present & (unique_hashes == 0)] = 1
+        hashes[:, j] = np.where(codes >= 0, unique_hashes[np.maximum(codes, 0)], np.uint64(0))
+        if is_bool.any():
+            hashes[is_bool, j] = _text_cell_hashes(column[is_bool])
+    return hashes
+
+def _row_hashes(cell_hashes: np.ndarray) -> np.ndarray:
+    row_hash = np.full(len(cell_hashes), np.uint64(0xCBF29CE484222325))
+    for j in range(cell_hashes.shape[1]):
+        row_hash = (row_hash ^ cell_hashes[:, j]) * _HASH_PRIME
+    return row_hash
+
+def _minhash_signatures(tokens: np.ndarray, num_perm: int, seed: int = 0) -> np.ndarray:
+    """MinHash signatures; token 0 means "no token" and never wins the minimum"""
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    n, k = tokens.shape
+    signatures = np.empty((n, num_perm), dtype=np.uint64)
+    chunk = max(1, MINHASH_CHUNK_CELLS // max(k * num_perm, 1))
+    for start in range(0, n, chunk):
+        block = tokens[start:start + chunk, :, None]
+        # Odd-multiplier affine maps are bijections on uint64, i.e. random permutations of token ids
+        permuted = block * multipliers + offsets
+        permuted[np.broadcast_to(block == 0, permuted.shape)] = np.iinfo(np.uint64).max
+        signatures[start:start + chunk] = permuted.min(axis=1)
+    return signatures
+
+def _lsh_candidate_pairs(signatures: np.ndarray, bands: int) -> np.ndarray:
+    rows_per_band = signatures.shape[1] // bands
+    pairs = []
+    for b in range(bands):
+        band_hash = _row_hashes(signatures[:, b * rows_per_band:(b + 1) * rows_per_band])
+        order = np.argsort(band_hash, kind="stable")
+        sorted_hash = band_hash[order]
+        starts = np.flatnonzero(np.r_[True, sorted_hash[1:] != sorted_hash[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            members = order[start:start + size]
+            if size <= LSH_FULL_PAIRS_BUCKET:
+                i, j = np.triu_indices(size, k=1)
+                pairs.append(np.column_stack([members[i], members[j]]))
+            else:
+                pairs.append(np.column_stack([np.full(size - 1, members[0]), members[1:]]))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+
+def find_duplicate_rows(profile: DatasetProfile, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Exact and near-duplicate row groups (row numbers indexed like the sheet, header = row 0).
+
+    `duplicate_rows` lists the first `max_rows` redundant rows (every exact-group member
+    after its first); `duplicate_row_count` is the full count.
+    """
+    return _duplicate_row_groups(profile.cell_hashes(), options)
+
+def find_sheet_duplicate_rows(spreadsheet_data: List[List[Any]],
+                              options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """find_duplicate_rows over every row of a sheet that has no exact profile"""
+    return _duplicate_row_groups(sheet_cell_hashes(spreadsheet_data), options)
+
+def _duplicate_row_groups(cell_hashes: np.ndarray, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    from scipy.sparse.csgraph import connected_components
+
+    options = {**DUPLICATE_DEFAULTS, **(options or {})}
+    max_groups = int(options["max_groups"])
+    max_rows = options["max_rows"]
+    row_count, column_count = cell_hashes.shape
+    nonempty = (cell_hashes != 0).any(axis=1)
+
+    # Exact: group rows by the hash of their normalized cells
+    row_hash = _row_hashes(cell_hashes)
+    codes, _ = pd.factorize(np.where(nonempty, row_hash, np.uint64(0)))
+    duplicated = pd.Series(codes).duplicated(keep=False).to_numpy() & nonempty
+    exact_groups = []
+    if duplicated.any():
+        rows = np.flatnonzero(duplicated)
+        order = rows[np.argsort(codes[rows], kind="stable")]
+        split = np.flatnonzero(np.diff(codes[order])) + 1
+        exact_groups = [(group + 1).tolist() for group in np.split(order, split)]
+        exact_groups.sort(key=lambda group: (-len(group), group[0]))
+    redundant_rows = sorted(row for group in exact_groups for row in group[1:])
+
+    result = {
+        "row_count": row_count,
+        "exact_groups": exact_groups[:max_groups],
+        "exact_group_count": len(exact_groups),
+        "duplicate_rows": redundant_rows if max_rows is None else redundant_rows[:int(max_rows)],
+        "duplicate_row_count": len(redundant_rows),
+        "near_groups": [],
+        "near_group_count": 0
+    }
+
+    # Near: one representative per exact group, MinHash over (column, value) tokens
+    representatives = np.flatnonzero(nonempty & ~pd.Series(codes).duplicated(keep="first").to_numpy())
+    if not options["near"]:
+        return result
+    if column_count < 2 or len(representatives) < 2:
+        return result
+    if len(representatives) > NEAR_DUPLICATE_MAX_ROWS:
+        result["near_skipped"] = True
+        return result
+    column_salt = (np.arange(1, column_count + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+    tokens = cell_hashes[representatives]
+    tokens = np.where(tokens == 0, np.uint64(0), (tokens ^ column_salt) | np.uint64(1))
+    num_perm = int(options["num_perm"])
+    signatures = _minhash_signatures(tokens, num_perm)
+    pairs = _lsh_candidate_pairs(signatures, int(options["bands"]))
+    if len(pairs):
+        similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        keep = similarity >= float(options["near_threshold"])
+        pairs, similarity = pairs[keep], similarity[keep]
+    if len(pairs):
+        graph = sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                                  shape=(len(representatives), len(representatives)))
+        _, labels = connected_components(graph, directed=False)
+        linked = np.unique(pairs)
+        group_similarity = {}
+        for (a, _), sim in zip(pairs, similarity):
+            group_similarity[labels[a]] = min(group_similarity.get(labels[a], 1.0), sim)
+        groups = {}
+        for index in linked:
+            groups.setdefault(labels[index], []).append(int(representatives[index]) + 1)
+        near_groups = [
+            {"rows": sorted(rows), "min_similarity": round(float(group_similarity[label]), 3)}
+            for label, rows in groups.items()
+        ]
+        near_groups.sort(key=lambda group: (-len(group["rows"]), group["rows"][0]))
+        result["near_groups"] = near_groups[:max_groups]
+        result["near_group_count"] = len(near_groups)
+    return result
+
+# Category normalization: spelling variants of the same value ("NY", "New York", "new york ")
+# are found by blocking distinct values on shared keys and only scoring pairs inside a block.
+CATEGORY_SIMILARITY_THRESHOLD = 0.85
+CATEGORY_BLOCK_MAX = 64          # blocks larger than this are too common to be informative
+CATEGORY_NGRAM_PREFILTER = 0.5   # minimum n-gram Dice overlap before a pair is scored
+CATEGORY_MAX_MEAN_LENGTH = 40    # longer values are free text, not categories
+CATEGORY_MAX_MAPPINGS = 50
+CATEGORY_MIN_TOKEN_LENGTH = 2    # differing words this short are codes ("A", "B", "X1"), not typos
+CATEGORY_TOKEN_SLACK = 0.1       # a differing word may score slightly below the whole-string threshold
+_SOUNDEX_CODES = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+
+def _category_key(value: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", value.lower()).split())
+
+def _soundex(key: str) -> str:
+    letters = re.sub(r"[^a-z]", "", key)
+    if not letters:
+        return ""
+    codes = letters.translate(_SOUNDEX_CODES)
+    digits = [c for i, c in enumerate(codes[1:], 1) if c.isdigit() and c != codes[i - 1]]
+    return (letters[0] + "".join(digits) + "000")[:4]
+
+def _acronym(key: str) -> str:
+    """Initials of a multi-word key ("new york" -> "ny"); single words have none"""
+    tokens = key.split()
+    if len(tokens) > 1 and all(token.isalpha() for token in tokens):
+        return "".join(token[0] for token in tokens)
+    return ""
+
+def _tokens_compatible(tokens_a: List[str], tokens_b: List[str], threshold: float) -> bool:
+    """Token-level guard for spelling matches: every differing word must itself be a near-match.
+
+    "Group A"/"Group B" and "Product X"/"Product Y" score high on the whole string but differ
+    in a short code, which names a different category rather than a typo.
+    """
+    from difflib import SequenceMatcher
+
+    if len(tokens_a) != len(tokens_b):
+        return True  # merged or split words ("newyork" / "new york") are left to the string score
+    for token_a, token_b in zip(tokens_a, tokens_b):
+        if token_a == token_b:
+            continue
+        if min(len(token_a), len(token_b)) <= CATEGORY_MIN_TOKEN_LENGTH:
+            return False
+        if sorted(token_a) == sorted(token_b):
+            continue  # transposed letters ("nwe" / "new")
+        if SequenceMatcher(None, token_a, token_b).ratio() < threshold - CATEGORY_TOKEN_SLACK:
+            return False
+    return True
+
+def normalize_categorical_values(counts: pd.Series, threshold: float = CATEGORY_SIMILARITY_THRESHOLD) -> Dict[str, Any]:
+    """Propose canonical spellings from a column's value counts (distinct string -> count).
+
+    Distinct values collapse first on a case/whitespace/punctuation-insensitive key. The
+    remaining keys are blocked on their rarest character trigrams, a Soundex code and
+    initials; only pairs sharing a block are compared. Trigram overlap and difflib's
+    length and character-count bounds are checked for all candidates at once before the
+    edit-similarity check. Spelling matches must also agree word by word, and an
+    abbreviation needs an exact, unambiguous initials match. Each group maps onto its most
+    frequent spelling.
+    """
+    from difflib import SequenceMatcher
+    from scipy.sparse.csgraph import connected_components
+
+    started = time.perf_counter()
+    counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+    raw = counts.index.astype(str).to_numpy(dtype=object)
+    raw_counts = counts.to_numpy()
+    keys = np.array([_category_key(value) for value in raw], dtype=object)
+    key_codes, distinct_keys = pd.factorize(keys)
+    n = len(distinct_keys)
+
+    # Trigram sets as a sparse key x trigram incidence matrix
+    gram_ids: Dict[str, int] = {}
+    gram_rows, gram_cols = [], []
+    for k, key in enumerate(distinct_keys):
+        padded = f" {key} "
+        for gram in {padded[i:i + 3] for i in range(len(padded) - 2)}:
+            gram_rows.append(k)
+            gram_cols.append(gram_ids.setdefault(gram, len(gram_ids)))
+    gram_rows = np.asarray(gram_rows, dtype=np.int64)
+    gram_cols = np.asarray(gram_cols, dtype=np.int64)
+    gram_matrix = sparse.csr_matrix((np.ones(len(gram_rows)), (gram_rows, gram_cols)), shape=(n, len(gram_ids)))
+    gram_totals = np.bincount(gram_rows, minlength=n)
+
+    # Prefix filtering: with every key's trigrams ordered rarest first, two keys whose Dice
+    # overlap reaches the pre-filter share a trigram among the first |grams| - min_shared + 1
+    # of each, so only those are indexed and the common trigrams never form large blocks
+    share = CATEGORY_NGRAM_PREFILTER / (2 - CATEGORY_NGRAM_PREFILTER)
+    prefix_lengths = gram_totals - np.ceil(gram_totals * share - 1e-9).astype(np.int64) + 1
+    gram_frequency = np.bincount(gram_cols, minlength=len(gram_ids))
+    order = np.lexsort((gram_cols, gram_frequency[gram_cols], gram_rows))
+    row_starts = np.r_[0, np.cumsum(gram_totals)[:-1]]
+    in_prefix = np.empty(len(order), dtype=bool)
+    in_prefix[order] = np.arange(len(order)) - row_starts[gram_rows[order]] < prefix_lengths[gram_rows[order]]
+
+    # Inverted index of blocking keys -> distinct keys; phonetic/initials blocks follow the trigram ids
+    block_ids: Dict[str, int] = {}
+    entries_key, entries_block = [], []
+    for k, key in enumerate(distinct_keys):
+        blocks = set()
+        phonetic, initials = _soundex(key), _acronym(key)
+        if phonetic:
+            blocks.add("s:" + phonetic)
+        if initials:
+            blocks.add("a:" + initials)
+        elif key.isalpha() and 1 < len(key) <= 5:
+            blocks.add("a:" + key)  # a possible abbreviation meets expansions with these initials
+        for block in blocks:
+            entries_key.append(k)
+            entries_block.append(len(gram_ids) + block_ids.setdefault(block, len(block_ids)))
+    entries_key = np.r_[gram_rows[in_prefix], np.asarray(entries_key, dtype=np.int64)]
+    entries_block = np.r_[gram_cols[in_prefix], np.asarray(entries_block, dtype=np.int64)]
+
+    # Candidate pairs: trigram-block pairs need the Dice pre-filter, phonetic/initials pairs always qualify
+    order = np.argsort(entries_block, kind="stable")
+    sorted_blocks = entries_block[order]
+    starts = np.flatnonzero(np.r_[True, sorted_blocks[1:] != sorted_blocks[:-1]]) if len(order) else np.array([], dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(order)])
+    gram_pairs, forced_pairs = [], []
+    for size in np.unique(sizes[(sizes > 1) & (sizes <= CATEGORY_BLOCK_MAX)]).tolist():
+        # All blocks of one size at once: a (blocks x size) member matrix and its upper triangle
+        block_starts = starts[sizes == size]
+        members = np.sort(entries_key[order[block_starts[:, None] + np.arange(size)]], axis=1)
+        i, j = np.triu_indices(size, k=1)
+        codes = members[:, i] * n + members[:, j]
+        is_gram = sorted_blocks[block_starts] < len(gram_ids)
+        gram_pairs.append(codes[is_gram].ravel())
+        forced_pairs.append(codes[~is_gram].ravel())
+    candidates = np.array([], dtype=np.int64)
+    if gram_pairs:
+        pair_codes = np.unique(np.concatenate(gram_pairs))
+        a, b = pair_codes // n, pair_codes % n
+        shared = np.asarray(gram_matrix[a].multiply(gram_matrix[b]).sum(axis=1)).ravel()
+        dice = 2 * shared / (gram_totals[a] + gram_totals[b])
+        candidates = pair_codes[dice >= CATEGORY_NGRAM_PREFILTER]
+    if forced_pairs:
+        candidates = np.union1d(candidates, np.concatenate(forced_pairs))
+
+    # difflib's real_quick_ratio and quick_ratio bounds (length and character-multiset overlap)
+    # for every candidate at once; possible abbreviations skip them, having their own test
+    char_ids: Dict[str, int] = {}
+    char_rows, char_cols = [], []
+    for k, key in enumerate(distinct_keys):
+        for char in key:
+            char_rows.append(k)
+            char_cols.append(char_ids.setdefault(char, len(char_ids)))
+    char_counts = sparse.csr_matrix((np.ones(len(char_rows)), (char_rows, char_cols)), shape=(n, len(char_ids)))
+    lengths = np.array([len(key) for key in distinct_keys], dtype=np.int64)
+    short_alpha = np.array([key.isalpha() and 1 < len(key) <= 5 for key in distinct_keys], dtype=bool)
+    a, b = candidates // n, candidates % n
+    total = np.maximum(lengths[a] + lengths[b], 1)
+    plausible = 2.0 * np.minimum(lengths[a], lengths[b]) / total >= threshold
+    if plausible.any():
+        matches = np.asarray(char_counts[a[plausible]].minimum(char_counts[b[plausible]]).sum(axis=1)).ravel()
+        plausible[plausible] = 2.0 * matches / total[plausible] >= threshold
+    candidate_count = len(candidates)
+    candidates = candidates[plausible | short_alpha[a] | short_alpha[b]]
+
+    # Score the remaining candidates; pairs sharing their second key reuse the matcher
+    accepted = []
+    key_totals = np.bincount(key_codes, weights=raw_counts, minlength=n)
+    digits = [re.findall(r"\d+", key) for key in distinct_keys]
+    tokens = [key.split() for key in distinct_keys]
+    initials = [_acronym(key) for key in distinct_keys]
+    abbreviations = []
+    matcher = SequenceMatcher(None, "", "")
+    current_b = None
+    for code in candidates[np.argsort(candidates % n, kind="stable")].tolist():
+        a, b = divmod(code, n)
+        key_a, key_b = distinct_keys[a], distinct_keys[b]
+        if digits[a] != digits[b]:
+            continue  # "Store 10" and "Store 11" are different categories
+        if initials[a] == key_b or initials[b] == key_a:
+            abbreviations.append((a, b))
+            continue
+        if b != current_b:
+            matcher.set_seq2(key_b)
+            current_b = b
+        matcher.set_seq1(key_a)
+        if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+            continue
+        score = matcher.ratio()
+        if score >= threshold and _tokens_compatible(tokens[a], tokens[b], threshold):
+            accepted.append((a, b, score, "spelling"))
+
+    # Abbreviations resolve only when every expansion with those initials is one spelling group
+    # ("NY" stays put next to both "New York" and "North Yorkshire")
+    spelling_labels = np.arange(n)
+    if accepted:
+        edges = np.array([(a, b) for a, b, _, _ in accepted])
+        graph = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+        _, spelling_labels = connected_components(graph, directed=False)
+    expansion_groups: Dict[str, set] = {}
+    for k, acronym in enumerate(initials):
+        if acronym:
+            expansion_groups.setdefault(acronym, set()).add(int(spelling_labels[k]))
+    for a, b in abbreviations:
+        long = b if initials[b] == distinct_keys[a] else a
+        if len(expansion_groups[initials[long]]) == 1:
+            accepted.append((a, b, 1.0, "abbreviation"))
+
+    # Group: same key, or an accepted pair with the group's most frequent spelling
+    if accepted:
+        edges = np.array([(a, b) for a, b, _, _ in accepted])
+        graph = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+    else:
+        labels = np.arange(n)
+    linked = {}
+    for a, b, score, reason in accepted:
+        linked[(a, b)] = linked[(b, a)] = (score, reason)
+
+    groups: Dict[int, List[int]] = {}
+    for k in range(n):
+        groups.setdefault(int(labels[k]), []).append(k)
+    spellings: Dict[int, List[int]] = {}
+    for r, k in enumerate(key_codes.tolist()):
+        spellings.setdefault(k, []).append(r)
+    mappings = []
+    for members in groups.values():
+        if len(members) == 1 and len(spellings[members[0]]) == 1:
+            continue
+        center = max(members, key=lambda k: (key_totals[k], -len(distinct_keys[k])))
+        # Avoid chaining (Jon -> John -> Joan): keep keys linked directly to the center
+        members = [k for k in members if k == center or (k, center) in linked]
+        rows = np.array(sorted(r for k in members for r in spellings[k]))
+        if len(rows) < 2:
+            continue
+        canonical = raw[rows[np.argmax(np.where(key_codes[rows] == center, raw_counts[rows], -1))]]
+        variants = [
+            {"value": raw[r], "count": int(raw_counts[r]),
+             "similarity": 1.0 if key_codes[r] == center else round(float(linked[(key_codes[r], center)][0]), 3),
+             "reason": "case/spacing" if key_codes[r] == center else linked[(key_codes[r], center)][1]}
+            for r in rows if raw[r] != canonical
+        ]
+        mappings.append({
+            "canonical": canonical,
+            "count": int(raw_counts[rows].sum()),
+            "variants": variants,
+            "affected": int(sum(variant["count"] for variant in variants))
+        })
+    mappings.sort(key=lambda mapping: -mapping["affected"])
+    return {
+        "mappings": mappings[:CATEGORY_MAX_MAPPINGS],
+        "mapping_count": len(mappings),
+        "affected": int(sum(mapping["affected"] for mapping in mappings)),
+        "distinct_before": int(len(raw)),
+        "distinct_after": int(len(raw) - sum(len(mapping["variants"]) for mapping in mappings)),
+        "candidate_pairs": int(candidate_count),
+        "seconds": time.perf_counter() - started
+    }
+
+def build_basic_cleaning_analysis(data: List[List[Any]], profiling_options: Dict[str, Any],
+                                  profile: Optional[DatasetProfile] = None) -> Dict[str, Any]:
+    """Deterministic per-column types, stats and issues for /api/data-cleaning"""
+    headers = data[0]
+    data_rows = data[1:]
+    profile, profiling = profile_for_analysis(data, profiling_options, profile)
+    column_types = profile.column_types()
+    # Sampled counts are scaled up to the full sheet
+    scale = len(data_rows) / max(profile.row_count, 1)
+    approximate = profiling["mode"] == "sample"
+    
+    # Perform basic data analysis for each column
+    basic_analysis = []
+    
+    for col_idx, header in enumerate(headers):
+        # Calculate basic metrics
+        total_values = len(data_rows)
+        missing_values = int(round(profile.missing[col_idx] * scale))
+        non_empty_count = total_values - missing_values
         
-        # Extract fields from parsed JSON
-        data = body.get("data", [])
-        retry_feedback = body.get("retry_feedback")
+        if not non_empty_count:
+            basic_analysis.append({
+                "index": col_idx,
+                "name": header or f"Column {col_idx + 1}",
+                "type": "unknown",
+                "confidence": 0,
+                "stats": {
+                    "total": total_values,
+                    "missing": missing_values,
+                    "unique": 0
+                },
+                "issues": [
+                    {
+                        "type": "empty_column",
+                        "description": "Column contains no data",
+                        "severity": "high"
+                    }
+                ]
+            })
+            continue
         
-        # Validate data
-        if not isinstance(data, list) or len(data) < 2:
-            return {"error": "Insufficient data for analysis. Need at least headers and one data row."}
+        unique_values = int(profile.unique[col_idx])
+        if approximate and "unique_ratio" in profiling["columns"][col_idx]:
+            unique_values = profiling["columns"][col_idx]["unique_ratio"]["distinct"]
+        numeric_count = int(round(profile.numeric_count[col_idx] * scale))
+        inferred = column_types[col_idx]
+        col_type = inferred["type"]
+        type_confidence = inferred["confidence"]
         
-        headers = data[0]
-        data_rows = data[1:]
+        # Collect stats for this column
+        stats = {
+            "total": total_values,
+            "missing": missing_values,
+            "unique": unique_values
+        }
         
-        # Perform basic data analysis for each column
-        basic_analysis = []
+        # Add numeric stats if applicable
+        if col_type == "numeric" and numeric_count:
+            numeric_stats = profile.numeric_stats(col_idx)
+            stats.update({key: numeric_stats[key] for key in ("min", "max", "mean", "median")})
+        elif col_type == "date":
+            stats.update({key: inferred[key] for key in ("date_format", "earliest", "latest")})
+        if col_type in ("categorical", "boolean"):
+            stats["most_common"] = profile.sketch(col_idx).most_common()
+        if approximate:
+            # Counts are estimates; min and max (and unique, outside categorical/text columns) only reflect the sampled rows
+            stats["approximate"] = True
         
-        for col_idx, header in enumerate(headers):
-            # Extract column values
-            column_values = [row[col_idx] if col_idx < len(row) else None for row in data_rows]
-            
-            # Calculate basic metrics
-            total_values = len(column_values)
-            missing_values = sum(1 for val in column_values if val is None or val == '')
-            non_empty_values = [val for val in column_values if val is not None and val != '']
-            
-            if not non_empty_values:
-                basic_analysis.append({
-                    "index": col_idx,
-                    "name": header or f"Column {col_idx + 1}",
-                    "type": "unknown",
-                    "confidence": 0,
-                    "stats": {
-                        "total": total_values,
-                        "missing": missing_values,
-                        "unique": 0
-                    },
-                    "issues": [
-                        {
-                            "type": "empty_column",
-                            "description": "Column contains no data",
-                            "severity": "high"
-                        }
-                    ]
-                })
-                continue
-            
-            # Count unique values
-            unique_values = len(set(non_empty_values))
-            
-            # Attempt to detect column type
-            numeric_values = []
-            date_values = 0
-            
-            # Check for numeric values
-            for val in non_empty_values:
-                try:
-                    num_val = float(str(val).replace(',', ''))
-                    numeric_values.append(num_val)
-                except (ValueError, TypeError):
-                    pass
-            
-            # Check for date patterns
-            date_pattern = re.compile(r'^\d{1,4}[-/\.]\d{1,2}[-/\.]\d{1,4}$')
-            date_values = sum(1 for val in non_empty_values if date_pattern.match(str(val)))
-            
-            # Determine column type
-            col_type = "text"
-            type_confidence = 0.5
-            
-            if len(numeric_values) / len(non_empty_values) > 0.7:
-                col_type = "numeric"
-                type_confidence = len(numeric_values) / len(non_empty_values)
-            elif date_values / len(non_empty_values) > 0.7:
-                col_type = "date"
-                type_confidence = date_values / len(non_empty_values)
-            elif unique_values / len(non_empty_values) < 0.3:
-                col_type = "categorical"
-                type_confidence = 0.8
-            
-            # Collect stats for this column
-            stats = {
-                "total": total_values,
-                "missing": missing_values,
-                "unique": unique_values
-            }
-            
-            # Add numeric stats if applicable
-            if col_type == "numeric" and numeric_values:
-                stats.update({
-                    "min": min(numeric_values),
-                    "max": max(numeric_values),
-                    "mean": sum(numeric_values) / len(numeric_values),
-                    "median": sorted(numeric_values)[len(numeric_values) // 2]
-                })
-            
-            # Detect basic issues
-            issues = []
-            
-            # Check for missing values
-            if missing_values > 0:
-                severity = "high" if missing_values > total_values * 0.2 else "medium"
-                issues.append({
-                    "type": "missing_values",
-                    "count": missing_values,
-                    "description": f"{missing_values} missing values detected",
-                    "severity": severity
-                })
-            
-            # Check for type mismatches in numeric columns
-            if col_type == "numeric" and len(numeric_values) < len(non_empty_values):
-                non_numeric_count = len(non_empty_values) - len(numeric_values)
-                issues.append({
-                    "type": "type_mismatch",
-                    "count": non_numeric_count,
-                    "description": f"{non_numeric_count} non-numeric values found",
-                    "severity": "high"
-                })
-            
-            basic_analysis.append({
-                "index": col_idx,
-                "name": header or f"Column {col_idx + 1}",
-                "type": col_type,
-                "confidence": type_confidence,
-                "stats": stats,
-                "issues": issues
+        # Detect basic issues
+        issues = []
+        
+        # Check for missing values
+        if missing_values > 0:
+            severity = "high" if missing_values > total_values * 0.2 else "medium"
+            issues.append({
+                "type": "missing_values",
+                "count": missing_values,
+                "description": f"{missing_values} missing values detected",
+                "severity": severity
             })
         
-        # Skip AI enhancement if there's an issue with OpenAI API
-        try_ai_enhancement = True
+        # Check for type mismatches in numeric columns
+        if col_type == "numeric" and numeric_count < non_empty_count:
+            non_numeric_count = non_empty_count - numeric_count
+            issues.append({
+                "type": "type_mismatch",
+                "count": non_numeric_count,
+                "description": f"{non_numeric_count} non-numeric values found",
+                "severity": "high"
+            })
+
+        # Check for spelling variants of the same category
+        normalization = None
+        if col_type in ("categorical", "text") and unique_values > 1:
+            # Distinct values and their counts straight from the dictionary encoding (text cells only)
+            codes, categories = profile.encoded(col_idx)
+            text_codes = codes[profile.present[:, col_idx] & ~profile.is_numeric[:, col_idx]]
+            counts = pd.Series(np.bincount(text_codes, minlength=len(categories)), index=categories)
+            lengths = np.fromiter((len(value) for value in categories), dtype=np.int64, count=len(categories))
+            if len(text_codes) and (lengths * counts.to_numpy()).sum() / len(text_codes) <= CATEGORY_MAX_MEAN_LENGTH:
+                normalization = normalize_categorical_values(counts)
+                if normalization["mappings"]:
+                    affected = int(round(normalization["affected"] * scale))
+                    issues.append({
+                        "type": "inconsistent_categories",
+                        "count": affected,
+                        "description": f"{affected} values are spelling variants of {normalization['mapping_count']} categories",
+                        "severity": "medium"
+                    })
         
-        if try_ai_enhancement:
-            try:
-                # Create prompt for AI enhancement
-                sample_rows = min(10, len(data_rows))
-                sample_data = data_rows[:sample_rows]
-                
-                ai_prompt = f"""
+        basic_analysis.append({
+            "index": col_idx,
+            "name": header or f"Column {col_idx + 1}",
+            "type": col_type,
+            "confidence": type_confidence,
+            "type_scores": inferred["scores"],
+            "stats": stats,
+            "issues": issues
+        })
+        if normalization is not None:
+            basic_analysis[-1]["normalization"] = normalization
+
+    # Duplicates need every row: a sampled profile only covers some, so hash the whole sheet
+    # (exact matches only; MinHash over every row would cost more than the sampled profile saved)
+    if profiling["mode"] == "exact":
+        duplicates = find_duplicate_rows(profile)
+    else:
+        duplicates = {**find_sheet_duplicate_rows(data, {"near": False}), "near_skipped": True}
+
+    return {"columns": basic_analysis, "profiling": profiling, "duplicates": duplicates}
+
+def build_cleaning_prompt(headers: List[Any], sample_rows: List[List[Any]], basic_analysis: List[Dict[str, Any]],
+                          retry_feedback: Optional[str]) -> str:
+    return f"""
 I'm analyzing a spreadsheet with the following columns:
 {', '.join(headers)}
 
-Here's a sample of the data (first {sample_rows} rows):
-{json.dumps(sample_data)}
+Here's a sample of the data (first {len(sample_rows)} rows):
+{json.dumps(sample_rows)}
 
 For each column, I've done some basic analysis:
 {json.dumps(basic_analysis, indent=2)}
@@ -1328,127 +4262,537 @@ Format your response as JSON with the following structure:
   ]
 }}
 """
-                # Call OpenAI API with error handling
-                try:
-                    ai_response = openai.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[{"role": "user", "content": ai_prompt}],
-                        temperature=0.2,
-                        max_tokens=2000
-                    )
-                    
-                    ai_content = ai_response.choices[0].message.content
-                    
-                    # Log what we received
-                    print(f"Received AI response (first 100 chars): {ai_content[:100]}...")
-                    
-                    # Try to parse the AI response
-                    try:
-                        ai_result = json.loads(ai_content)
-                    except json.JSONDecodeError as json_error:
-                        print(f"Failed to parse OpenAI response as JSON: {json_error}")
-                        print(f"Raw response content: {ai_content[:200]}...")
-                        
-                        # Fall back to a simple analysis without AI enhancement
-                        ai_result = {"columns": []}
-                        
-                except Exception as openai_error:
-                    print(f"Error calling OpenAI API: {str(openai_error)}")
-                    # Fall back to a simple analysis
-                    ai_result = {"columns": []}
-                
-                # Merge AI recommendations with basic analysis (if any)
-                for col in basic_analysis:
-                    ai_col = next((c for c in ai_result.get("columns", []) if c.get("index") == col["index"]), None)
-                    
-                    if ai_col:
-                        # Update the column type if AI provided a refined type
-                        if "refinedType" in ai_col and ai_col["refinedType"]:
-                            col["type"] = ai_col["refinedType"]
-                        
-                        # Add AI-detected issues
-                        if "additionalIssues" in ai_col and ai_col["additionalIssues"]:
-                            col["issues"].extend(ai_col["additionalIssues"])
+
+async def request_cleaning_enrichment(headers: List[Any], sample_rows: List[List[Any]],
+                                      basic_analysis: List[Dict[str, Any]],
+                                      retry_feedback: Optional[str]) -> Dict[str, Any]:
+    """Ask the LLM for refined types and extra issues; an unparseable answer yields no columns"""
+    ai_response = await llm_client.complete(
+        model="gpt-4o",
+        messages=[{"role": "user", "content": build_cleaning_prompt(headers, sample_rows, basic_analysis, retry_feedback)}],
+        temperature=0.2,
+        max_tokens=2000
+    )
+    
+    ai_content = ai_response["content"]
+    
+    # Log what we received
+    print(f"Received AI response (first 100 chars): {ai_content[:100]}...")
+    
+    # Try to parse the AI response
+    try:
+        return json.loads(ai_content)
+    except json.JSONDecodeError as json_error:
+        print(f"Failed to parse OpenAI response as JSON: {json_error}")
+        print(f"Raw response content: {ai_content[:200]}...")
+        
+        # Fall back to a simple analysis without AI enhancement
+        return {"columns": []}
+
+def merge_cleaning_enrichment(basic_analysis: List[Dict[str, Any]], ai_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Copy of the basic analysis with AI refined types and additional issues merged in"""
+    columns = copy.deepcopy(basic_analysis)
+    for col in columns:
+        ai_col = next((c for c in ai_result.get("columns", []) if c.get("index") == col["index"]), None)
+        
+        if ai_col:
+            # Update the column type if AI provided a refined type
+            if "refinedType" in ai_col and ai_col["refinedType"]:
+                col["type"] = ai_col["refinedType"]
             
-            except Exception as ai_error:
-                print(f"Error during AI enhancement: {str(ai_error)}")
-                # Continue with basic analysis only
-        
-        # Generate cleaning suggestions
-        suggestions = []
-        for column in basic_analysis:
-            if column["issues"]:
-                for issue in column["issues"]:
-                    # Generate action based on issue type
-                    action = {}
-                    
-                    if issue["type"] == "missing_values":
-                        if column["type"] == "numeric" and "mean" in column["stats"]:
-                            action = {
-                                "type": "fill_missing",
-                                "value": column["stats"]["mean"],
-                                "description": f"Fill missing values with mean ({column['stats']['mean']:.2f})"
-                            }
-                        elif column["type"] == "categorical":
-                            # Find most common value (not implemented here, would require additional analysis)
-                            action = {
-                                "type": "fill_missing",
-                                "value": "MOST_COMMON",  # Placeholder
-                                "description": "Fill missing values with most common value"
-                            }
-                        else:
-                            action = {
-                                "type": "remove_rows",
-                                "description": "Remove rows with missing values"
-                            }
-                    elif issue["type"] == "type_mismatch":
+            # Add AI-detected issues
+            if "additionalIssues" in ai_col and ai_col["additionalIssues"]:
+                col["issues"].extend(ai_col["additionalIssues"])
+    return columns
+
+def build_cleaning_response(basic_analysis: List[Dict[str, Any]], profiling: Dict[str, Any],
+                            duplicates: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Columns plus cleaning suggestions and summary counts"""
+    # Generate cleaning suggestions
+    suggestions = []
+    for column in basic_analysis:
+        if column["issues"]:
+            for issue in column["issues"]:
+                # Generate action based on issue type
+                action = {}
+            
+                if issue["type"] == "missing_values":
+                    if column["type"] == "numeric" and "mean" in column["stats"]:
                         action = {
-                            "type": "convert_type",
-                            "description": f"Convert values to {column['type']} format or replace with null"
+                            "type": "fill_missing",
+                            "value": column["stats"]["mean"],
+                            "description": f"Fill missing values with mean ({column['stats']['mean']:.2f})"
                         }
-                    
-                    # Add recommendation from AI if available
-                    recommendation = issue.get("recommendation", "")
-                    
-                    if action:
-                        suggestions.append({
-                            "column_index": column["index"],
-                            "column_name": column["name"],
-                            "issue_type": issue["type"],
-                            "action": action,
-                            "recommendation": recommendation,
-                            "severity": issue.get("severity", "medium")
-                        })
+                    elif column["type"] in ("categorical", "boolean") and column["stats"].get("most_common") is not None:
+                        most_common = column["stats"]["most_common"]
+                        action = {
+                            "type": "fill_missing",
+                            "value": most_common,
+                            "description": f"Fill missing values with most common value ({most_common})"
+                        }
+                    else:
+                        action = {
+                            "type": "remove_rows",
+                            "description": "Remove rows with missing values"
+                        }
+                elif issue["type"] == "type_mismatch":
+                    action = {
+                        "type": "convert_type",
+                        "description": f"Convert values to {column['type']} format or replace with null"
+                    }
+                elif issue["type"] == "inconsistent_categories" and column.get("normalization"):
+                    mappings = column["normalization"]["mappings"]
+                    action = {
+                        "type": "normalize_values",
+                        "mapping": {variant["value"]: mapping["canonical"] for mapping in mappings for variant in mapping["variants"]},
+                        "description": f"Merge spelling variants into {len(mappings)} canonical values"
+                    }
+            
+                # Add recommendation from AI if available
+                recommendation = issue.get("recommendation", "")
+            
+                if action:
+                    suggestions.append({
+                        "column_index": column["index"],
+                        "column_name": column["name"],
+                        "issue_type": issue["type"],
+                        "action": action,
+                        "recommendation": recommendation,
+                        "severity": issue.get("severity", "medium")
+                    })
+
+    # Row-level duplicate suggestions
+    duplicates = duplicates or {}
+    if duplicates.get("duplicate_row_count"):
+        count = duplicates["duplicate_row_count"]
+        suggestions.append({
+            "column_index": None,
+            "column_name": None,
+            "issue_type": "duplicate_rows",
+            "action": {
+                # No row list: applying recomputes the exact duplicates on the stored sheet
+                "type": "remove_duplicates",
+                "match": "exact",
+                "count": count,
+                "description": f"Remove {count} duplicate rows (keeping the first of each of {duplicates['exact_group_count']} groups)"
+            },
+            "recommendation": "",
+            "severity": "high" if count > 0.05 * max(duplicates.get("row_count", 0), 1) else "medium"
+        })
+    if duplicates.get("near_groups"):
+        rows = sorted(row for group in duplicates["near_groups"] for row in group["rows"][1:])
+        suggestions.append({
+            "column_index": None,
+            "column_name": None,
+            "issue_type": "near_duplicate_rows",
+            "action": {
+                "type": "remove_duplicates",
+                "match": "near",
+                "rows": rows,
+                "description": f"Review {duplicates['near_group_count']} groups of near-duplicate rows; removing keeps the first of each"
+            },
+            "recommendation": "",
+            "severity": "low"
+        })
+
+    # Generate summary statistics
+    columns_with_issues = sum(1 for col in basic_analysis if col["issues"])
+    total_issues = sum(len(col["issues"]) for col in basic_analysis)
+    critical_issues = sum(
+        1 for col in basic_analysis 
+        for issue in col["issues"] 
+        if issue.get("severity") == "high"
+    )
+
+    summary = {
+        "totalColumns": len(basic_analysis),
+        "columnsWithIssues": columns_with_issues,
+        "cleanColumns": len(basic_analysis) - columns_with_issues,
+        "totalIssues": total_issues,
+        "criticalIssues": critical_issues,
+        "duplicateRows": duplicates.get("duplicate_row_count", 0),
+        "nearDuplicateGroups": "skipped" if duplicates.get("near_skipped") else duplicates.get("near_group_count", 0)
+    }
+
+    return {
+        "columns": basic_analysis,
+        "suggestions": suggestions,
+        "summary": summary,
+        "profiling": profiling,
+        "duplicates": duplicates
+    }
+
+def _prune_cleaning_jobs():
+    """Drop expired finished jobs, then the oldest finished ones while over the cap; running jobs stay"""
+    now = time.time()
+    excess = len(_cleaning_jobs) - CLEANING_JOB_MAX_ENTRIES + 1  # room for the job being added
+    for job_id, job in list(_cleaning_jobs.items()):
+        if job["completed_at"] is None:
+            continue
+        if excess > 0 or job["completed_at"] + CLEANING_JOB_TTL <= now:
+            del _cleaning_jobs[job_id]
+            excess -= 1
+
+def start_cleaning_enrichment_job(headers: List[Any], sample_rows: List[List[Any]], basic: Dict[str, Any],
+                                  retry_feedback: Optional[str]) -> Dict[str, Any]:
+    """Run the LLM enrichment in the background; the job holds the enriched response when done"""
+    _prune_cleaning_jobs()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "pending",
+        "created_at": time.time(),
+        "completed_at": None,
+        "error": None,
+        "result": None,
+        "done": asyncio.Event()
+    }
+
+    async def run():
+        job["status"] = "running"
+        try:
+            ai_result = await request_cleaning_enrichment(headers, sample_rows, basic["columns"], retry_feedback)
+            job["result"] = build_cleaning_response(merge_cleaning_enrichment(basic["columns"], ai_result),
+                                                    basic["profiling"], basic["duplicates"])
+            job["status"] = "completed"
+        except Exception as e:
+            print(f"Error during AI enhancement job {job['job_id']}: {str(e)}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            job["completed_at"] = time.time()
+            job["done"].set()
+
+    job["task"] = asyncio.create_task(run())
+    _cleaning_jobs[job["job_id"]] = job
+    return job
+
+def cleaning_job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: job[key] for key in ("job_id", "status", "created_at", "completed_at", "error", "result")}
+
+async def run_cleaning_analysis(data: List[List[Any]], profiling_options: Optional[Dict[str, Any]] = None,
+                                ai_mode: str = "background", retry_feedback: Optional[str] = None,
+                                profile: Optional[DatasetProfile] = None) -> Dict[str, Any]:
+    """Cleaning analysis for a parsed sheet: the service behind /api/data-cleaning.
+
+    A `profile` already built for this sheet (exact, with its content hash) is reused
+    instead of hashing and profiling the rows again. Invalid input raises ValueError.
+    """
+    profiling_options = profiling_options or parse_profiling_options(None)
+    if ai_mode not in CLEANING_AI_MODES:
+        raise ValueError(f"ai_mode must be one of {', '.join(CLEANING_AI_MODES)}")
+
+    # Validate data
+    if not isinstance(data, list) or len(data) < 2:
+        raise ValueError("Insufficient data for analysis. Need at least headers and one data row.")
+
+    headers = data[0]
+    sample_rows = data[1:11]
+
+    dataset_id = await asyncio.to_thread(register_dataset, data, profile.hash if profile is not None else None)
+    cache_key = (dataset_id, json.dumps(profiling_options, sort_keys=True))
+    basic = cleaning_analysis_cache.get(cache_key)
+    analysis_cached = basic is not None
+    if basic is None:
+        basic = await asyncio.to_thread(build_basic_cleaning_analysis, data, profiling_options, profile)
+        cleaning_analysis_cache.set(cache_key, basic, len(json.dumps(basic, default=str)))
+
+    columns = basic["columns"]
+    enrichment = None
+    if ai_mode == "inline":
+        try:
+            ai_result = await request_cleaning_enrichment(headers, sample_rows, columns, retry_feedback)
+            columns = merge_cleaning_enrichment(columns, ai_result)
+            enrichment = {"status": "completed"}
+        except Exception as ai_error:
+            print(f"Error during AI enhancement: {str(ai_error)}")
+            # Continue with basic analysis only, and say so
+            enrichment = {"status": "failed", "error": str(ai_error)}
+
+    response = build_cleaning_response(copy.deepcopy(columns), basic["profiling"], basic["duplicates"])
+    response["analysis_cached"] = analysis_cached
+    response["dataset_id"] = dataset_id
+    if enrichment is not None:
+        response["ai_enrichment"] = enrichment
+    if ai_mode == "background":
+        job = start_cleaning_enrichment_job(headers, sample_rows, basic, retry_feedback)
+        response["ai_enrichment"] = {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/api/data-cleaning/jobs/{job['job_id']}",
+            "events_url": f"/api/data-cleaning/jobs/{job['job_id']}/events"
+        }
+    return response
+
+@app.post("/api/data-cleaning")
+async def analyze_data_for_cleaning(request: Request):
+    """
+    Analyzes spreadsheet data and suggests cleaning operations using AI.
+
+    The deterministic analysis is cached by data hash, so retries with new
+    `retry_feedback` only repeat the LLM step. With `ai_mode` "background" (the default)
+    the basic analysis is returned at once and the AI-enriched result is available from
+    /api/data-cleaning/jobs/{job_id} or its events stream; "inline" waits for it and "off"
+    skips it.
+    """
+    try:
+        # Get raw request body
+        body_bytes = await request.body()
         
-        # Generate summary statistics
-        columns_with_issues = sum(1 for col in basic_analysis if col["issues"])
-        total_issues = sum(len(col["issues"]) for col in basic_analysis)
-        critical_issues = sum(
-            1 for col in basic_analysis 
-            for issue in col["issues"] 
-            if issue.get("severity") == "high"
-        )
+        # Convert bytes to string and parse JSON manually
+        body_str = body_bytes.decode('utf-8')
         
-        summary = {
-            "totalColumns": len(basic_analysis),
-            "columnsWithIssues": columns_with_issues,
-            "cleanColumns": len(basic_analysis) - columns_with_issues,
-            "totalIssues": total_issues,
-            "criticalIssues": critical_issues
-        }
+        if not body_str:
+            return {"error": "Empty request body"}
         
-        return {
-            "columns": basic_analysis,
-            "suggestions": suggestions,
-            "summary": summary
-        }
+        print(f"Received request body: {body_str[:100]}...")
         
+        try:
+            body = json.loads(body_str)
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error: {e}")
+            return {"error": f"Invalid JSON: {str(e)}"}
+        
+        # Extract fields from parsed JSON
+        return await run_cleaning_analysis(
+            body.get("data", []),
+            profiling_options=parse_profiling_options(body.get("profiling")),
+            ai_mode=body.get("ai_mode", "background"),
+            retry_feedback=body.get("retry_feedback")
+        )
+    except ValueError as e:
+        return {"error": str(e)}
     except Exception as e:
         print(f"Error in data cleaning analysis: {str(e)}")
         import traceback
         traceback.print_exc()
         return {"error": str(e)}
 
+@app.get("/api/data-cleaning/jobs/{job_id}")
+async def get_cleaning_job(job_id: str):
+    """Status of an AI enrichment job; `result` holds the enriched analysis once completed"""
+    job = _cleaning_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return cleaning_job_status(job)
+
+@app.get("/api/data-cleaning/jobs/{job_id}/events")
+async def stream_cleaning_job(job_id: str):
+    """Server-sent events for an AI enrichment job: `status` now, then `completed` or `failed`"""
+    job = _cleaning_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+
+    async def events():
+        yield sse_event("status", {"job_id": job_id, "status": job["status"]})
+        while not job["done"].is_set():
+            try:
+                await asyncio.wait_for(job["done"].wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+        yield sse_event(job["status"], cleaning_job_status(job))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Sheets sent to /api/data-cleaning are kept briefly so /api/data-cleaning/apply can refer
+# to them by id instead of receiving the data again.
+dataset_store = TTLCache(
+    max_entries=int(os.getenv("DATASET_STORE_MAX_ENTRIES", "32")),
+    max_bytes=int(os.getenv("DATASET_STORE_MAX_BYTES", str(512 * 1024 * 1024))),
+    ttl=float(os.getenv("DATASET_STORE_TTL", "3600"))
+)
+CLEANING_OUTPUT_MODES = ("diff", "columnar", "rows")
+
+def register_dataset(data: List[List[Any]], dataset_id: Optional[str] = None) -> str:
+    """Store a sheet under its content hash (computed unless known) and return it as the dataset id"""
+    dataset_id = dataset_id or sheet_hash(data)
+    if dataset_store.get(dataset_id) is None:
+        # Rough size: a pointer plus a small boxed value per cell
+        dataset_store.set(dataset_id, data, len(data) * max(len(data[0]), 1) * 64)
+    return dataset_id
+
+def _missing_mask(column: np.ndarray) -> np.ndarray:
+    return pd.isna(column) | (column == '')
+
+def _convert_column(column: np.ndarray, target_type: str) -> np.ndarray:
+    """Convert one column to a type; values that don't convert become ''"""
+    present = ~_missing_mask(column)
+    converted = column.copy()
+    if target_type == "numeric":
+        numbers = DatasetProfile._coerce_numeric(column, present)
+        ok = ~np.isnan(numbers)
+        converted[ok] = numbers[ok]
+        converted[present & ~ok] = ''
+    elif target_type == "date":
+        strings = pd.Series(column[present]).astype(str).str.strip()
+        date_format, _ = infer_date_format(strings)
+        parsed = pd.to_datetime(strings, format=date_format, errors="coerce") if date_format else \
+            pd.to_datetime(strings, errors="coerce", format="mixed")
+        converted[present] = np.where(parsed.notna(), parsed.dt.strftime("%Y-%m-%d").to_numpy(dtype=object), '')
+    elif target_type == "boolean":
+        lowered = pd.Series(column[present]).astype(str).str.strip().str.lower()
+        mapped = lowered.map({"true": True, "yes": True, "y": True, "t": True, "1": True,
+                              "false": False, "no": False, "n": False, "f": False, "0": False})
+        converted[present] = mapped.astype(object).where(mapped.notna(), '').to_numpy()
+    elif target_type in ("text", "categorical"):
+        converted[present] = pd.Series(column[present]).astype(str).str.strip().to_numpy(dtype=object)
+    else:
+        raise ValueError(f"Cannot convert to type: {target_type}")
+    return converted
+
+def apply_cleaning_actions(data: List[List[Any]], actions: List[Dict[str, Any]]) -> Tuple[np.ndarray, Dict[int, np.ndarray], np.ndarray, List[Dict[str, Any]]]:
+    """Apply cleaning actions column-wise.
+
+    The shared profile's cell matrix is never modified: a column is copied the first time
+    an action writes to it, and row removals only build a keep-mask. Returns the original
+    cells, the replaced columns, the keep-mask and a timing/effect record per action.
+    """
+    profile = profile_sheet(data)
+    cells = profile.cells
+    columns: Dict[int, np.ndarray] = {}
+    keep = np.ones(profile.row_count, dtype=bool)
+    column_types = None
+    applied = []
+
+    for position, suggestion in enumerate(actions):
+        started = time.perf_counter()
+        action = suggestion.get("action", suggestion)
+        if not isinstance(action, dict):
+            raise ValueError(f"Action {position} must be an object")
+        action_type = action.get("type")
+        col_idx = suggestion.get("column_index", suggestion.get("columnIndex"))
+        record = {"action": position, "type": action_type, "column_index": col_idx}
+        if action_type == "remove_duplicates":
+            # Row numbers are sheet-indexed (header = row 0); without them, drop exact duplicates
+            rows = action.get("rows")
+            if rows is None:
+                rows = find_duplicate_rows(profile, {"max_groups": 0, "max_rows": None, "near": False})["duplicate_rows"]
+            try:
+                indices = np.asarray(rows, dtype=np.int64).reshape(-1) - 1
+            except (TypeError, ValueError):
+                raise ValueError(f"Action {position} rows must be a list of row numbers")
+            indices = indices[(indices >= 0) & (indices < profile.row_count)]
+            removed = np.zeros(profile.row_count, dtype=bool)
+            removed[indices] = True
+            removed &= keep
+            keep &= ~removed
+            record["rows_removed"] = int(removed.sum())
+            record["seconds"] = time.perf_counter() - started
+            applied.append(record)
+            continue
+        if not isinstance(col_idx, (int, str)) or not 0 <= int(col_idx) < profile.column_count:
+            raise ValueError(f"Action {position} has no valid column_index")
+        col_idx = int(col_idx)
+        column = columns.get(col_idx, cells[:, col_idx])
+
+        if action_type == "fill_missing":
+            mask = _missing_mask(column) & keep
+            value = action.get("value")
+            strategy = action.get("strategy")
+            if strategy in ("mean", "median"):
+                value = float(getattr(profile, strategy)[col_idx])
+            elif strategy == "most_common" or value == "MOST_COMMON":
+                value = profile.sketch(col_idx).most_common()
+            if col_idx not in columns:
+                column = columns[col_idx] = column.copy()
+            column[mask] = value
+            record["cells_changed"] = int(mask.sum())
+        elif action_type == "convert_type":
+            if column_types is None:
+                column_types = profile.column_types()
+            target_type = action.get("target_type") or suggestion.get("columnType") or column_types[col_idx]["type"]
+            converted = _convert_column(column, target_type)
+            record["target_type"] = target_type
+            record["cells_changed"] = int(((converted != column) & keep).sum())
+            columns[col_idx] = converted
+        elif action_type == "normalize_values":
+            mapping = action.get("mapping") or {}
+            as_text = pd.Series(column, dtype=object).astype(str)
+            mask = as_text.isin(list(mapping)).to_numpy() & ~_missing_mask(column)
+            if col_idx not in columns:
+                column = columns[col_idx] = column.copy()
+            column[mask] = as_text[mask].map(mapping).to_numpy(dtype=object)
+            record["cells_changed"] = int((mask & keep).sum())
+        elif action_type == "remove_rows":
+            removed = _missing_mask(column) & keep
+            keep &= ~removed
+            record["rows_removed"] = int(removed.sum())
+        else:
+            record["skipped"] = True
+
+        record["seconds"] = time.perf_counter() - started
+        applied.append(record)
+
+    return cells, columns, keep, applied
+
+def _cell_values(column: np.ndarray) -> List[Any]:
+    return [json_safe(value) for value in column.tolist()]
+
+@app.post("/api/data-cleaning/apply")
+async def apply_data_cleaning(request: Request):
+    """
+    Applies cleaning actions (the suggestions from /api/data-cleaning) on the server.
+
+    The sheet comes inline as `data` or by `dataset_id` from a previous analysis. `output`
+    selects the response: "diff" (default; changed cells per column plus removed rows,
+    indexed like `data` with the header as row 0), "columnar" (headers and one list per
+    column) or "rows" (a full sheet like the input).
+    """
+    body = await request.json()
+    data = body.get("data")
+    if data is None and body.get("dataset_id"):
+        data = dataset_store.get(body["dataset_id"])
+        if data is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired dataset_id; send the data inline")
+    if not isinstance(data, list) or len(data) < 2:
+        raise HTTPException(status_code=400, detail="Insufficient data. Need at least headers and one data row.")
+    actions = body.get("actions") or []
+    if not isinstance(actions, list) or not all(isinstance(action, dict) for action in actions):
+        raise HTTPException(status_code=400, detail="actions must be a list of objects")
+    output = body.get("output", "diff")
+    if output not in CLEANING_OUTPUT_MODES:
+        raise HTTPException(status_code=400, detail=f"output must be one of {', '.join(CLEANING_OUTPUT_MODES)}")
+
+    try:
+        started = time.perf_counter()
+        cells, columns, keep, applied = await asyncio.to_thread(apply_cleaning_actions, data, actions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = data[0]
+    result = {
+        "actions": applied,
+        "rows_in": int(len(keep)),
+        "rows_out": int(keep.sum()),
+        "output": output
+    }
+    if output == "diff":
+        changes = []
+        for col_idx, column in sorted(columns.items()):
+            changed = np.flatnonzero((column != cells[:, col_idx]) & keep)
+            if len(changed):
+                changes.append({
+                    "column_index": col_idx,
+                    "rows": (changed + 1).tolist(),
+                    "values": _cell_values(column[changed])
+                })
+        result["changes"] = changes
+        result["removed_rows"] = (np.flatnonzero(~keep) + 1).tolist()
+    else:
+        output_columns = [
+            _cell_values(columns.get(col_idx, cells[:, col_idx])[keep]) for col_idx in range(len(headers))
+        ]
+        if output == "columnar":
+            result["headers"] = headers
+            result["columns"] = output_columns
+        else:
+            result["data"] = [headers] + [list(row) for row in zip(*output_columns)] if output_columns else [headers]
+    result["seconds"] = time.perf_counter() - started
+    return result
+
 @app.post("/api/echo")
 async def echo_data(request: Request):
     """Simple endpoint to echo back the received data for testing"""
@@ -1501,146 +4845,121 @@ async def debug_request(request: Request):
     except Exception as e:
         return {"error": str(e)}
 
-# First, let's create a helper function to handle request data
-async def process_request_data(data: dict, endpoint_func) -> dict:
-    """Helper function to process request data through an endpoint function"""
-    try:
-        # Create a mock request object with the data
-        class MockReceive:
-            async def __call__(self):
-                return {
-                    "type": "http.request",
-                    "body": json.dumps(data).encode(),
-                    "more_body": False
-                }
-
-        # Check if we're trying to call the ask_ai function
-        if endpoint_func == ask_ai:
-            try:
-                # Direct call to OpenAI API instead of using the mock request
-                query = data.get("query")
-                spreadsheet_data = data.get("data")
-
-                if not query or not spreadsheet_data:
-                    return {"error": "Missing query or spreadsheet data"}
+# Anomaly detection for the data quality report section
+ANOMALY_DEFAULTS = {
+    "methods": ["mad", "iqr"],   # univariate methods, each linear in the row count
+    "multivariate": None,        # None, "isolation_forest" or "lof"
+    "mad_threshold": 3.5,        # |robust z| above this is flagged
+    "iqr_multiplier": 1.5,       # Tukey fences
+    "max_rows_per_column": 100   # flagged rows listed per column (highest scores first)
+}
+ANOMALY_CHUNK_CELLS = 4_000_000       # numeric cells processed per column block
+ANOMALY_MULTIVARIATE_FIT_ROWS = 20000  # rows sampled to fit the multivariate model
+ANOMALY_MIN_VALUES = 8
 
-                headers = spreadsheet_data[0] if spreadsheet_data and len(spreadsheet_data) > 0 else []
+def _top_flagged(rows: np.ndarray, scores: np.ndarray, limit: int) -> Dict[str, Any]:
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return {
+        "count": int(len(rows)),
+        "rows": (rows[order] + 1).tolist(),  # indexed like the sheet, header = row 0
+        "scores": [round(float(score), 4) for score in scores[order]]
+    }
 
-                column_stats = {}
-                for col_idx, header in enumerate(headers):
-                    try:
-                        values = [row[col_idx] for row in spreadsheet_data[1:] if col_idx < len(row) and row[col_idx] != '']
-                        if not values:
-                            continue
-                        numeric_values = []
-                        for val in values:
-                            try:
-                                num_val = float(str(val).replace(',', ''))
-                                numeric_values.append(num_val)
-                            except (ValueError, TypeError):
-                                pass
-
-                        stats = {
-                            "count": len(values),
-                            "unique": len(set(values)),
-                            "missing": len(spreadsheet_data[1:]) - len(values)
-                        }
+def detect_anomalies(profile: DatasetProfile, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Flag unusual values in every mostly-numeric column.
 
-                        if numeric_values:
-                            stats.update({
-                                "min": min(numeric_values),
-                                "max": max(numeric_values),
-                                "mean": sum(numeric_values) / len(numeric_values),
-                                "median": sorted(numeric_values)[len(numeric_values)//2],
-                                "std": np.std(numeric_values) if len(numeric_values) > 1 else 0
-                            })
+    Robust z-scores (median/MAD) and IQR fences are computed for blocks of columns at a
+    time with nan-aware numpy reductions, so the univariate pass is linear in the number
+    of cells. The optional multivariate pass fits an IsolationForest or LOF model on a
+    row sample (using all cores) and scores every complete row.
+    """
+    options = {**ANOMALY_DEFAULTS, **(options or {})}
+    limit = int(options["max_rows_per_column"])
+    columns = [
+        j for j in range(profile.column_count)
+        if profile.numeric_count[j] >= ANOMALY_MIN_VALUES
+        and profile.numeric_count[j] / max(profile.count[j], 1) > TYPE_MATCH_THRESHOLD
+    ]
+    result = {"columns": [], "methods": list(options["methods"]), "multivariate": None}
+    if not columns:
+        return result
 
-                        column_stats[header] = stats
+    block_size = max(1, ANOMALY_CHUNK_CELLS // max(profile.row_count, 1))
+    thresholds = {"mad": float(options["mad_threshold"]), "iqr": 0.0}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for start in range(0, len(columns), block_size):
+            block = columns[start:start + block_size]
+            X = profile.numeric[:, block]
+            X = np.where(np.isfinite(X), X, np.nan)
+            flags = {}
+            if "mad" in options["methods"]:
+                median = np.nanmedian(X, axis=0)
+                mad = np.nanmedian(np.abs(X - median), axis=0)
+                # Columns with MAD 0 (mostly constant) fall back to the mean absolute deviation
+                fallback = np.nanmean(np.abs(X - median), axis=0) * 1.2533
+                scale = np.where(mad > 0, mad / 0.6745, fallback)
+                flags["mad"] = np.abs(X - median) / scale
+                flags["mad"][:, ~(scale > 0)] = 0
+            if "iqr" in options["methods"]:
+                q1, q3 = np.nanpercentile(X, [25, 75], axis=0)
+                iqr = q3 - q1
+                low, high = q1 - options["iqr_multiplier"] * iqr, q3 + options["iqr_multiplier"] * iqr
+                outside = np.maximum(low - X, X - high)
+                flags["iqr"] = np.where(outside > 0, outside / np.where(iqr > 0, iqr, 1), 0)
 
-                    except Exception as e:
-                        print(f"Error processing column {header}: {str(e)}")
+            for b, col_idx in enumerate(block):
+                column = {"column": profile.headers[col_idx], "column_index": col_idx}
+                for method in ("mad", "iqr"):
+                    if method not in flags:
                         continue
+                    scores = np.nan_to_num(flags[method][:, b])
+                    rows = np.flatnonzero(scores > thresholds[method])
+                    column[method] = _top_flagged(rows, scores[rows], limit)
+                result["columns"].append(column)
 
-                correlations = {}
-                numeric_columns = {h: [] for h, s in column_stats.items() if "mean" in s}
-
-                if len(numeric_columns) >= 2:
-                    for col_idx, header in enumerate(headers):
-                        if header in numeric_columns:
-                            try:
-                                values = [float(row[col_idx]) for row in spreadsheet_data[1:] 
-                                         if col_idx < len(row) and row[col_idx] != '']
-                                numeric_columns[header] = values
-                            except:
-                                continue
-
-                    for col1 in numeric_columns:
-                        correlations[col1] = {}
-                        for col2 in numeric_columns:
-                            if col1 != col2:
-                                try:
-                                    corr, _ = pearsonr(numeric_columns[col1], numeric_columns[col2])
-                                    correlations[col1][col2] = corr
-                                except:
-                                    correlations[col1][col2] = None
-
-                prompt = f"""
-Here is a comprehensive analysis of a dataset with {len(spreadsheet_data)} rows and {len(headers)} columns.
-
-Column Statistics:
-{json.dumps(column_stats, indent=2)}
-
-Correlations between numeric columns:
-{json.dumps(correlations, indent=2)}
+    if options["multivariate"]:
+        result["multivariate"] = _detect_multivariate_anomalies(profile, columns, options["multivariate"], limit)
+    return result
 
-User's question: {query}
+def _detect_multivariate_anomalies(profile: DatasetProfile, columns: List[int], method: str,
+                                   limit: int) -> Dict[str, Any]:
+    from sklearn.ensemble import IsolationForest
+    from sklearn.neighbors import LocalOutlierFactor
 
-Please analyze the data using these comprehensive statistics to provide a detailed answer.
-If the question requires specific data points, explain that you're using statistical summaries of the entire dataset.
-If the answer involves identifying trends or patterns, use the correlation analysis and statistical summaries.
-If you need more specific data to answer accurately, explain what additional information would be helpful.
-"""
-                try:
-                    response = openai.chat.completions.create(
-                        model="gpt-4",
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                    return {"answer": response.choices[0].message.content}
-                except Exception as openai_error:
-                    print(f"OpenAI API Error: {str(openai_error)}")
-                    return {"error": f"OpenAI API Error: {str(openai_error)}", "answer": "Could not generate AI insights due to an API error. Please try again later."}
-            
-            except Exception as e:
-                print(f"Error in direct OpenAI processing: {str(e)}")
-                return {"error": str(e), "answer": "Error processing AI request. Please try again with a different dataset."}
-        
-        # For all other endpoints, use the standard mock request approach
-        request = Request(
-            scope={
-                "type": "http",
-                "method": "POST",
-                "headers": []
-            },
-            receive=MockReceive()
-        )
-        
-        # Call the endpoint function
-        return await endpoint_func(request)
-    except Exception as e:
-        print(f"Error processing request: {str(e)}")
-        return {"error": str(e)}
+    if len(columns) < 2:
+        return {"method": method, "error": "Need at least 2 numeric columns"}
+    X = profile.numeric[:, columns]
+    complete = np.flatnonzero(np.isfinite(X).all(axis=1))
+    if len(complete) < ANOMALY_MIN_VALUES:
+        return {"method": method, "error": "Not enough complete rows"}
+    X = StandardScaler().fit_transform(X[complete])
+    rng = np.random.default_rng(0)
+    fit_rows = X if len(X) <= ANOMALY_MULTIVARIATE_FIT_ROWS else \
+        X[rng.choice(len(X), ANOMALY_MULTIVARIATE_FIT_ROWS, replace=False)]
+
+    if method == "isolation_forest":
+        model = IsolationForest(n_estimators=200, random_state=0, n_jobs=-1).fit(fit_rows)
+    elif method == "lof":
+        model = LocalOutlierFactor(n_neighbors=min(20, len(fit_rows) - 1), novelty=True, n_jobs=-1).fit(fit_rows)
+    else:
+        raise ValueError(f"Unsupported multivariate anomaly method: {method}")
+    # Higher score = more anomalous; decision_function < 0 marks predicted outliers
+    decision = model.decision_function(X)
+    rows = np.flatnonzero(decision < 0)
+    return {"method": method, "columns": [profile.headers[j] for j in columns], "rows_scored": int(len(X)),
+            **_top_flagged(complete[rows], -decision[rows], limit)}
 
 # Now update the analysis functions
-async def analyze_data_quality(sheet: SheetSelection) -> ReportSection:
+async def analyze_data_quality(sheet: SheetSelection, config: Optional[Dict[str, Any]] = None,
+                               profile: Optional[DatasetProfile] = None) -> ReportSection:
     """Analyze data quality for a sheet"""
+    config = config or {}
     try:
-        # Prepare the data for analysis
-        request_data = {
-            "data": sheet.data
-        }
-        
-        # Use the helper function to process the request
-        cleaning_analysis = await process_request_data(request_data, analyze_data_for_cleaning)
+        # Call the cleaning service directly with the report's profile
+        try:
+            cleaning_analysis = await run_cleaning_analysis(sheet.data, ai_mode="inline", profile=profile)
+        except ValueError as e:
+            cleaning_analysis = {"error": str(e)}
         
         if isinstance(cleaning_analysis, dict):
             if "error" in cleaning_analysis:
@@ -1651,14 +4970,32 @@ async def analyze_data_quality(sheet: SheetSelection) -> ReportSection:
                 )
             
             summary = cleaning_analysis.get("summary", {})
+            insights = [
+                f"Analyzed {len(sheet.data[0])} columns and {len(sheet.data)-1} rows",
+                f"Found {summary.get('totalIssues', 0)} data quality issues",
+                f"Identified {summary.get('criticalIssues', 0)} critical issues"
+            ]
+
+            if config.get("anomaly_detection", True):
+                profile = profile or await asyncio.to_thread(profile_sheet, sheet.data)
+                anomalies = await asyncio.to_thread(detect_anomalies, profile, {
+                    key: config[key] for key in ANOMALY_DEFAULTS if key in config
+                })
+                cleaning_analysis["anomalies"] = anomalies
+                flagged = [
+                    column for column in anomalies["columns"]
+                    if any(column.get(method, {}).get("count") for method in ("mad", "iqr"))
+                ]
+                if flagged:
+                    worst = max(flagged, key=lambda column: max(column.get(m, {}).get("count", 0) for m in ("mad", "iqr")))
+                    insights.append(f"Detected unusual values in {len(flagged)} numeric columns (most in {worst['column']})")
+                if anomalies["multivariate"] and anomalies["multivariate"].get("count"):
+                    insights.append(f"{anomalies['multivariate']['count']} rows look anomalous across columns combined")
+
             return ReportSection(
                 title="Data Quality Analysis",
                 content=cleaning_analysis,
-                insights=[
-                    f"Analyzed {len(sheet.data[0])} columns and {len(sheet.data)-1} rows",
-                    f"Found {summary.get('totalIssues', 0)} data quality issues",
-                    f"Identified {summary.get('criticalIssues', 0)} critical issues"
-                ]
+                insights=insights
             )
     except Exception as e:
         print(f"Error in data quality analysis: {str(e)}")
@@ -1668,66 +5005,79 @@ async def analyze_data_quality(sheet: SheetSelection) -> ReportSection:
             insights=["Data quality analysis failed"]
         )
 
-async def perform_ai_analysis(sheet: SheetSelection, config: Dict) -> ReportSection:
-    """Perform AI analysis on sheet data"""
+# Standard AI report sections: (config key, question, label used in error messages)
+AI_ANALYSIS_PROMPTS = [
+    ("trends", "What are the main trends in this data?", "analyzing trends"),
+    ("insights", "What are the key insights from this data?", "generating insights"),
+    ("recommendations", "What recommendations can you make based on this data?", "generating recommendations")
+]
+AI_SECTION_TIMEOUT = float(os.getenv("AI_SECTION_TIMEOUT", "90"))  # seconds per AI question in a report
+
+async def perform_ai_analysis(sheet: SheetSelection, config: Dict,
+                              profile: Optional[DatasetProfile] = None) -> ReportSection:
+    """Perform AI analysis on sheet data.
+
+    The sheet is profiled once and every enabled question (the standard trends, insights
+    and recommendations prompts plus any extra `questions`) is sent concurrently through
+    the shared LLM client. Questions that fail or time out are reported next to the
+    answers that did arrive.
+    """
     try:
+        questions = [(key, query, label) for key, query, label in AI_ANALYSIS_PROMPTS if config.get(key)]
+        questions += [
+            (f"question_{i + 1}", query, f"answering '{query}'")
+            for i, query in enumerate(config.get("questions") or [])
+        ]
+        if not questions:
+            return ReportSection(
+                title="AI Insights",
+                content={"insights_count": 0},
+                insights=["No AI insights generated"]
+            )
+
+        timeout = float(config.get("timeout") or AI_SECTION_TIMEOUT)
+        profile = profile_summary(profile) if profile is not None else \
+            await asyncio.to_thread(get_dataset_profile, sheet.data)
+
+        responses = await asyncio.gather(
+            *[asyncio.wait_for(answer_question(profile, query), timeout=timeout) for _, query, _ in questions],
+            return_exceptions=True
+        )
+
         insights = []
         error_messages = []
-        
-        # Generate different types of insights based on config
-        if config.get("trends"):
-            trend_data = {
-                "query": "What are the main trends in this data?",
-                "data": sheet.data
-            }
-            trend_response = await process_request_data(trend_data, ask_ai)
-            if isinstance(trend_response, dict):
-                if "answer" in trend_response:
-                    insights.append(trend_response["answer"])
-                elif "error" in trend_response:
-                    error_message = f"Error analyzing trends: {trend_response['error']}"
-                    error_messages.append(error_message)
-                    print(error_message)
-        
-        if config.get("insights"):
-            insight_data = {
-                "query": "What are the key insights from this data?",
-                "data": sheet.data
-            }
-            insight_response = await process_request_data(insight_data, ask_ai)
-            if isinstance(insight_response, dict):
-                if "answer" in insight_response:
-                    insights.append(insight_response["answer"])
-                elif "error" in insight_response:
-                    error_message = f"Error generating insights: {insight_response['error']}"
-                    error_messages.append(error_message)
-                    print(error_message)
-        
-        if config.get("recommendations"):
-            recommendations_data = {
-                "query": "What recommendations can you make based on this data?",
-                "data": sheet.data
-            }
-            recommendations_response = await process_request_data(recommendations_data, ask_ai)
-            if isinstance(recommendations_response, dict):
-                if "answer" in recommendations_response:
-                    insights.append(recommendations_response["answer"])
-                elif "error" in recommendations_response:
-                    error_message = f"Error generating recommendations: {recommendations_response['error']}"
-                    error_messages.append(error_message)
-                    print(error_message)
+        answered, failed, timed_out = [], [], []
+        for (key, _, label), response in zip(questions, responses):
+            if isinstance(response, asyncio.TimeoutError):
+                timed_out.append(key)
+                error_message = f"Timed out {label} after {timeout:g}s"
+            elif isinstance(response, BaseException):
+                failed.append(key)
+                error_message = f"Error {label}: {response}"
+            else:
+                answered.append(key)
+                insights.append(response["content"])
+                continue
+            error_messages.append(error_message)
+            print(error_message)
         
         if not insights and error_messages:
             # Return section with error information if all API calls failed
             return ReportSection(
                 title="AI Insights",
-                content={"error": "; ".join(error_messages), "insights_count": 0},
+                content={"error": "; ".join(error_messages), "insights_count": 0,
+                         "failed": failed, "timed_out": timed_out},
                 insights=["AI analysis could not be completed. Please check your OpenAI API key and try again."]
             )
         
+        content = {"insights_count": len(insights), "answered": answered}
+        if error_messages:
+            # Partial result: keep what arrived and say what is missing
+            content.update({"partial": True, "errors": error_messages, "failed": failed, "timed_out": timed_out})
+        
         return ReportSection(
             title="AI Insights",
-            content={"insights_count": len(insights)},
+            content=content,
             insights=insights if insights else ["No AI insights generated"]
         )
     except Exception as e:
@@ -1738,45 +5088,45 @@ async def perform_ai_analysis(sheet: SheetSelection, config: Dict) -> ReportSect
             insights=["AI analysis failed. Please check the API key configuration."]
         )
 
+def percent_change(start: float, end: float) -> Optional[float]:
+    """Percentage growth from start to end; None when it starts at zero"""
+    return float((end - start) / start * 100) if start else None
+
 # Add this new function to generate summary metrics
-def generate_summary_metrics(sheet: SheetSelection) -> Dict[str, Any]:
+def generate_summary_metrics(sheet: SheetSelection, profile: Optional[DatasetProfile] = None) -> Dict[str, Any]:
     try:
         metrics = {}
+        profile = profile or profile_sheet(sheet.data)
         
-        # Get numeric columns (excluding first column if it's labels)
-        numeric_cols = []
-        for col_idx in range(1, len(sheet.data[0])):
-            try:
-                [float(row[col_idx]) for row in sheet.data[1:]]
-                numeric_cols.append(col_idx)
-            except (ValueError, TypeError):
-                continue
+        # Get fully populated numeric columns (excluding first column if it's labels)
+        numeric_cols = [
+            col_idx for col_idx in range(1, profile.column_count)
+            if profile.all_numeric(col_idx) and not profile.missing[col_idx]
+        ]
         
         # Calculate key metrics for each numeric column
         for col_idx in numeric_cols:
-            col_name = sheet.data[0][col_idx]
-            values = [float(row[col_idx]) for row in sheet.data[1:]]
+            col_name = profile.headers[col_idx]
+            values = profile.numeric[:, col_idx]
             
             metrics[col_name] = {
-                "total": sum(values),
-                "average": sum(values) / len(values),
-                "min": min(values),
-                "max": max(values),
-                "growth": (values[-1] - values[0]) / values[0] * 100  # Percentage growth
+                "total": float(profile.sum[col_idx]),
+                "average": float(profile.mean[col_idx]),
+                "min": float(profile.min[col_idx]),
+                "max": float(profile.max[col_idx]),
+                "growth": percent_change(values[0], values[-1])
             }
         
         # If we have Sales and Expenses, calculate profit metrics
         if "Sales" in metrics and "Expenses" in metrics:
-            sales = [float(row[1]) for row in sheet.data[1:]]
-            expenses = [float(row[2]) for row in sheet.data[1:]]
-            profits = [s - e for s, e in zip(sales, expenses)]
+            profits = profile.numeric[:, profile.column_index("Sales")] - profile.numeric[:, profile.column_index("Expenses")]
             
             metrics["Profit"] = {
-                "total": sum(profits),
-                "average": sum(profits) / len(profits),
-                "min": min(profits),
-                "max": max(profits),
-                "growth": (profits[-1] - profits[0]) / profits[0] * 100
+                "total": float(profits.sum()),
+                "average": float(profits.mean()),
+                "min": float(profits.min()),
+                "max": float(profits.max()),
+                "growth": percent_change(profits[0], profits[-1])
             }
         
         return metrics
@@ -1784,68 +5134,352 @@ def generate_summary_metrics(sheet: SheetSelection) -> Dict[str, Any]:
         print(f"Error generating summary metrics: {str(e)}")
         return {}
 
+# Report tasks run concurrently up to this many at a time (across sheets and sections)
+REPORT_MAX_CONCURRENCY = max(1, int(os.getenv("REPORT_MAX_CONCURRENCY", "8")))
+
+# Set while a scheduled task runs; ProgressLog.append forwards updates to it
+_progress_listener: contextvars.ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = \
+    contextvars.ContextVar("progress_listener", default=None)
+
+# Progress events within one stage are published at most this often (the list keeps them all)
+PROGRESS_EVENT_MIN_INTERVAL = 0.25
+
+class ProgressLog(list):
+    """A section's progress_updates list that also reports updates as they are appended.
+
+    A new stage is always reported; repeated updates within a stage are throttled to one
+    per PROGRESS_EVENT_MIN_INTERVAL so a loop over many columns doesn't flood the stream.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._reported_stage = None
+        self._reported_at = 0.0
+
+    def append(self, update: Dict[str, Any]):
+        super().append(update)
+        listener = _progress_listener.get()
+        if listener is None:
+            return
+        now = time.monotonic()
+        stage = update.get("stage")
+        if stage == self._reported_stage and now - self._reported_at < PROGRESS_EVENT_MIN_INTERVAL:
+            return
+        self._reported_stage, self._reported_at = stage, now
+        listener(update)
+
+async def run_task_graph(graph: Dict[Any, Tuple[List[Any], Any]], max_concurrency: int,
+                         on_event: Optional[Callable[[str, Any, Dict[str, Any]], None]] = None
+                         ) -> Tuple[Dict[Any, Any], Dict[Any, float]]:
+    """Run async tasks as soon as their dependencies finish, at most `max_concurrency` at once.
+
+    `graph` maps a key to (dependency keys, async function); the function is called with
+    the dependencies' results in order. Dependencies must come earlier in the mapping,
+    which also rules out cycles. A task whose function or dependency raised gets that
+    exception as its result. `on_event(kind, key, data)` hears "started", "progress" and
+    "finished" for every task. Returns results and seconds per task, keyed like `graph`.
+    """
+    order = list(graph)
+    for position, key in enumerate(order):
+        unknown = [dep for dep in graph[key][0] if dep not in graph or order.index(dep) >= position]
+        if unknown:
+            raise ValueError(f"Task {key} depends on {unknown}, which must be defined before it")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks: Dict[Any, asyncio.Task] = {}
+    timings: Dict[Any, float] = {}
+    loop = asyncio.get_running_loop()
+    loop_thread = threading.get_ident()
+
+    def emit(kind, key, data):
+        if on_event is not None:
+            on_event(kind, key, data)
+
+    async def run(key):
+        deps, func = graph[key]
+        # Waiting on dependencies doesn't hold a slot
+        inputs = [await tasks[dep] for dep in deps]
+        async with semaphore:
+            started = time.perf_counter()
+            # Each task runs in its own context copy, so the listener is per task; sections
+            # that run on a worker thread (asyncio.to_thread copies the context) report
+            # back through the loop
+            def listener(update, key=key):
+                if threading.get_ident() == loop_thread:
+                    emit("progress", key, update)
+                else:
+                    loop.call_soon_threadsafe(emit, "progress", key, update)
+            _progress_listener.set(listener)
+            emit("started", key, {})
+            error = None
+            try:
+                return await func(*inputs)
+            except asyncio.CancelledError:
+                error = "cancelled"
+                raise
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                timings[key] = time.perf_counter() - started
+                emit("finished", key, {"seconds": round(timings[key], 4), "error": error})
+
+    for key in order:
+        tasks[key] = asyncio.create_task(run(key))
+    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return dict(zip(order, results)), timings
+
+# Section cache for incremental regeneration. A section is keyed by a hash of everything it
+# reads: the sheet's content hash, the section's config, the LLM provider and the code
+# version (a hash of this module, so any deploy invalidates old results).
+REPORT_SECTION_CACHE_DIR = os.getenv("REPORT_SECTION_CACHE_DIR",
+                                     os.path.join(tempfile.gettempdir(), "unifieddata-report-sections"))
+REPORT_SECTION_DISK_MAX_BYTES = int(os.getenv("REPORT_SECTION_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+REPORT_SECTION_TTL = float(os.getenv("REPORT_SECTION_TTL", str(7 * 24 * 3600)))
+
+def _module_code_version() -> str:
+    with open(os.path.abspath(__file__), "rb") as source:
+        return hashlib.blake2b(source.read(), digest_size=8).hexdigest()
+
+REPORT_CODE_VERSION = os.getenv("REPORT_CODE_VERSION") or _module_code_version()
+
+class SectionCache:
+    """Serialized report sections: an in-memory LRU in front of JSON files on disk.
+
+    Disk entries expire after `ttl`, and after each write the directory is trimmed to
+    `max_bytes` by deleting the least recently used files (reads touch the file). Disk
+    errors and unreadable entries only cost a cache miss. The directory and its files are
+    private to the server's user (0700/0600); a directory owned by anyone else is never
+    read or written, since its entries could have been planted.
+    """
+
+    def __init__(self, directory: str, memory: TTLCache, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.memory = memory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._directory_checked = False
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _ensure_directory(self):
+        """Create the cache directory as 0700, or check that an existing one is ours and private"""
+        if self._directory_checked:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if hasattr(os, "getuid"):
+            info = os.lstat(self.directory)
+            if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+                raise OSError(f"{self.directory} is not a directory owned by this user")
+            if stat.S_IMODE(info.st_mode) != 0o700:
+                os.chmod(self.directory, 0o700)
+        self._directory_checked = True
+
+    def get(self, key: str) -> Optional[ReportSection]:
+        text = self.memory.get(key)
+        if text is None:
+            path = self._path(key)
+            try:
+                self._ensure_directory()
+                if os.path.getmtime(path) + self.ttl < time.time():
+                    os.remove(path)
+                    return None
+                with open(path, "r", encoding="utf-8") as cached:
+                    text = cached.read()
+                os.utime(path)
+            except OSError:
+                return None
+            self.memory.set(key, text, len(text))
+        try:
+            return ReportSection(**json.loads(text))
+        except (ValueError, TypeError) as e:
+            # Truncated or stale-schema entry (JSONDecodeError and ValidationError are ValueErrors)
+            print(f"Discarding unreadable report section cache entry {key}: {str(e)}")
+            self.discard(key)
+            return None
+
+    def discard(self, key: str):
+        self.memory.discard(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def set(self, key: str, section: ReportSection):
+        text = json.dumps(json_safe(section.model_dump()), default=str)
+        self.memory.set(key, text, len(text))
+        try:
+            self._ensure_directory()
+            temporary = f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+            descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with open(descriptor, "w", encoding="utf-8") as cached:
+                cached.write(text)
+            os.replace(temporary, self._path(key))
+            self._trim()
+        except OSError as e:
+            print(f"Could not write report section cache entry {key}: {str(e)}")
+
+    def _trim(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    info = entry.stat()
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+report_section_cache = SectionCache(
+    REPORT_SECTION_CACHE_DIR,
+    TTLCache(
+        max_entries=int(os.getenv("REPORT_SECTION_CACHE_MAX_ENTRIES", "512")),
+        max_bytes=int(os.getenv("REPORT_SECTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=REPORT_SECTION_TTL
+    ),
+    REPORT_SECTION_DISK_MAX_BYTES,
+    REPORT_SECTION_TTL
+)
+
+def report_section_key(name: str, sheet_hash: str, section_config: Any) -> str:
+    return content_hash([REPORT_CODE_VERSION, LLM_PROVIDER, name, sheet_hash, section_config])
+
+def report_section_cacheable(section: ReportSection) -> bool:
+    """Only complete sections are stored; failed, partial or un-enriched ones are retried next time"""
+    content = section.content
+    if "error" in content or content.get("partial"):
+        return False
+    enrichment = content.get("ai_enrichment")
+    return not (isinstance(enrichment, dict) and enrichment.get("status") == "failed")
+
+def cached_report_section(name: str, section_config: Any, func: Callable, enabled: bool = True) -> Callable:
+    """Wrap a section task so an unchanged sheet and config reuse the stored section"""
+    async def run(profile: DatasetProfile) -> ReportSection:
+        key = report_section_key(name, profile.hash, section_config)
+        if enabled:
+            section = await asyncio.to_thread(report_section_cache.get, key)
+            if section is not None:
+                section.metrics = {**(section.metrics or {}), "cache": "reused"}
+                return section
+        section = await func(profile)
+        if report_section_cacheable(section):
+            await asyncio.to_thread(report_section_cache.set, key, section)
+        section.metrics = {**(section.metrics or {}), "cache": "computed"}
+        return section
+    return run
+
+def build_report_graph(request: ReportRequest) -> Tuple[Dict[Any, Tuple[List[Any], Any]], List[Tuple[Any, str]]]:
+    """(sheet, section) tasks for a report, and the section keys in report order.
+
+    Each sheet is profiled once; its summary metrics and every enabled section depend
+    only on that profile, so sections of one sheet and different sheets are independent.
+    """
+    config = request.config
+    graph: Dict[Any, Tuple[List[Any], Any]] = {}
+    section_keys = []
+    for position, sheet in enumerate(request.selected_sheets):
+        profile_key = (position, "profile")
+        graph[profile_key] = ([], lambda sheet=sheet: asyncio.to_thread(profile_sheet, sheet.data))
+        graph[(position, "metrics")] = ([profile_key], lambda profile, sheet=sheet: asyncio.to_thread(generate_summary_metrics, sheet, profile))
+
+        sections = []
+        # 1. Data Quality Analysis
+        if config.data_quality:
+            sections.append(("data_quality", "Data Quality Analysis", config.data_quality,
+                             lambda profile, sheet=sheet: analyze_data_quality(sheet, config.data_quality, profile)))
+        # 2. Statistical Analysis
+        if config.statistical_analysis:
+            sections.append(("statistical", "Statistical Analysis", config.statistical_analysis,
+                             lambda profile, sheet=sheet: perform_statistical_analysis(sheet, config.statistical_analysis, profile)))
+        # 3. Predictive Analysis
+        if config.predictive_analysis.get("regression") or config.predictive_analysis.get("forecast"):
+            sections.append(("predictive", "Predictive Analysis", config.predictive_analysis,
+                             lambda profile, sheet=sheet: perform_predictive_analysis(sheet, config.predictive_analysis)))
+        # 4. Generate Visualizations
+        if config.visualizations:
+            sections.append(("visualizations", "Visualizations", config.visualizations,
+                             lambda profile, sheet=sheet: generate_visualizations(sheet, config.visualizations, profile)))
+        # 5. AI Analysis
+        if config.ai_analysis:
+            sections.append(("ai", "AI Insights", config.ai_analysis,
+                             lambda profile, sheet=sheet: perform_ai_analysis(sheet, config.ai_analysis, profile)))
+        for name, title, section_config, func in sections:
+            graph[(position, name)] = ([profile_key], cached_report_section(name, section_config, func, request.reuse_sections))
+            section_keys.append(((position, name), title))
+    return graph, section_keys
+
+async def build_report(request: ReportRequest, report_id: Optional[str] = None,
+                       on_event: Optional[Callable[[str, Any, Dict[str, Any]], None]] = None) -> ReportResponse:
+    """Run the report's task graph and assemble the sections; shared by the sync and job APIs"""
+    report_sections = []
+    all_insights = []
+    summary_metrics = {}
+
+    # Run every (sheet, section) task as its inputs become ready
+    started = time.perf_counter()
+    graph, section_keys = build_report_graph(request)
+    results, timings = await run_task_graph(graph, REPORT_MAX_CONCURRENCY, on_event)
+
+    # Assemble in the fixed sheet/section order, whatever order tasks finished in
+    for position, sheet in enumerate(request.selected_sheets):
+        metrics = results[(position, "metrics")]
+        summary_metrics[sheet.sheet_name] = metrics if isinstance(metrics, dict) else {}
+    sections_reused, sections_computed = [], []
+    for key, title in section_keys:
+        section = results[key]
+        if isinstance(section, BaseException):
+            print(f"Error in report section {key}: {str(section)}")
+            section = ReportSection(title=title, content={"error": str(section)}, insights=[f"{title} failed"])
+        section.metrics = {**(section.metrics or {}), "seconds": round(timings.get(key, 0.0), 4)}
+        report_sections.append(section)
+        entry = {"sheet": request.selected_sheets[key[0]].sheet_name, "section": key[1]}
+        (sections_reused if section.metrics.get("cache") == "reused" else sections_computed).append(entry)
+        if key[1] == "ai":
+            all_insights.extend(section.insights or [])
+
+    # Create an executive summary section
+    executive_summary = create_executive_summary(summary_metrics, all_insights)
+    report_sections.insert(0, executive_summary)  # Add at the beginning
+
+    # Create the final report with enhanced summary
+    report = ReportResponse(
+        report_id=report_id or f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        title=request.title,
+        description=request.description,
+        created_at=datetime.now(),
+        sections=report_sections,
+        summary={
+            "metrics": summary_metrics,
+            "key_findings": all_insights[:3],
+            "section_count": len(report_sections),
+            "generated_at": datetime.now().isoformat(),
+            "status": "completed",
+            "sections_reused": sections_reused,
+            "sections_computed": sections_computed,
+            "schedule": {
+                "tasks": len(graph),
+                "max_concurrency": REPORT_MAX_CONCURRENCY,
+                "seconds": round(time.perf_counter() - started, 4),
+                "task_seconds": round(sum(timings.values()), 4)
+            }
+        }
+    )
+
+    return report
+
 # Update the main report generation endpoint
 @app.post("/api/reports/generate")
 async def generate_report(request: ReportRequest):
     try:
-        report_sections = []
-        all_insights = []
-        summary_metrics = {}
-        
-        # Process each selected sheet
-        for sheet in request.selected_sheets:
-            # Generate summary metrics
-            sheet_metrics = generate_summary_metrics(sheet)
-            summary_metrics[sheet.sheet_name] = sheet_metrics
-            
-            # 1. Data Quality Analysis
-            if request.config.data_quality:
-                quality_section = await analyze_data_quality(sheet)
-                report_sections.append(quality_section)
-            
-            # 2. Statistical Analysis
-            if request.config.statistical_analysis:
-                stats_section = await perform_statistical_analysis(sheet, request.config.statistical_analysis)
-                report_sections.append(stats_section)
-            
-            # 3. Predictive Analysis
-            if request.config.predictive_analysis.get("regression") or request.config.predictive_analysis.get("forecast"):
-                predictive_section = await perform_predictive_analysis(sheet, request.config.predictive_analysis)
-                report_sections.append(predictive_section)
-            
-            # 4. Generate Visualizations
-            if request.config.visualizations:
-                viz_section = await generate_visualizations(sheet, request.config.visualizations)
-                report_sections.append(viz_section)
-            
-            # 5. AI Analysis
-            if request.config.ai_analysis:
-                ai_section = await perform_ai_analysis(sheet, request.config.ai_analysis)
-                report_sections.append(ai_section)
-                all_insights.extend(ai_section.insights or [])
-
-        # Create an executive summary section
-        executive_summary = create_executive_summary(summary_metrics, all_insights)
-        report_sections.insert(0, executive_summary)  # Add at the beginning
-        
-        # Create the final report with enhanced summary
-        report = ReportResponse(
-            report_id=f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            title=request.title,
-            description=request.description,
-            created_at=datetime.now(),
-            sections=report_sections,
-            summary={
-                "metrics": summary_metrics,
-                "key_findings": all_insights[:3],
-                "section_count": len(report_sections),
-                "generated_at": datetime.now().isoformat(),
-                "status": "completed"
-            }
-        )
-        
-        return report
-        
+        return await build_report(request)
     except Exception as e:
         print(f"Error generating report: {str(e)}")
         return ReportResponse(
@@ -1859,6 +5493,227 @@ async def generate_report(request: ReportRequest):
             error=str(e)
         )
 
+# Report jobs: /api/reports/jobs queues a report and returns its id at once; a fixed set
+# of workers drains the bounded queue and progress is streamed over server-sent events.
+REPORT_JOB_QUEUE_SIZE = int(os.getenv("REPORT_JOB_QUEUE_SIZE", "16"))
+REPORT_JOB_WORKERS = max(1, int(os.getenv("REPORT_JOB_WORKERS", "2")))
+REPORT_JOB_TTL = 3600          # seconds a finished report job stays available
+REPORT_JOB_MAX_ENTRIES = 256
+REPORT_JOB_FINAL_STATES = ("completed", "failed", "cancelled")
+_report_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_report_queue: Optional[asyncio.Queue] = None
+_report_workers: List[asyncio.Task] = []
+_report_workers_stopping = False  # set by the shutdown hook, so workers tell it apart from a user cancel
+
+def _prune_report_jobs():
+    """Drop expired finished jobs, then the oldest finished ones while over the cap; live jobs stay"""
+    now = time.time()
+    excess = len(_report_jobs) - REPORT_JOB_MAX_ENTRIES + 1  # room for the job being added
+    for report_id, job in list(_report_jobs.items()):
+        if job["completed_at"] is None:
+            continue
+        if excess > 0 or job["completed_at"] + REPORT_JOB_TTL <= now:
+            del _report_jobs[report_id]
+            excess -= 1
+
+def _publish_report_event(job: Dict[str, Any], event: str, payload: Dict[str, Any]):
+    """Record an event for the job's streams and wake every listener"""
+    job["events"].append((event, {"report_id": job["report_id"], **payload}))
+    job["updated"].set()
+    job["updated"] = asyncio.Event()
+
+def _finish_report_job(job: Dict[str, Any], status: str, error: Optional[str] = None):
+    job["status"] = status
+    job["error"] = error
+    job["completed_at"] = time.time()
+    _publish_report_event(job, status, {"status": status, "error": error})
+    job["done"].set()
+
+def report_job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: job[key] for key in ("report_id", "status", "created_at", "started_at", "completed_at", "error", "progress")}
+
+async def _run_report_job(job: Dict[str, Any]):
+    request = job["request"]
+    graph, section_keys = build_report_graph(request)
+    titles = dict(section_keys)
+    total = len(graph)
+    finished = 0
+
+    def on_event(kind, key, data):
+        nonlocal finished
+        position, name = key
+        payload = {"sheet": request.selected_sheets[position].sheet_name, "task": name,
+                   "title": titles.get(key, name)}
+        if kind == "finished":
+            finished += 1
+            job["progress"] = round(100 * finished / total)
+            payload.update(data, progress=job["progress"])
+        elif kind == "progress":
+            payload["update"] = data
+        _publish_report_event(job, f"task_{kind}", payload)
+
+    job["result"] = await build_report(request, report_id=job["report_id"], on_event=on_event)
+
+async def _report_worker(queue: asyncio.Queue):
+    while True:
+        job = await queue.get()
+        try:
+            if job["status"] != "queued":
+                continue  # cancelled while waiting
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            _publish_report_event(job, "started", {"status": "running"})
+            job["task"] = asyncio.create_task(_run_report_job(job))
+            try:
+                await job["task"]
+                _finish_report_job(job, "completed")
+            except asyncio.CancelledError:
+                if _report_workers_stopping or not job["cancel_requested"]:
+                    # The worker itself is shutting down; end the job's streams before leaving
+                    job["task"].cancel()
+                    _finish_report_job(job, "cancelled", "Server shutting down")
+                    raise
+                _finish_report_job(job, "cancelled")
+            except Exception as e:
+                print(f"Error in report job {job['report_id']}: {str(e)}")
+                _finish_report_job(job, "failed", str(e))
+        finally:
+            queue.task_done()
+
+@app.on_event("shutdown")
+async def stop_report_workers():
+    """Cancel the report workers (and whatever report they are running) on shutdown"""
+    global _report_queue, _report_workers_stopping
+    _report_workers_stopping = True
+    workers = list(_report_workers)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    for job in _report_jobs.values():
+        if job["status"] not in REPORT_JOB_FINAL_STATES:
+            _finish_report_job(job, "cancelled", "Server shutting down")
+    _report_workers.clear()
+    _report_queue = None
+    _report_workers_stopping = False
+
+def _ensure_report_workers():
+    global _report_queue
+    if _report_queue is None:
+        _report_queue = asyncio.Queue(maxsize=REPORT_JOB_QUEUE_SIZE)
+    # A worker that died on an unexpected error is replaced rather than counted
+    _report_workers[:] = [worker for worker in _report_workers if not worker.done()]
+    while len(_report_workers) < REPORT_JOB_WORKERS:
+        _report_workers.append(asyncio.create_task(_report_worker(_report_queue)))
+
+@app.post("/api/reports/jobs", status_code=202)
+async def submit_report_job(request: ReportRequest):
+    """
+    Queues a report and returns its `report_id` immediately.
+
+    Progress is streamed from /api/reports/jobs/{report_id}/events, the finished report is
+    served by /api/reports/jobs/{report_id}/result, and a queued or running job can be
+    cancelled. When the queue is full the request is rejected with 429 and Retry-After.
+    """
+    _ensure_report_workers()
+    _prune_report_jobs()
+    report_id = f"report_{uuid.uuid4().hex}"
+    job = {
+        "report_id": report_id,
+        "request": request,
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "completed_at": None,
+        "error": None,
+        "progress": 0,
+        "result": None,
+        "task": None,
+        "cancel_requested": False,
+        "events": [],
+        "updated": asyncio.Event(),
+        "done": asyncio.Event()
+    }
+    try:
+        _report_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Report queue is full; retry later",
+                            headers={"Retry-After": "5"})
+    _report_jobs[report_id] = job
+    _publish_report_event(job, "queued", {"status": "queued", "queue_position": _report_queue.qsize()})
+    return {
+        "report_id": report_id,
+        "status": "queued",
+        "queue_position": _report_queue.qsize(),
+        "status_url": f"/api/reports/jobs/{report_id}",
+        "events_url": f"/api/reports/jobs/{report_id}/events",
+        "result_url": f"/api/reports/jobs/{report_id}/result"
+    }
+
+def _get_report_job(report_id: str) -> Dict[str, Any]:
+    job = _report_jobs.get(report_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired report id")
+    return job
+
+@app.get("/api/reports/jobs/{report_id}")
+async def get_report_job(report_id: str):
+    """Status and progress (percent of tasks finished) of a report job"""
+    return report_job_status(_get_report_job(report_id))
+
+@app.get("/api/reports/jobs/{report_id}/result")
+async def get_report_job_result(report_id: str):
+    """The finished report; 409 while the job is still queued or running"""
+    job = _get_report_job(report_id)
+    if job["status"] == "completed":
+        return job["result"]
+    if job["status"] in REPORT_JOB_FINAL_STATES:
+        raise HTTPException(status_code=409, detail=f"Report {job['status']}: {job['error'] or 'no result'}")
+    raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+
+@app.post("/api/reports/jobs/{report_id}/cancel")
+async def cancel_report_job(report_id: str):
+    """Cancel a queued or running report job"""
+    job = _get_report_job(report_id)
+    if job["status"] == "queued":
+        # The worker skips it when it reaches the front of the queue
+        _finish_report_job(job, "cancelled")
+    elif job["status"] == "running" and job["task"] is not None:
+        job["cancel_requested"] = True
+        job["task"].cancel()
+        await job["done"].wait()
+    return report_job_status(job)
+
+@app.get("/api/reports/jobs/{report_id}/events")
+async def stream_report_job(report_id: str):
+    """Server-sent events for a report job: every event so far, then new ones as they happen.
+
+    Events are `queued`, `started`, `task_started`, `task_progress` (a section's progress
+    update), `task_finished` (with overall percent) and finally `completed`, `failed` or
+    `cancelled`.
+    """
+    job = _get_report_job(report_id)
+
+    async def events():
+        sent = 0
+        while True:
+            updated = job["updated"]
+            while sent < len(job["events"]):
+                event, payload = job["events"][sent]
+                sent += 1
+                yield sse_event(event, payload)
+            if job["done"].is_set():
+                break
+            try:
+                await asyncio.wait_for(updated.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 def create_executive_summary(metrics: Dict[str, Dict], insights: List[str]) -> ReportSection:
     """Create an executive summary section"""
     try:
@@ -1869,9 +5724,10 @@ def create_executive_summary(metrics: Dict[str, Dict], insights: List[str]) -> R
                 profit_metrics = sheet_metrics["Profit"]
                 summary_points.extend([
                     f"Total Profit: ${profit_metrics['total']:,.2f}",
-                    f"Average Monthly Profit: ${profit_metrics['average']:,.2f}",
-                    f"Profit Growth: {profit_metrics['growth']:.1f}%"
+                    f"Average Monthly Profit: ${profit_metrics['average']:,.2f}"
                 ])
+                if profit_metrics["growth"] is not None:
+                    summary_points.append(f"Profit Growth: {profit_metrics['growth']:.1f}%")
         
         return ReportSection(
             title="Executive Summary",
@@ -1890,17 +5746,23 @@ def create_executive_summary(metrics: Dict[str, Dict], insights: List[str]) -> R
         )
 
 # Add this function to main.py
-async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> ReportSection:
-    """Perform statistical analysis on sheet data"""
+async def perform_statistical_analysis(sheet: SheetSelection, config: Dict,
+                                       profile: Optional[DatasetProfile] = None) -> ReportSection:
+    """Perform statistical analysis on sheet data, on a worker thread (it is all CPU work)"""
+    return await asyncio.to_thread(_perform_statistical_analysis, sheet, config, profile)
+
+def _perform_statistical_analysis(sheet: SheetSelection, config: Dict,
+                                  profile: Optional[DatasetProfile] = None) -> ReportSection:
     try:
         results = {}
         insights = []
         visualizations = []
-        progress_updates = []
+        progress_updates = ProgressLog()
+        stats = {}
 
-        # Get headers and data
-        headers = sheet.data[0]
-        data_rows = sheet.data[1:]  # Use all data rows, not just a sample
+        # Get headers and typed columns (all rows) from the shared profile
+        profile = profile or profile_sheet(sheet.data)
+        headers = profile.headers
 
         # Add initial progress update
         progress_updates.append({
@@ -1917,36 +5779,35 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
                 "message": "Calculating basic statistics..."
             })
 
-            stats = {}
             for col_idx, header in enumerate(headers):
-                try:
-                    # Update progress for each column
-                    progress = 20 + int((col_idx / len(headers)) * 30)
+                # Update progress as it advances a percent, not for every column of a wide sheet
+                progress = 20 + int((col_idx / len(headers)) * 30)
+                if progress != progress_updates[-1]["progress"]:
                     progress_updates.append({
                         "stage": "processing",
                         "progress": progress,
                         "message": f"Analyzing column: {header}"
                     })
 
-                    # Convert column values to float where possible
-                    values = [float(row[col_idx]) for row in data_rows if row[col_idx] != '']
-                    if values:
-                        stats[header] = {
-                            "count": len(values),
-                            "sum": sum(values),
-                            "mean": sum(values) / len(values),
-                            "min": min(values),
-                            "max": max(values),
-                            "std": np.std(values) if len(values) > 1 else 0,
-                            "median": np.median(values)
-                        }
-                        
-                        # Add insight for significant changes
-                        if len(values) > 1:
-                            change = ((values[-1] - values[0]) / values[0]) * 100
-                            insights.append(f"{header}: {change:+.1f}% change from start to end")
-                except (ValueError, TypeError):
+                # Only columns whose values are all numeric
+                if not profile.all_numeric(col_idx):
                     continue
+                stats[header] = {
+                    "count": int(profile.count[col_idx]),
+                    "sum": float(profile.sum[col_idx]),
+                    "mean": float(profile.mean[col_idx]),
+                    "min": float(profile.min[col_idx]),
+                    "max": float(profile.max[col_idx]),
+                    "std": float(profile.std[col_idx]),
+                    "median": float(profile.median[col_idx])
+                }
+                
+                # Add insight for significant changes
+                if profile.count[col_idx] > 1:
+                    values = profile.numeric_values(col_idx)
+                    change = percent_change(values[0], values[-1])
+                    if change is not None:
+                        insights.append(f"{header}: {change:+.1f}% change from start to end")
 
             results["basic_stats"] = stats
 
@@ -1959,20 +5820,16 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
             })
 
             try:
-                numeric_cols = {}
-                for col_idx, header in enumerate(headers):
-                    try:
-                        values = [float(row[col_idx]) for row in data_rows if row[col_idx] != '']
-                        if values:
-                            numeric_cols[header] = values
-                    except (ValueError, TypeError):
-                        continue
+                numeric_cols = {
+                    header: col_idx
+                    for col_idx, header in enumerate(headers) if profile.all_numeric(col_idx)
+                }
 
                 if len(numeric_cols) >= 2:
-                    correlation_data = {
-                        "data": [[value for value in numeric_cols[col]] for col in numeric_cols],
-                        "columns": list(numeric_cols.keys())
-                    }
+                    # Float columns straight from the profile (NaN where missing)
+                    correlation_frame = pd.DataFrame(
+                        profile.numeric[:, list(numeric_cols.values())], columns=list(numeric_cols.keys())
+                    )
                     
                     progress_updates.append({
                         "stage": "processing",
@@ -1980,18 +5837,16 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
                         "message": "Calculating correlation matrix..."
                     })
 
-                    correlation_result = await process_request_data(
-                        correlation_data,
-                        perform_correlation_analysis
-                    )
+                    correlation_result = json_safe(correlation_analysis(correlation_frame))
                     
-                    if correlation_result and "error" not in correlation_result:
+                    if correlation_result:
                         results["correlation"] = correlation_result
+                        matrix = correlation_result["correlation_matrix"]
                         
                         # Add correlation visualization
                         visualizations.append({
                             "type": "heatmap",
-                            "data": correlation_result.get("matrix", []),
+                            "data": [[matrix[col2][col1] for col2 in numeric_cols] for col1 in numeric_cols],
                             "config": {
                                 "labels": list(numeric_cols.keys())
                             },
@@ -2008,27 +5863,26 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
             "message": "Generating visualizations..."
         })
 
+        labels = profile.labels(0)
         for col_idx, header in enumerate(headers[1:], 1):  # Skip first column (usually labels)
-            try:
-                values = [float(row[col_idx]) for row in data_rows if row[col_idx] != '']
-                
-                # Line chart for trends
-                visualizations.append({
-                    "type": "line",
-                    "data": {
-                        "labels": [row[0] for row in data_rows],  # Use first column as labels
-                        "datasets": [{
-                            "label": header,
-                            "data": values,
-                            "borderColor": "rgba(75, 192, 192, 1)",
-                            "tension": 0.1
-                        }]
-                    },
-                    "title": f"{header} Trend"
-                })
-                
-            except (ValueError, TypeError):
+            if not profile.all_numeric(col_idx):
                 continue
+            values = profile.numeric_values(col_idx).tolist()
+            
+            # Line chart for trends
+            visualizations.append({
+                "type": "line",
+                "data": {
+                    "labels": labels,  # Use first column as labels
+                    "datasets": [{
+                        "label": header,
+                        "data": values,
+                        "borderColor": "rgba(75, 192, 192, 1)",
+                        "tension": 0.1
+                    }]
+                },
+                "title": f"{header} Trend"
+            })
 
         # Profit analysis if applicable
         if "Sales" in stats and "Expenses" in stats:
@@ -2039,25 +5893,29 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
             })
 
             try:
-                sales = [float(row[headers.index("Sales")]) for row in data_rows if row[headers.index("Sales")] != '']
-                expenses = [float(row[headers.index("Expenses")]) for row in data_rows if row[headers.index("Expenses")] != '']
-                profits = [s - e for s, e in zip(sales, expenses)]
+                sales_all = profile.numeric[:, profile.column_index("Sales")]
+                expenses_all = profile.numeric[:, profile.column_index("Expenses")]
+                # Rows where both are numbers, kept aligned
+                both = ~np.isnan(sales_all) & ~np.isnan(expenses_all)
+                sales = sales_all[both]
+                profits = sales - expenses_all[both]
+                labels = [label for label, keep in zip(labels, both) if keep]
                 
                 results["profit_analysis"] = {
-                    "total_profit": sum(profits),
-                    "average_profit": sum(profits) / len(profits),
-                    "profit_margin": (sum(profits) / sum(sales)) * 100
+                    "total_profit": float(profits.sum()),
+                    "average_profit": float(profits.mean()),
+                    "profit_margin": float(profits.sum() / sales.sum() * 100) if sales.sum() else None
                 }
                 
                 # Add profit visualization
                 visualizations.append({
                     "type": "bar",
                     "data": {
-                        "labels": [row[0] for row in data_rows],
+                        "labels": labels,
                         "datasets": [
                             {
                                 "label": "Profit",
-                                "data": profits,
+                                "data": profits.tolist(),
                                 "backgroundColor": "rgba(75, 192, 192, 0.5)"
                             }
                         ]
@@ -2065,9 +5923,10 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
                     "title": "Profit Analysis"
                 })
                 
-                insights.append(
-                    f"Average profit margin: {results['profit_analysis']['profit_margin']:.1f}%"
-                )
+                if results["profit_analysis"]["profit_margin"] is not None:
+                    insights.append(
+                        f"Average profit margin: {results['profit_analysis']['profit_margin']:.1f}%"
+                    )
                 
             except Exception as profit_error:
                 print(f"Profit analysis error: {str(profit_error)}")
@@ -2103,7 +5962,8 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
             content=results,
             visualizations=visualizations,
             insights=formatted_insights,
-            progress_updates=progress_updates
+            progress_updates=progress_updates,
+            metrics={"profiling": profile.build_info}
         )
         
     except Exception as e:
@@ -2119,27 +5979,26 @@ async def perform_statistical_analysis(sheet: SheetSelection, config: Dict) -> R
             }]
         )
 
-async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict]) -> ReportSection:
-    """Generate visualizations based on configuration for any dataset"""
+async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict],
+                                  profile: Optional[DatasetProfile] = None) -> ReportSection:
+    """Generate visualizations based on configuration for any dataset, on a worker thread"""
+    return await asyncio.to_thread(_generate_visualizations, sheet, viz_config, profile)
+
+def _generate_visualizations(sheet: SheetSelection, viz_config: List[Dict],
+                             profile: Optional[DatasetProfile] = None) -> ReportSection:
     try:
         visualizations = []
         insights = []
 
-        # Get headers and data
-        headers = sheet.data[0]
-        data_rows = sheet.data[1:]
+        # Every chart reads typed columns from the sheet's shared profile
+        profile = profile or profile_sheet(sheet.data)
+        headers = profile.headers
 
-        # Identify numeric columns
-        numeric_columns = []
-        for col_idx, header in enumerate(headers):
-            try:
-                # Check if at least 70% of values in the column are numeric
-                numeric_count = sum(1 for row in data_rows if isinstance(row[col_idx], (int, float)) 
-                                 or (isinstance(row[col_idx], str) and row[col_idx].replace('.','',1).isdigit()))
-                if numeric_count / len(data_rows) >= 0.7:
-                    numeric_columns.append((col_idx, header))
-            except:
-                continue
+        # Identify numeric columns: at least 70% of values in the column are numeric
+        numeric_columns = [
+            (col_idx, header) for col_idx, header in enumerate(headers)
+            if profile.row_count and profile.numeric_count[col_idx] / profile.row_count >= 0.7
+        ]
 
         # Get categorical columns (non-numeric)
         categorical_columns = [(i, h) for i, h in enumerate(headers) if (i, h) not in numeric_columns]
@@ -2153,7 +6012,7 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                     # If we have at least one numeric column and one categorical column
                     if numeric_columns and categorical_columns:
                         cat_idx, cat_header = categorical_columns[0]  # Use first categorical column for labels
-                        labels = [str(row[cat_idx]) for row in data_rows]
+                        labels = profile.labels(cat_idx)
                         
                         # Create datasets for up to 3 numeric columns
                         datasets = []
@@ -2161,8 +6020,7 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                                 "rgba(75, 192, 192, 0.5)"]
                         
                         for (num_idx, num_header), color in zip(numeric_columns[:3], colors):
-                            values = [float(row[num_idx]) if row[num_idx] not in ['', None] else 0 
-                                    for row in data_rows]
+                            values = profile.numeric_or_zero(num_idx).tolist()
                             datasets.append({
                                 "label": num_header,
                                 "data": values,
@@ -2191,15 +6049,14 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                     # Create line chart for numeric columns over time/sequence
                     if numeric_columns and categorical_columns:
                         cat_idx, cat_header = categorical_columns[0]
-                        labels = [str(row[cat_idx]) for row in data_rows]
+                        labels = profile.labels(cat_idx)
                         
                         datasets = []
                         colors = ["rgba(54, 162, 235, 1)", "rgba(255, 99, 132, 1)", 
                                 "rgba(75, 192, 192, 1)"]
                         
                         for (num_idx, num_header), color in zip(numeric_columns[:3], colors):
-                            values = [float(row[num_idx]) if row[num_idx] not in ['', None] else 0 
-                                    for row in data_rows]
+                            values = profile.numeric_or_zero(num_idx).tolist()
                             datasets.append({
                                 "label": num_header,
                                 "data": values,
@@ -2221,10 +6078,11 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                             for dataset in datasets:
                                 values = dataset["data"]
                                 if len(values) > 1:
-                                    change = ((values[-1] - values[0]) / values[0]) * 100
-                                    insights.append(
-                                        f"{dataset['label']} trend shows {change:+.1f}% change"
-                                    )
+                                    change = percent_change(values[0], values[-1])
+                                    if change is not None:
+                                        insights.append(
+                                            f"{dataset['label']} trend shows {change:+.1f}% change"
+                                        )
 
                 elif viz_type == "pie":
                     # Create pie chart for distribution of a single numeric column
@@ -2232,9 +6090,8 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                         cat_idx, cat_header = categorical_columns[0]
                         num_idx, num_header = numeric_columns[0]
                         
-                        labels = [str(row[cat_idx]) for row in data_rows]
-                        values = [float(row[num_idx]) if row[num_idx] not in ['', None] else 0 
-                                for row in data_rows]
+                        labels = profile.labels(cat_idx)
+                        values = profile.numeric_or_zero(num_idx).tolist()
 
                         visualizations.append({
                             "type": "pie",
@@ -2259,10 +6116,8 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
                         x_idx, x_header = numeric_columns[0]
                         y_idx, y_header = numeric_columns[1]
                         
-                        x_data = [float(row[x_idx]) if row[x_idx] not in ['', None] else 0 
-                                for row in data_rows]
-                        y_data = [float(row[y_idx]) if row[y_idx] not in ['', None] else 0 
-                                for row in data_rows]
+                        x_data = profile.numeric_or_zero(x_idx).tolist()
+                        y_data = profile.numeric_or_zero(y_idx).tolist()
 
                         visualizations.append({
                             "type": "scatter",
@@ -2283,7 +6138,8 @@ async def generate_visualizations(sheet: SheetSelection, viz_config: List[Dict])
             title="Visualizations",
             content={},
             visualizations=visualizations,
-            insights=insights
+            insights=insights,
+            metrics={"profiling": profile.build_info}
         )
 
     except Exception as e:
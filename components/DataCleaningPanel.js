@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import styles from '../styles/DataCleaning.module.css';
 import axios from 'axios';
 
@@ -23,6 +23,8 @@ const DataCleaningPanel = ({
   const [analysisStage, setAnalysisStage] = useState('initializing'); // 'initializing', 'scanning', 'processing', 'finalizing'
   const [currentColumn, setCurrentColumn] = useState('');
   const [progress, setProgress] = useState(0);
+  const [aiStatus, setAiStatus] = useState(null); // background AI enrichment: 'pending', 'running', 'completed', 'failed'
+  const enrichmentJob = useRef(null);
   
   // API service URL
   const API_URL = 'https://unifieddata-api-552541459765.us-central1.run.app';
@@ -34,8 +36,85 @@ const DataCleaningPanel = ({
     }
   }, [isOpen, sheetData]);
   
+  // Stop following the AI enrichment job when the panel closes or unmounts
+  useEffect(() => {
+    if (!isOpen) stopFollowingEnrichment();
+    return stopFollowingEnrichment;
+  }, [isOpen]);
+  
+  const stopFollowingEnrichment = () => {
+    const job = enrichmentJob.current;
+    if (!job) return;
+    if (job.source) job.source.close();
+    clearTimeout(job.timer);
+    enrichmentJob.current = null;
+  };
+  
+  // The AI-enriched analysis replaces the basic one; selections refer to the old list
+  const showEnrichedAnalysis = (status) => {
+    stopFollowingEnrichment();
+    setAiStatus(status.status);
+    if (status.status !== 'completed' || !status.result) return;
+    setAnalysisResults(status.result.columns || []);
+    setSuggestions(status.result.suggestions || []);
+    setSelectedSuggestions({});
+    setSummaryStats(status.result.summary || {});
+  };
+  
+  // The server returns the basic analysis at once and enriches it in a background job:
+  // listen on its event stream, or poll its status if the stream cannot be opened
+  const followEnrichment = (enrichment) => {
+    stopFollowingEnrichment();
+    if (!enrichment || !enrichment.status_url) {
+      setAiStatus(enrichment ? enrichment.status : null);
+      return;
+    }
+    setAiStatus(enrichment.status);
+    const job = {};
+    enrichmentJob.current = job;
+    
+    const poll = async () => {
+      try {
+        const response = await fetch(`${API_URL}${enrichment.status_url}`);
+        if (enrichmentJob.current !== job) return;
+        if (!response.ok) {
+          // Expired or unknown job: keep the basic analysis
+          showEnrichedAnalysis({ status: 'failed' });
+          return;
+        }
+        const status = await response.json();
+        if (enrichmentJob.current !== job) return;
+        if (status.status === 'completed' || status.status === 'failed') {
+          showEnrichedAnalysis(status);
+          return;
+        }
+        setAiStatus(status.status);
+      } catch (error) {
+        console.error("Error polling AI enrichment:", error);
+      }
+      if (enrichmentJob.current === job) job.timer = setTimeout(poll, 2000);
+    };
+    
+    if (typeof EventSource === 'undefined' || !enrichment.events_url) {
+      poll();
+      return;
+    }
+    const source = new EventSource(`${API_URL}${enrichment.events_url}`);
+    job.source = source;
+    const finish = (event) => showEnrichedAnalysis(JSON.parse(event.data));
+    source.addEventListener('completed', finish);
+    source.addEventListener('failed', finish);
+    source.onerror = () => {
+      source.close();
+      job.source = null;
+      if (enrichmentJob.current === job) poll();
+    };
+  };
+  
   // Function to analyze data
   const analyzeData = async (feedback = null) => {
+    stopFollowingEnrichment();
+    setAiStatus(null);
     setIsAnalyzing(true);
     setAnalysisStage('initializing');
     setProgress(0);
@@ -143,6 +222,7 @@ const DataCleaningPanel = ({
       setSuggestions(responseData.suggestions || []);
       setSelectedSuggestions({});
       setSummaryStats(responseData.summary || {});
+      followEnrichment(responseData.ai_enrichment);
       
       // Clear retry feedback
       setRetryFeedback('');
@@ -472,6 +552,12 @@ const DataCleaningPanel = ({
                       <div className={styles.statLabel}>Critical Issues</div>
                     </div>
                   </div>
+                  {(aiStatus === 'pending' || aiStatus === 'running') && (
+                    <p className={styles.aiStatusNote}>AI suggestions are still being generated and will appear here shortly...</p>
+                  )}
+                  {aiStatus === 'failed' && (
+                    <p className={styles.aiStatusNote}>AI suggestions are unavailable; showing the basic analysis.</p>
+                  )}
                 </div>
               )}
               